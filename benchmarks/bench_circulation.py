@@ -0,0 +1,62 @@
+"""
+Batch check-in versus the one-POST-per-item return path.
+
+    python benchmarks/bench_circulation.py [--items 200]
+"""
+import argparse
+from datetime import timedelta
+
+import common
+
+
+def lend(members, books, per_member):
+    from library.models import Borrow, Member
+    from django.db.models import F
+    from django.utils import timezone
+
+    due = timezone.now().date() - timedelta(days=3)  # overdue, so fines are charged
+    borrows = [
+        Borrow(book=books[(m * per_member + i) % len(books)], member=member, due_date=due)
+        for m, member in enumerate(members)
+        for i in range(per_member)
+    ]
+    Borrow.objects.bulk_create(borrows)
+    Member.objects.update(current_books_borrowed=F('current_books_borrowed') + per_member)
+    return borrows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--items', type=int, default=200)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import CaptureQueriesContext
+    from library import circulation
+
+    members = common.seed_members(1)
+    books = common.seed_books(50, copies=args.items)
+    client = Client()
+    client.force_login(members[0].user)
+
+    borrows = lend(members, books, args.items)
+    with CaptureQueriesContext(connection) as sequential_queries:
+        def sequential():
+            for borrow in borrows:
+                client.post(f'/return-book/{borrow.borrow_id}/', content_type='application/json')
+        sequential_time = common.timed(f'sequential return_book x{args.items}', sequential, repeat=1)
+
+    borrows = lend(members, books, args.items)
+    with CaptureQueriesContext(connection) as batch_queries:
+        def batch():
+            circulation.check_in([borrow.borrow_id for borrow in borrows])
+        batch_time = common.timed(f'batch check_in x{args.items}', batch, repeat=1)
+
+    print(f'queries: sequential={len(sequential_queries)} batch={len(batch_queries)}')
+    print(f'speedup: {sequential_time / batch_time:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
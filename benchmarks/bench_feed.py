@@ -0,0 +1,70 @@
+"""
+Availability sync: crawling catalog pages vs the JSON Lines feed.
+
+    python benchmarks/bench_feed.py [--books 50000] [--changed 200] [--crawl-pages 100]
+
+Times a crawl of the /books/ pages (a sample of them, extrapolated to the
+whole catalog), a full feed resync and a delta after `--changed` books change
+availability. Also prints the query plan of the
+delta query, which should be a range scan of the (updated_date, id) index.
+"""
+import argparse
+from datetime import timedelta
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=50000)
+    parser.add_argument('--changed', type=int, default=200)
+    parser.add_argument('--crawl-pages', type=int, default=100, help='Catalog pages actually fetched')
+    args = parser.parse_args()
+
+    common.setup()
+    from django.db import connection
+    from django.test import Client
+    from django.utils import timezone
+    from library import feed
+    from library.models import Book
+
+    common.seed_books(args.books)
+    Book.objects.update(updated_date=timezone.now() - timedelta(hours=1))
+    client = Client()
+
+    def fetch(cursor=''):
+        response = client.get('/feed/availability.jsonl', {'cursor': cursor, 'limit': feed.MAX_PAGE_SIZE})
+        return b''.join(response.streaming_content).splitlines()
+
+    def resync():
+        cursor, total = '', 0
+        while rows := fetch(cursor):
+            total += len(rows)
+            cursor = rows[-1].rsplit(b'"cursor":"', 1)[1].split(b'"')[0].decode()
+        return cursor, total
+
+    pages = -(-args.books // 12)
+    sample = min(args.crawl_pages, pages)
+    sampled = common.timed(f'crawl {sample} catalog pages', lambda: [
+        client.get('/books/', {'page': page}) for page in range(1, pages + 1, pages // sample)[:sample]
+    ], repeat=1)
+    print(f'{f"  all {pages} pages, extrapolated":<40} {sampled * pages / sample * 1000:10.2f} ms')
+    common.timed(f'feed full resync ({args.books} rows)', resync, repeat=1)
+    cursor, _ = resync()
+
+    changed = list(Book.objects.order_by('?').values_list('pk', flat=True)[:args.changed])
+    Book.objects.filter(pk__in=changed).update(
+        available_copies=0, updated_date=timezone.now() - timedelta(minutes=1)
+    )
+    common.timed(f'feed delta ({args.changed} rows)', lambda: fetch(cursor), repeat=3)
+    print(f'{"  delta rows":<40} {len(fetch(cursor)):>10}')
+
+    sql, params = feed.changes(cursor).query.sql_with_params()
+    with connection.cursor() as cursor_:
+        cursor_.execute(f'EXPLAIN QUERY PLAN {sql}' if connection.vendor == 'sqlite' else f'EXPLAIN {sql}', params)
+        for row in cursor_.fetchall():
+            print('  plan:', row[-1])
+
+
+if __name__ == '__main__':
+    main()
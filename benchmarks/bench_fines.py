@@ -0,0 +1,69 @@
+"""
+Pricing a whole overdue set: per-borrow evaluation vs one database query.
+
+    python benchmarks/bench_fines.py [--borrows 20000]
+
+Seeds overdue borrows across categories and member tiers, a few fine
+policies and closed days, then prices every borrow with the per-object
+evaluator (the old calculated_fine loop) and with fines.preview().
+"""
+import argparse
+from datetime import timedelta
+from decimal import Decimal
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--borrows', type=int, default=20000)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.db import connection
+    from django.utils import timezone
+    from library import fines
+    from library.models import Book, Borrow, Category, ClosedDay, FinePolicy, Member
+
+    categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(5)])
+    members = common.seed_members(1000)
+    tiers = [choice for choice, _ in Member.TIER_CHOICES]
+    for i, member in enumerate(members):
+        member.tier = tiers[i % len(tiers)]
+    Member.objects.bulk_update(members, ['tier'])
+    books = common.seed_books(500)
+    for i, book in enumerate(books):
+        book.category = categories[i % len(categories)]
+    Book.objects.bulk_update(books, ['category'])
+
+    today = timezone.now().date()
+    FinePolicy.objects.create(name='Students', member_tier='student', daily_rate=Decimal('0.50'),
+                              grace_days=2, max_fine=Decimal('10.00'), priority=10)
+    FinePolicy.objects.create(name='Reference', category=categories[0], daily_rate=Decimal('5.00'), priority=5)
+    FinePolicy.objects.create(name='Seniors', member_tier='senior', daily_rate=Decimal('1.00'), grace_days=3)
+    ClosedDay.objects.bulk_create([ClosedDay(date=today - timedelta(days=7 * week)) for week in range(10)])
+    Borrow.objects.bulk_create([
+        Borrow(book=books[i % len(books)], member=members[i % len(members)],
+               due_date=today - timedelta(days=1 + i % 60), status='overdue')
+        for i in range(args.borrows)
+    ], batch_size=2000)
+    print(f'seeded {args.borrows} overdue borrows')
+
+    overdue = Borrow.objects.filter(status='overdue')
+
+    def per_object():
+        return sum(borrow.calculated_fine for borrow in overdue.select_related('book', 'member'))
+
+    def in_database():
+        return sum(total for _, total in fines.preview(overdue).values())
+
+    for label, func in [('fines.preview()', in_database), ('per-borrow evaluate()', per_object)]:
+        queries = []
+        with connection.execute_wrapper(lambda execute, sql, *rest: queries.append(sql) or execute(sql, *rest)):
+            total = func()
+        common.timed(label, func, repeat=1)
+        print(f'{"  total / queries":<40} {total:>10} / {len(queries)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Bulk member onboarding: one-at-a-time creation vs import_members.
+
+    python benchmarks/bench_import_members.py [--members 200] [--workers N]
+
+Writes a roster with a password on every row, then creates the members the
+way registration does (create_user + Member.save, one ID allocation each)
+and with `manage.py import_members` using one hashing process and N.
+Password hashing dominates, so the pooled import scales with cores.
+"""
+import argparse
+import csv
+import io
+import os
+import tempfile
+from datetime import date, timedelta
+
+import common
+
+
+def write_roster(path, prefix, count):
+    with open(path, 'w', newline='') as roster:
+        writer = csv.writer(roster)
+        writer.writerow(['username', 'email', 'password', 'tier'])
+        for i in range(count):
+            writer.writerow([f'{prefix}{i}', f'{prefix}{i}@example.edu', f'secret-{i}', 'student'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.contrib.auth.models import User
+    from django.core.management import call_command
+    from library.models import Member
+
+    def one_at_a_time():
+        expiry = date.today() + timedelta(days=365)
+        for i in range(args.members):
+            user = User.objects.create_user(f'single{i}', f'single{i}@example.edu', f'secret-{i}')
+            Member.objects.create(user=user, phone='', address='', tier='student', membership_expiry=expiry)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        runs = [('create_user + Member.save', one_at_a_time)]
+        for workers in sorted({1, args.workers}):
+            path = os.path.join(tmp, f'roster{workers}.csv')
+            write_roster(path, f'pool{workers}-', args.members)
+            runs.append((f'import_members --workers {workers}', lambda path=path, workers=workers: call_command(
+                'import_members', path, '--workers', str(workers), '--chunk-size', '500', stdout=io.StringIO(),
+                stderr=io.StringIO()
+            )))
+        for label, func in runs:
+            common.timed(label, func, repeat=1)
+
+    print(f'{"members / distinct IDs":<40} {Member.objects.count():>10} / '
+          f'{Member.objects.values("member_id").distinct().count()}')
+
+
+if __name__ == '__main__':
+    main()
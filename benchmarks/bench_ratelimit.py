@@ -0,0 +1,50 @@
+"""
+Per-request overhead of the rate limiter.
+
+    python benchmarks/bench_ratelimit.py [--requests 20000]
+
+Times a trivial view bare, behind a limit it never reaches, and behind one
+it has already exceeded (the fast 429 path), using the configured cache
+(local memory unless REDIS_URL is set).
+"""
+import argparse
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=20000)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.conf import settings
+    from django.http import HttpResponse
+    from django.test import RequestFactory
+    from library.ratelimit import ratelimit
+
+    def view(request):
+        return HttpResponse('ok')
+
+    factory = RequestFactory()
+    request = factory.post('/bench/', REMOTE_ADDR='203.0.113.7')
+    allowed = ratelimit(f'{args.requests * 10}/h', group='bench-allowed')(view)
+    blocked = ratelimit('1/h', group='bench-blocked')(view)
+    blocked(request)
+    print(f"cache backend: {settings.CACHES['default']['BACKEND']}")
+
+    def run(func):
+        return lambda: [func(request) for _ in range(args.requests)]
+
+    results = [
+        ('bare view', common.timed('bare view', run(view))),
+        ('under the limit', common.timed('under the limit', run(allowed))),
+        ('over the limit (429)', common.timed('over the limit (429)', run(blocked))),
+    ]
+    base = results[0][1]
+    for label, seconds in results[1:]:
+        print(f'{label:<40} {(seconds - base) / args.requests * 1e6:10.2f} us/request overhead')
+
+
+if __name__ == '__main__':
+    main()
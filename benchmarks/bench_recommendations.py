@@ -0,0 +1,77 @@
+"""
+Recommendation build time and peak memory on synthetic borrow history.
+
+    python benchmarks/bench_recommendations.py [--members 20000] [--books 5000]
+        [--borrows 200000] [--chunk-size 1000]
+
+Members are split into taste groups that mostly borrow from their own slice
+of the catalog, so the neighbours found should share a group. Runs a full
+build, then an incremental build after a handful of new borrows. Peak memory
+is what tracemalloc saw during each build (NumPy reports its buffers there).
+"""
+import argparse
+import random
+import tracemalloc
+from datetime import timedelta
+
+import common
+
+GROUPS = 50
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=20000)
+    parser.add_argument('--books', type=int, default=5000)
+    parser.add_argument('--borrows', type=int, default=200000)
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.utils import timezone
+    from library import recommendations
+    from library.models import BookRecommendation, Borrow
+
+    members = common.seed_members(args.members)
+    books = common.seed_books(args.books)
+    due = timezone.now().date() + timedelta(days=14)
+    slice_size = len(books) // GROUPS
+    rng = random.Random(42)
+
+    def borrow(member_index):
+        group = member_index % GROUPS
+        if rng.random() < 0.8:
+            book = books[group * slice_size + rng.randrange(slice_size)]
+        else:
+            book = rng.choice(books)
+        return Borrow(book=book, member=members[member_index], due_date=due, status='returned')
+
+    Borrow.objects.bulk_create(
+        [borrow(rng.randrange(len(members))) for _ in range(args.borrows)], batch_size=5000
+    )
+    print(f'seeded {args.members} members, {args.books} books, {args.borrows} borrows')
+
+    def measured(label, **kwargs):
+        tracemalloc.start()
+        common.timed(label, lambda: recommendations.build(chunk_size=args.chunk_size, **kwargs), repeat=1)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(f'{"  peak traced memory":<40} {peak / 2 ** 20:10.2f} MiB')
+
+    measured('build (full)', full=True)
+    print(f'stored neighbours: {BookRecommendation.objects.count()}')
+
+    Borrow.objects.bulk_create([borrow(rng.randrange(len(members))) for _ in range(50)])
+    measured('build (incremental, 50 new borrows)')
+
+    same_group = total = 0
+    for recommendation in BookRecommendation.objects.filter(rank=1).iterator():
+        total += 1
+        # Books were created in catalog order, so the slice index is the group
+        same_group += (recommendation.book_id - books[0].id) // slice_size == \
+            (recommendation.recommended_id - books[0].id) // slice_size
+    print(f'top neighbour in the same taste group: {same_group / max(total, 1):.1%}')
+
+
+if __name__ == '__main__':
+    main()
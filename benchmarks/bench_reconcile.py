@@ -0,0 +1,81 @@
+"""
+Reconciling a month of Stripe payments against a gateway ledger.
+
+    python benchmarks/bench_reconcile.py [--payments 30000] [--batch-size 1000]
+
+Seeds a month of completed Stripe payments and writes the matching ledger
+as JSON Lines. About 1% of charges have a different amount, 0.5% of the
+payments have no charge, and 0.5% of the charges have no payment. Then it
+times a dry run and a --fix run of reconcile_payments and counts the queries.
+"""
+import argparse
+import io
+import json
+import os
+import random
+import tempfile
+from datetime import timedelta
+from decimal import Decimal
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--payments', type=int, default=30000)
+    parser.add_argument('--batch-size', type=int, default=1000)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.core.management import call_command
+    from django.db import connection
+    from django.utils import timezone
+    from library.models import Payment
+
+    rng = random.Random(1)
+    members = common.seed_members(2000)
+    now = timezone.now()
+    payments = [
+        Payment(member=members[i % len(members)], amount=Decimal(rng.randint(100, 5000)) / 100,
+                payment_method='stripe', status='completed', stripe_payment_intent_id=f'pi_{i:08d}',
+                description='Online payment for library fines')
+        for i in range(args.payments)
+    ]
+    Payment.objects.bulk_create(payments, batch_size=2000)
+    # auto_now_add stamps every row now; spread them over the month
+    for i, payment in enumerate(payments):
+        payment.payment_date = now - timedelta(days=30) * (i / args.payments)
+    Payment.objects.bulk_update(payments, ['payment_date'], batch_size=2000)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        ledger = os.path.join(tmp, 'ledger.jsonl')
+        with open(ledger, 'w') as out:
+            for i, payment in enumerate(payments):
+                if i % 200 == 7:
+                    continue
+                cents = int(payment.amount * 100) + (100 if i % 100 == 3 else 0)
+                out.write(json.dumps({
+                    'id': payment.stripe_payment_intent_id, 'amount': cents, 'status': 'succeeded',
+                    'created': int(payment.payment_date.timestamp()) - 5,
+                }) + '\n')
+                if i % 200 == 11:
+                    out.write(json.dumps({
+                        'id': f'pi_stray_{i}', 'amount': 500, 'status': 'succeeded',
+                        'created': int(payment.payment_date.timestamp()),
+                    }) + '\n')
+        print(f'seeded {args.payments} payments and their ledger')
+
+        for label, extra in [('reconcile_payments', []), ('reconcile_payments --fix', ['--fix'])]:
+            queries = []
+            output = io.StringIO()
+            with connection.execute_wrapper(lambda execute, sql, *rest: queries.append(sql) or execute(sql, *rest)):
+                common.timed(label, lambda: call_command(
+                    'reconcile_payments', '--ledger', ledger, '--batch-size', str(args.batch_size), *extra,
+                    stdout=output,
+                ), repeat=1)
+            print(f'{"  queries":<40} {len(queries):>10}')
+            print('  ' + output.getvalue().strip().splitlines()[-1])
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,46 @@
+"""
+send_reminders at scale, using the locmem e-mail backend.
+
+    python benchmarks/bench_reminders.py [--members 100000]
+
+Seeds one borrow per member with due dates spread over a month around
+today, runs the dispatcher, then runs it again to show the rerun is a
+no-op.
+"""
+import argparse
+import io
+from datetime import timedelta
+
+import common
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--members', type=int, default=100000)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.core import mail
+    from django.core.management import call_command
+    from django.utils import timezone
+    from library.models import Borrow
+
+    members = common.seed_members(args.members)
+    books = common.seed_books(1000)
+    today = timezone.now().date()
+    Borrow.objects.bulk_create([
+        Borrow(book=books[i % len(books)], member=member,
+               due_date=today + timedelta(days=i % 30 - 15))
+        for i, member in enumerate(members)
+    ], batch_size=2000)
+    print(f'seeded {args.members} members and borrows')
+
+    common.timed('send_reminders (first run)', lambda: call_command('send_reminders', stdout=io.StringIO()), repeat=1)
+    print(f'messages sent: {len(mail.outbox)}')
+    mail.outbox.clear()
+    common.timed('send_reminders (rerun)', lambda: call_command('send_reminders', stdout=io.StringIO()), repeat=1)
+    print(f'messages sent: {len(mail.outbox)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,65 @@
+"""
+Database queries per authenticated request for each session/message setup.
+
+    python benchmarks/bench_sessions.py [--requests 50]
+
+Signs a member in and requests the home page, the catalog and /payments/,
+plus a borrow POST that leaves a flash message behind and the page that
+shows it, under each session engine and message storage. Reports queries per
+request in total and those that touch django_session, and the wall time.
+"""
+import argparse
+import time
+
+import common
+
+SETUPS = [
+    ('db + fallback messages (old default)',
+     'django.contrib.sessions.backends.db', 'django.contrib.messages.storage.fallback.FallbackStorage'),
+    ('cached_db + cookie messages',
+     'django.contrib.sessions.backends.cached_db', 'django.contrib.messages.storage.cookie.CookieStorage'),
+    ('signed_cookies + cookie messages',
+     'django.contrib.sessions.backends.signed_cookies', 'django.contrib.messages.storage.cookie.CookieStorage'),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--requests', type=int, default=50)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.core.cache import cache
+    from django.db import connection
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+
+    member = common.seed_members(1)[0]
+    book = common.seed_books(1, copies=args.requests * len(SETUPS) + 1)[0]
+
+    for label, engine, storage in SETUPS:
+        cache.clear()
+        with override_settings(SESSION_ENGINE=engine, MESSAGE_STORAGE=storage, RATELIMIT_ENABLE=False):
+            client = Client()
+            client.force_login(member.user)
+
+            def browse():
+                for path in ('/', '/books/', '/payments/'):
+                    client.get(path)
+                client.post(f'/books/{book.id}/borrow/')
+                client.get('/')
+
+            browse()  # warm the cache-backed session
+            with CaptureQueriesContext(connection) as queries:
+                start = time.perf_counter()
+                for _ in range(args.requests):
+                    browse()
+                elapsed = time.perf_counter() - start
+        requests = args.requests * 5
+        session = sum(1 for query in queries.captured_queries if 'django_session' in query['sql'])
+        print(f'{label:<40} {len(queries) / requests:6.2f} queries/request '
+              f'({session / requests:.2f} session)  {elapsed / requests * 1000:7.2f} ms/request')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+Startup cost guard: `manage.py check` wall time and an import-time profile.
+
+    python benchmarks/bench_startup.py [--budget 1.0] [--runs 5] [--top 15]
+
+Every cron-driven management command and every gunicorn worker pays this
+cost. The script prints the slowest imports (cumulative, from
+`python -X importtime`), the best wall time of `manage.py check`, and exits
+with status 1 when the budget is exceeded or when a module that must stay
+lazy (payment SDK, NumPy/SciPy) shows up during startup.
+StartupBudgetTests in library/tests.py checks the lazy modules in the test
+suite, and the budget too when STARTUP_BUDGET_SECONDS is set; this script is
+for finding what to make lazy when it fails.
+"""
+import argparse
+import re
+import subprocess
+import sys
+import time
+
+import common
+
+# Imported inside the functions that need them; never at startup
+LAZY_MODULES = ['stripe', 'numpy', 'scipy']
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def run_check(*flags):
+    return subprocess.run(
+        [sys.executable, *flags, 'manage.py', 'check'],
+        cwd=common.BASE_DIR, capture_output=True, text=True, check=True,
+    )
+
+
+def import_profile():
+    """[(cumulative microseconds, module)] for every import made by `manage.py check`"""
+    modules = []
+    for line in run_check('-X', 'importtime').stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            modules.append((int(match.group(2)), match.group(4)))
+    return modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--budget', type=float, default=1.0, help='Seconds allowed for manage.py check')
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    modules = import_profile()
+    print('slowest imports (cumulative) during manage.py check:')
+    for cumulative, name in sorted(modules, reverse=True)[:args.top]:
+        print(f'  {name:<50} {cumulative / 1000:8.1f} ms')
+
+    best = None
+    for _ in range(args.runs):
+        start = time.perf_counter()
+        run_check()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{"manage.py check":<40} {best * 1000:10.2f} ms (budget {args.budget * 1000:.0f} ms)')
+
+    failures = []
+    loaded = {name.split('.')[0] for _, name in modules}
+    for module in LAZY_MODULES:
+        if module in loaded:
+            failures.append(f'{module} is imported at startup')
+    if best > args.budget:
+        failures.append(f'manage.py check took {best:.2f}s, over the {args.budget:.2f}s budget')
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""
+Render time per hot template, and what the cached loader saves per request.
+
+    python benchmarks/bench_templates.py [--books 300] [--repeat 20]
+
+Seeds a reviewed catalog, requests each hot page once to capture the context
+its view builds, then reports for each template:
+
+- compiling its source,
+- rendering it from the cached loader, and
+- the queries it issues while rendering: lookups the template makes per
+  object, which rendering from a compiled template cannot save.
+
+Finally it times whole requests with the cached loader and without it.
+"""
+import argparse
+import random
+import time
+
+import common
+
+PAGES = ['/', '/books/', '/books/?sort=rating', '/register/', '/login/']
+
+
+def elapsed(func):
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--books', type=int, default=300)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    common.setup()
+    from django.conf import settings
+    from django.db import connection
+    from django.template import engines
+    from django.template.loader import get_template
+    from django.test import Client, override_settings
+    from django.test.utils import CaptureQueriesContext
+    from library.models import Author, Book, Category, Review
+
+    rng = random.Random(1)
+    categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(10)])
+    authors = Author.objects.bulk_create([
+        Author(name=f'Author {i}', name_key=f'author {i}') for i in range(args.books // 3)
+    ])
+    books = common.seed_books(args.books)
+    for i, book in enumerate(books):
+        book.category = categories[i % len(categories)]
+    Book.objects.bulk_update(books, ['category'])
+    Book.authors.through.objects.bulk_create([
+        Book.authors.through(book_id=book.pk, author_id=authors[i % len(authors)].pk)
+        for i, book in enumerate(books)
+    ])
+    members = common.seed_members(50)
+    Review.objects.bulk_create([
+        Review(book=book, member=member, rating=rng.randint(3, 5), comment='Good')
+        for book in books for member in rng.sample(members, 3)
+    ])
+
+    client = Client()
+    engine = engines['django'].engine
+    print(f'{"template":<36} {"compile ms":>10} {"render ms":>10} {"queries":>8}')
+    for page in PAGES:
+        response = client.get(page)
+        name = response.templates[0].name
+        context, request = response.context[0].flatten(), response.wsgi_request
+        template = get_template(name)
+        source = template.template.source
+        compile_time = min(elapsed(lambda: engine.from_string(source)) for _ in range(args.repeat))
+        # The view's querysets were evaluated by the captured response; what is left is per-object lookups
+        with CaptureQueriesContext(connection) as queries:
+            template.render(context, request)
+        render_time = min(elapsed(lambda: template.render(context, request)) for _ in range(args.repeat))
+        print(f'{name + " " + page.partition("?")[2]:<36} {compile_time * 1000:>10.2f} '
+              f'{render_time * 1000:>10.2f} {len(queries):>8}')
+
+    print()
+    uncached = [{**settings.TEMPLATES[0], 'OPTIONS': {
+        **settings.TEMPLATES[0]['OPTIONS'], 'loaders': settings.TEMPLATE_LOADERS,
+    }}]
+    for label, templates in [('cached loader', settings.TEMPLATES), ('no template cache', uncached)]:
+        with override_settings(TEMPLATES=templates):
+            for page in PAGES[:2]:
+                client.get(page)
+                common.timed(f'GET {page} ({label})', lambda: client.get(page), args.repeat)
+
+
+if __name__ == '__main__':
+    main()
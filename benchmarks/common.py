@@ -0,0 +1,82 @@
+"""
+Shared setup for the benchmark scripts.
+
+Every benchmark runs against a throwaway test database created the same way
+the Django test runner does it, so running one never touches db.sqlite3 or a
+configured production database.
+"""
+import os
+import sys
+import time
+from datetime import date, timedelta
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_management.settings')
+
+
+def setup():
+    """Configure Django and create an empty test database"""
+    import django
+    django.setup()
+
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+
+    setup_test_environment()
+    connection.creation.create_test_db(verbosity=0)
+
+
+def timed(label, func, repeat=3):
+    """Run func `repeat` times and print and return the best wall time in seconds"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    print(f'{label:<40} {best * 1000:10.2f} ms')
+    return best
+
+
+def seed_members(count, prefix='bench'):
+    """Bulk-create `count` users with member profiles"""
+    from django.contrib.auth.models import User
+    from library.models import Member
+
+    User.objects.bulk_create([
+        User(username=f'{prefix}{i}', email=f'{prefix}{i}@example.com')
+        for i in range(count)
+    ], batch_size=1000)
+    users = User.objects.filter(username__startswith=prefix).order_by('id')
+    expiry = date.today() + timedelta(days=365)
+    Member.objects.bulk_create([
+        Member(
+            user=user, member_id=f'B{i:09d}', phone='555-0100', address='1 Bench St',
+            membership_expiry=expiry, max_books_allowed=1000,
+        )
+        for i, user in enumerate(users)
+    ], batch_size=1000)
+    return list(Member.objects.filter(user__username__startswith=prefix).order_by('id'))
+
+
+def make_isbn(n):
+    """A valid ISBN-13 in the 979 range for the integer n"""
+    body = f'979{n:09d}'
+    total = sum(int(digit) * (3 if i % 2 else 1) for i, digit in enumerate(body))
+    return body + str((10 - total % 10) % 10)
+
+
+def seed_books(count, copies=5):
+    """Bulk-create `count` books with `copies` copies each"""
+    from library.models import Book
+
+    Book.objects.bulk_create([
+        Book(
+            title=f'Benchmark Book {i}', isbn=make_isbn(i), isbn_normalized=make_isbn(i),
+            total_copies=copies, available_copies=copies,
+        )
+        for i in range(count)
+    ], batch_size=1000)
+    return list(Book.objects.order_by('id'))
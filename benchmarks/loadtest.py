@@ -0,0 +1,232 @@
+"""
+Throughput and tail latency of each gunicorn worker profile on this machine.
+
+    python benchmarks/loadtest.py [--profiles sync gthread asgi] [--workers 2 4]
+                                  [--threads 2 4 8] [--concurrency 32] [--duration 15]
+
+Seeds a throwaway SQLite copy of the app with books, authors and members.
+Then, for every combination of profile, worker count and thread count, it
+starts gunicorn with gunicorn.conf.py. Worker and thread counts default to
+what gunicorn.conf.py derives, and threads only apply to gthread. Each run
+holds `--concurrency` keep-alive clients on the home page, the catalog,
+catalog searches and filtered catalog pages for `--duration` seconds. It
+reports requests per second and p50/p99 latency, and picks the best
+configuration on each.
+
+The load generator runs on the same machine and takes CPU from the server.
+Compare configurations with each other, not with production numbers. Needs
+gunicorn and uvicorn from requirements.txt.
+"""
+import argparse
+import http.client
+import itertools
+import os
+import runpy
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from unittest import mock
+from urllib.parse import quote_plus
+
+import common
+
+SETTINGS = """\
+from library_management.settings import *
+
+DEBUG = False
+ALLOWED_HOSTS = ['127.0.0.1', 'localhost']
+DATABASES = {{'default': {{'ENGINE': 'django.db.backends.sqlite3', 'NAME': {database!r}}}}}
+STORAGES = {{
+    'default': {{'BACKEND': 'django.core.files.storage.FileSystemStorage'}},
+    'staticfiles': {{'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'}},
+}}
+"""
+
+
+def seed(books, members):
+    """Create the schema and catalog in the throwaway database"""
+    import django
+    django.setup()
+    from django.core.management import call_command
+    from library.models import Author, Book, Category
+
+    call_command('migrate', run_syncdb=True, verbosity=0)
+    categories = Category.objects.bulk_create([Category(name=f'Category {i}') for i in range(20)])
+    authors = Author.objects.bulk_create([Author(name=f'Author {i}', name_key=f'author {i}') for i in range(books // 4)])
+    seeded = common.seed_books(books)
+    for i, book in enumerate(seeded):
+        book.category = categories[i % len(categories)]
+    Book.objects.bulk_update(seeded, ['category'], batch_size=1000)
+    Book.authors.through.objects.bulk_create([
+        Book.authors.through(book_id=book.pk, author_id=authors[i % len(authors)].pk)
+        for i, book in enumerate(seeded)
+    ], batch_size=1000)
+    common.seed_members(members)
+    # The catalog filters on the category name
+    return [category.name for category in categories]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_until_up(port, process, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f'gunicorn exited with status {process.returncode}')
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=5)
+            connection.request('GET', '/')
+            if connection.getresponse().status == 200:
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f'gunicorn did not answer on port {port} within {timeout}s')
+
+
+def load(port, paths, concurrency, duration, warmup):
+    """Latencies in seconds of successful requests after the warm-up, and the error count"""
+    start = time.monotonic()
+    measure_from, stop_at = start + warmup, start + warmup + duration
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+
+    def client(offset):
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout=30)
+        mine, failed = [], 0
+        for path in itertools.islice(itertools.cycle(paths), offset, None):
+            began = time.monotonic()
+            if began >= stop_at:
+                break
+            try:
+                connection.request('GET', path)
+                response = connection.getresponse()
+                response.read()
+                ok = response.status == 200
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                ok = False
+            if began >= measure_from:
+                if ok:
+                    mine.append(time.monotonic() - began)
+                else:
+                    failed += 1
+        connection.close()
+        with lock:
+            latencies.extend(mine)
+            errors[0] += failed
+
+    threads = [threading.Thread(target=client, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors[0]
+
+
+def run(env, args, paths):
+    """Start gunicorn with `env`, load it, stop it; returns (workers, threads, rps, p50, p99, errors)"""
+    with mock.patch.dict(os.environ, env, clear=True):
+        config = runpy.run_path(str(common.BASE_DIR / 'gunicorn.conf.py'))
+    port = free_port()
+    with tempfile.TemporaryDirectory() as tmp:
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '--config', 'gunicorn.conf.py',
+             '--pid', os.path.join(tmp, 'gunicorn.pid'), '--bind', f'127.0.0.1:{port}'],
+            cwd=common.BASE_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True,
+        )
+        try:
+            wait_until_up(port, process)
+            latencies, errors = load(port, paths, args.concurrency, args.duration, args.warmup)
+        except RuntimeError:
+            process.kill()
+            sys.stderr.write(process.communicate()[1][-2000:])
+            raise
+        finally:
+            if process.poll() is None:
+                process.terminate()
+                process.wait(timeout=60)
+    if not latencies:
+        return config['workers'], config['threads'], 0.0, None, None, errors
+    cuts = statistics.quantiles(latencies, n=100)
+    return config['workers'], config['threads'], len(latencies) / args.duration, cuts[49], cuts[98], errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--profiles', nargs='+', default=['sync', 'gthread', 'asgi'])
+    parser.add_argument('--workers', nargs='+', type=int, help='Worker counts to try (default: derived)')
+    parser.add_argument('--threads', nargs='+', type=int, help='gthread thread counts to try (default: derived)')
+    parser.add_argument('--concurrency', type=int, default=32, help='Simultaneous keep-alive clients')
+    parser.add_argument('--duration', type=float, default=15, help='Measured seconds per configuration')
+    parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds before each measurement')
+    parser.add_argument('--books', type=int, default=2000)
+    parser.add_argument('--members', type=int, default=200)
+    args = parser.parse_args()
+
+    if shutil.which('gunicorn') is None:
+        parser.error('gunicorn is not installed (pip install -r requirements.txt)')
+
+    tmp = tempfile.mkdtemp(prefix='loadtest-')
+    try:
+        with open(os.path.join(tmp, 'loadtest_settings.py'), 'w') as settings:
+            settings.write(SETTINGS.format(database=os.path.join(tmp, 'db.sqlite3')))
+        os.environ['DJANGO_SETTINGS_MODULE'] = 'loadtest_settings'
+        os.environ['PYTHONPATH'] = os.pathsep.join(filter(None, [tmp, str(common.BASE_DIR), os.environ.get('PYTHONPATH')]))
+        sys.path.insert(0, tmp)
+        categories = seed(args.books, args.members)
+        # Early pages, so each stays within its category's books
+        paths = ['/', '/books/', '/books/?search=Benchmark+Book+1', '/books/?search=author+1'] + [
+            f'/books/?page={2 + i % 4}&category={quote_plus(name)}' for i, name in enumerate(categories[:10])
+        ]
+        print(f'seeded {args.books} books; {os.cpu_count()} CPU(s); {args.concurrency} clients, {args.duration:g}s each')
+        print(f'{"profile":<10} {"workers":>7} {"threads":>7} {"req/s":>9} {"p50 ms":>9} {"p99 ms":>9} {"errors":>7}')
+
+        base_env = {key: value for key, value in os.environ.items()
+                    if key not in ('GUNICORN_PROFILE', 'WEB_CONCURRENCY', 'GUNICORN_THREADS')}
+        results = []
+        for profile in args.profiles:
+            if profile == 'asgi':
+                try:
+                    import uvicorn  # noqa: F401
+                except ImportError:
+                    print(f'{profile:<10} skipped: uvicorn is not installed (pip install -r requirements.txt)')
+                    continue
+            for workers, threads in itertools.product(
+                args.workers or [None], (args.threads or [None]) if profile == 'gthread' else [None]
+            ):
+                env = {**base_env, 'GUNICORN_PROFILE': profile, 'GUNICORN_ACCESSLOG': ''}
+                if workers:
+                    env['WEB_CONCURRENCY'] = str(workers)
+                if threads:
+                    env['GUNICORN_THREADS'] = str(threads)
+                used_workers, used_threads, rps, p50, p99, errors = run(env, args, paths)
+                if p99 is None:
+                    print(f'{profile:<10} {used_workers:>7} {used_threads:>7} {"no successful requests":>29} {errors:>7}')
+                    continue
+                results.append((profile, used_workers, used_threads, rps, p99))
+                print(f'{profile:<10} {used_workers:>7} {used_threads:>7} {rps:>9.1f} '
+                      f'{p50 * 1000:>9.1f} {p99 * 1000:>9.1f} {errors:>7}')
+
+        if results:
+            for label, best in [('throughput', max(results, key=lambda r: r[3])),
+                                ('p99 latency', min(results, key=lambda r: r[4]))]:
+                profile, workers, threads, _, _ = best
+                settings_line = f'GUNICORN_PROFILE={profile} WEB_CONCURRENCY={workers}'
+                if profile == 'gthread':
+                    settings_line += f' GUNICORN_THREADS={threads}'
+                print(f'best {label:<12} {settings_line}')
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
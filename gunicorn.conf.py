@@ -1,12 +1,56 @@
 # Gunicorn configuration file
+#
+# Worker model and pool size come from the environment, so one file fits every
+# host size:
+#
+#   GUNICORN_PROFILE   sync (default) | gthread | asgi
+#   WEB_CONCURRENCY    worker processes (default: derived from the CPU count)
+#   GUNICORN_THREADS   threads per gthread worker (default 4)
+#   GUNICORN_MAX_WORKERS  cap on the derived worker count, e.g. for small-memory hosts
+#
+# benchmarks/loadtest.py sweeps these settings against a seeded copy of the app
+# and reports which is fastest on the current machine.
+
+import multiprocessing
+import os
+
+PROFILES = ('sync', 'gthread', 'asgi')
+
+
+def env_int(name, default):
+    value = os.environ.get(name, '')
+    return int(value) if value.strip() else default
+
+
+cores = multiprocessing.cpu_count()
+profile = os.environ.get('GUNICORN_PROFILE', 'sync')
+if profile not in PROFILES:
+    raise RuntimeError(f"GUNICORN_PROFILE must be one of {', '.join(PROFILES)}, not {profile!r}")
 
 # Server socket
-bind = "0.0.0.0:8000"
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+
+# Application; the Procfile leaves it out so the asgi profile can switch it
+wsgi_app = "library_management.wsgi:application"
 
 # Worker processes
-workers = 3
-worker_class = "sync"
-worker_connections = 1000
+if profile == 'sync':
+    # One request per process; extra processes cover requests blocked on the database
+    default_workers, threads = 2 * cores + 1, 1
+    worker_class = "sync"
+elif profile == 'gthread':
+    # Threads overlap database and Stripe I/O; processes cover the CPU-bound rendering
+    default_workers, threads = cores + 1, env_int('GUNICORN_THREADS', 4)
+    worker_class = "gthread"
+    # Open connections per worker, including idle keep-alive ones (gthread only)
+    worker_connections = 1000
+else:
+    # Django's sync views run in a thread pool under ASGI (uvicorn is in requirements.txt)
+    default_workers, threads = cores, 1
+    worker_class = "uvicorn.workers.UvicornWorker"
+    wsgi_app = "library_management.asgi:application"
+
+workers = env_int('WEB_CONCURRENCY', min(default_workers, env_int('GUNICORN_MAX_WORKERS', default_workers)))
 max_requests = 1000
 max_requests_jitter = 100
 
@@ -14,8 +58,8 @@ max_requests_jitter = 100
 timeout = 30
 keepalive = 2
 
-# Logging
-accesslog = "-"
+# Logging; GUNICORN_ACCESSLOG= (empty) turns the access log off
+accesslog = os.environ.get('GUNICORN_ACCESSLOG', '-') or None
 errorlog = "-"
 loglevel = "info"
 
@@ -32,8 +76,7 @@ group = None
 # keyfile = "/path/to/keyfile"
 # certfile = "/path/to/certfile"
 
-# Worker process settings
-max_requests = 1000
+# Load the app once in the master so workers fork with it imported
 preload_app = True
 
 # Graceful shutdown
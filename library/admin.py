@@ -1,10 +1,27 @@
 from django.contrib import admin
+from django.utils import timezone
+from . import authors, circulation, isbn
 from .models import (
-    Category, Author, Book, Member, Borrow, 
-    Fine, Payment, Reservation, Review
+    Category, Author, Book, BookCopy, Member, Borrow, FinePolicy, ClosedDay,
+    Fine, Payment, Reservation, Review, CirculationEvent,
+    BookRecommendation, RecommendationRun, OutboxEvent,
+    ArchivedBorrow, ArchivedFine, ArchivedPayment, ArchivedReservation
 )
 
 
+class ReadOnlyAdmin(admin.ModelAdmin):
+    """Browse-only admin for ledger and archive tables"""
+    
+    def has_add_permission(self, request):
+        return False
+    
+    def has_change_permission(self, request, obj=None):
+        return False
+    
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
 @admin.register(Category)
 class CategoryAdmin(admin.ModelAdmin):
     list_display = ['name', 'description']
@@ -13,9 +30,15 @@ class CategoryAdmin(admin.ModelAdmin):
 
 @admin.register(Author)
 class AuthorAdmin(admin.ModelAdmin):
-    list_display = ['name', 'email', 'birth_date']
-    search_fields = ['name', 'email']
+    list_display = ['name', 'name_key', 'email', 'birth_date']
+    search_fields = ['name_key', 'email']
     list_filter = ['birth_date']
+    
+    def get_search_results(self, request, queryset, search_term):
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(pk__in=authors.matching(search_term))
+        return results, may_have_duplicates
 
 
 class BookAuthorInline(admin.TabularInline):
@@ -23,42 +46,109 @@ class BookAuthorInline(admin.TabularInline):
     extra = 1
 
 
+class BookCopyInline(admin.TabularInline):
+    model = BookCopy
+    extra = 0
+    fields = ['barcode', 'status', 'location']
+
+
 @admin.register(Book)
 class BookAdmin(admin.ModelAdmin):
     list_display = [
         'title', 'primary_author', 'isbn', 'category', 
         'status', 'available_copies', 'total_copies'
     ]
-    search_fields = ['title', 'isbn', 'authors__name']
+    # Author matches are added in get_search_results through the indexed name key
+    search_fields = ['title', 'isbn']
     list_filter = ['status', 'category', 'language']
-    inlines = [BookAuthorInline]
+    inlines = [BookAuthorInline, BookCopyInline]
     exclude = ['authors']
     readonly_fields = ['added_date', 'updated_date']
     
     def primary_author(self, obj):
         return obj.primary_author.name if obj.primary_author else 'N/A'
+    
+    def get_search_results(self, request, queryset, search_term):
+        isbn_match = isbn.lookup(search_term)
+        if isbn_match is not None:
+            return queryset.filter(isbn_match), False
+        results, may_have_duplicates = super().get_search_results(request, queryset, search_term)
+        if search_term:
+            results |= queryset.filter(authors__in=authors.matching(search_term))
+            may_have_duplicates = True
+        return results, may_have_duplicates
+    
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        if form.instance.copies.exists():
+            circulation.refresh_copy_counts([form.instance.pk])
+
+
+@admin.register(BookCopy)
+class BookCopyAdmin(admin.ModelAdmin):
+    list_display = ['barcode', 'book', 'status', 'location', 'added_date']
+    search_fields = ['=barcode', 'book__title']
+    list_filter = ['status']
+    raw_id_fields = ['book']
 
 
 @admin.register(Member)
 class MemberAdmin(admin.ModelAdmin):
     list_display = [
-        'user', 'member_id', 'phone', 'membership_status', 
+        'user', 'member_id', 'phone', 'membership_status', 'tier',
         'current_books_borrowed', 'max_books_allowed'
     ]
     search_fields = ['user__username', 'user__first_name', 'user__last_name', 'member_id']
-    list_filter = ['is_active', 'membership_expiry']
+    list_filter = ['is_active', 'tier', 'membership_expiry']
     readonly_fields = ['membership_date']
 
 
+@admin.register(FinePolicy)
+class FinePolicyAdmin(admin.ModelAdmin):
+    list_display = ['name', 'category', 'member_tier', 'daily_rate', 'grace_days', 'max_fine', 'priority', 'is_active']
+    list_editable = ['priority', 'is_active']
+    list_filter = ['is_active', 'member_tier', 'category']
+
+
+@admin.register(ClosedDay)
+class ClosedDayAdmin(admin.ModelAdmin):
+    list_display = ['date', 'reason']
+    date_hierarchy = 'date'
+
+
 @admin.register(Borrow)
 class BorrowAdmin(admin.ModelAdmin):
     list_display = [
         'book', 'member', 'borrow_date', 'due_date', 
-        'return_date', 'status', 'fine_amount'
+        'return_date', 'status', 'renewal_count', 'fine_amount'
     ]
-    search_fields = ['book__title', 'member__user__username']
+    search_fields = ['book__title', 'member__user__username', '=copy__barcode']
     list_filter = ['status', 'borrow_date', 'due_date']
     readonly_fields = ['borrow_id']
+    raw_id_fields = ['copy']
+    actions = ['renew', 'extend_due_dates', 'mark_lost']
+    
+    @admin.action(description='Renew selected borrows (respects renewal policy)')
+    def renew(self, request, queryset):
+        renewed = circulation.renew(queryset)
+        self.message_user(request, f'{len(renewed)} borrow(s) renewed.')
+    
+    @admin.action(description='Extend due dates of selected borrows by 7 days')
+    def extend_due_dates(self, request, queryset):
+        count = circulation.extend_due_dates(queryset, 7)
+        self.message_user(request, f'{count} due date(s) extended.')
+    
+    @admin.action(description='Mark selected borrows as lost')
+    def mark_lost(self, request, queryset):
+        count = circulation.mark_lost(queryset)
+        self.message_user(request, f'{count} borrow(s) marked as lost.')
+
+
+@admin.register(CirculationEvent)
+class CirculationEventAdmin(ReadOnlyAdmin):
+    list_display = ['event_type', 'book', 'member', 'borrow_ref', 'created_date']
+    search_fields = ['borrow_ref', 'book__title', 'member__member_id']
+    list_filter = ['event_type', 'created_date']
 
 
 @admin.register(Fine)
@@ -75,11 +165,11 @@ class FineAdmin(admin.ModelAdmin):
 class PaymentAdmin(admin.ModelAdmin):
     list_display = [
         'member', 'amount', 'payment_method', 'status', 
-        'payment_date', 'stripe_payment_intent_id'
+        'payment_date', 'stripe_payment_intent_id', 'reconciliation_status'
     ]
-    search_fields = ['member__user__username', 'payment_id']
-    list_filter = ['status', 'payment_method', 'payment_date']
-    readonly_fields = ['payment_id', 'payment_date']
+    search_fields = ['member__user__username', 'payment_id', 'stripe_payment_intent_id']
+    list_filter = ['status', 'payment_method', 'reconciliation_status', 'payment_date']
+    readonly_fields = ['payment_id', 'payment_date', 'reconciliation_status', 'reconciled_date']
 
 
 @admin.register(Reservation)
@@ -97,3 +187,58 @@ class ReviewAdmin(admin.ModelAdmin):
     list_display = ['book', 'member', 'rating', 'review_date']
     search_fields = ['book__title', 'member__user__username']
     list_filter = ['rating', 'review_date']
+
+
+@admin.register(OutboxEvent)
+class OutboxEventAdmin(ReadOnlyAdmin):
+    list_display = ['id', 'topic', 'created_date', 'attempts', 'processed_date', 'last_error']
+    list_filter = ['topic', 'processed_date']
+    actions = ['retry']
+    
+    @admin.action(description='Retry selected unprocessed events now')
+    def retry(self, request, queryset):
+        updated = queryset.filter(processed_date__isnull=True).update(
+            attempts=0, available_date=timezone.now(), last_error=''
+        )
+        self.message_user(request, f'{updated} event(s) queued for retry.')
+
+
+@admin.register(BookRecommendation)
+class BookRecommendationAdmin(ReadOnlyAdmin):
+    list_display = ['book', 'rank', 'recommended', 'score', 'computed_date']
+    search_fields = ['book__title', 'recommended__title']
+    list_select_related = ['book', 'recommended']
+
+
+@admin.register(RecommendationRun)
+class RecommendationRunAdmin(ReadOnlyAdmin):
+    list_display = ['started_date', 'completed_date', 'books_updated', 'full']
+    list_filter = ['full']
+
+
+@admin.register(ArchivedBorrow)
+class ArchivedBorrowAdmin(ReadOnlyAdmin):
+    list_display = ['book', 'member', 'borrow_date', 'return_date', 'status', 'fine_amount']
+    search_fields = ['borrow_id', 'book__title', 'member__user__username']
+    list_filter = ['status', 'borrow_date']
+
+
+@admin.register(ArchivedFine)
+class ArchivedFineAdmin(ReadOnlyAdmin):
+    list_display = ['borrow', 'amount', 'reason', 'issue_date', 'status', 'payment_date']
+    search_fields = ['borrow__book__title', 'borrow__member__user__username']
+    list_filter = ['status', 'issue_date']
+
+
+@admin.register(ArchivedPayment)
+class ArchivedPaymentAdmin(ReadOnlyAdmin):
+    list_display = ['member', 'amount', 'payment_method', 'status', 'payment_date']
+    search_fields = ['member__user__username', 'payment_id', 'stripe_payment_intent_id']
+    list_filter = ['status', 'payment_method', 'payment_date']
+
+
+@admin.register(ArchivedReservation)
+class ArchivedReservationAdmin(ReadOnlyAdmin):
+    list_display = ['book', 'member', 'reservation_date', 'expiry_date', 'status']
+    search_fields = ['book__title', 'member__user__username']
+    list_filter = ['status', 'reservation_date']
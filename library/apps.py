@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class LibraryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'library'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        from .authors import ensure_trigram_index
+        # Author search on PostgreSQL needs pg_trgm; create it along with the schema
+        post_migrate.connect(ensure_trigram_index, sender=self)
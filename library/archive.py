@@ -0,0 +1,127 @@
+"""
+Archival of closed circulation history.
+
+Returned/lost borrows (with their settled fines), finished payments and
+closed reservations older than the retention window are copied into the
+Archived* tables and deleted from the hot tables in small batches, one
+transaction per batch, so the live tables and their indexes stay small.
+History views can merge the archive back in on request.
+"""
+import heapq
+from datetime import timedelta
+from operator import attrgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import (
+    Borrow, Fine, Payment, Reservation,
+    ArchivedBorrow, ArchivedFine, ArchivedPayment, ArchivedReservation,
+)
+
+
+def _copied_fields(archive_model):
+    """Column names shared by an archive table and its live table"""
+    return [
+        field.attname for field in archive_model._meta.concrete_fields
+        if field.name not in ('archived_date', 'fine_ids')
+    ]
+
+
+def closed_querysets(cutoff):
+    """Live rows that are closed and older than `cutoff`, per table"""
+    return {
+        'payments': Payment.objects.filter(
+            status__in=['completed', 'failed', 'refunded'], payment_date__lt=cutoff
+        ),
+        'borrows': Borrow.objects.filter(
+            Q(status='returned', return_date__lt=cutoff) | Q(status='lost', borrow_date__lt=cutoff)
+        ).exclude(
+            fines__status='pending'
+        ).exclude(
+            # Keep fines linked to a live payment until that payment is archived
+            fines__payments__isnull=False
+        ),
+        'reservations': Reservation.objects.filter(
+            status__in=['fulfilled', 'cancelled', 'expired'], expiry_date__lt=cutoff
+        ),
+    }
+
+
+def _archive_payments(pks):
+    fine_ids = {}
+    for payment_id, fine_id in Payment.fines.through.objects.filter(
+        payment_id__in=pks
+    ).values_list('payment_id', 'fine_id'):
+        fine_ids.setdefault(payment_id, []).append(fine_id)
+    rows = Payment.objects.filter(pk__in=pks).values(*_copied_fields(ArchivedPayment))
+    ArchivedPayment.objects.bulk_create([
+        ArchivedPayment(**row, fine_ids=fine_ids.get(row['payment_id'], [])) for row in rows
+    ])
+    Payment.objects.filter(pk__in=pks).delete()
+
+
+def _archive_borrows(pks):
+    rows = Borrow.objects.filter(pk__in=pks).values(*_copied_fields(ArchivedBorrow))
+    ArchivedBorrow.objects.bulk_create([ArchivedBorrow(**row) for row in rows])
+    rows = Fine.objects.filter(borrow_id__in=pks).values(*_copied_fields(ArchivedFine))
+    ArchivedFine.objects.bulk_create([ArchivedFine(**row) for row in rows])
+    # Cascades to the fines just copied
+    Borrow.objects.filter(pk__in=pks).delete()
+
+
+def _archive_reservations(pks):
+    rows = Reservation.objects.filter(pk__in=pks).values(*_copied_fields(ArchivedReservation))
+    ArchivedReservation.objects.bulk_create([ArchivedReservation(**row) for row in rows])
+    Reservation.objects.filter(pk__in=pks).delete()
+
+
+ARCHIVERS = {
+    # Payments go first so their fine links are captured before fines move
+    'payments': _archive_payments,
+    'borrows': _archive_borrows,
+    'reservations': _archive_reservations,
+}
+
+
+def archive_closed(retention_days=None, batch_size=500):
+    """
+    Move closed history older than the retention window into the archive.
+
+    Returns {table: rows archived}.
+    """
+    if retention_days is None:
+        retention_days = settings.ARCHIVE_RETENTION_DAYS
+    cutoff = timezone.now() - timedelta(days=retention_days)
+    querysets = closed_querysets(cutoff)
+    archived = {}
+    for table, archiver in ARCHIVERS.items():
+        archived[table] = 0
+        while True:
+            with transaction.atomic():
+                pks = list(querysets[table].values_list('pk', flat=True).distinct()[:batch_size])
+                if not pks:
+                    break
+                archiver(pks)
+            archived[table] += len(pks)
+    return archived
+
+
+def borrow_history(member, include_archived=False):
+    """A member's borrows, newest first, optionally merged with the archive"""
+    live = Borrow.objects.filter(member=member).select_related('book').order_by('-borrow_date')
+    if not include_archived:
+        return live
+    archived = ArchivedBorrow.objects.filter(member=member).select_related('book').order_by('-borrow_date')
+    return list(heapq.merge(live, archived, key=attrgetter('borrow_date'), reverse=True))
+
+
+def payment_history(member, include_archived=False):
+    """A member's payments, newest first, optionally merged with the archive"""
+    live = Payment.objects.filter(member=member).order_by('-payment_date')
+    if not include_archived:
+        return live
+    archived = ArchivedPayment.objects.filter(member=member).order_by('-payment_date')
+    return list(heapq.merge(live, archived, key=attrgetter('payment_date'), reverse=True))
@@ -0,0 +1,177 @@
+"""
+Author name normalization and fuzzy matching.
+
+`name_key()` folds the spellings one author tends to collect into a single
+key: case, accents and punctuation are dropped, runs of initials are joined
+("J. R. R." and "J.R.R." both become "jrr"), and "Last, First" is turned
+around. Author.name_key stores it with an index.
+
+Near-duplicates are found by trigram similarity on the key, computed the
+way pg_trgm does (each word padded with two leading spaces and one trailing
+space; similarity is shared trigrams over the union). On PostgreSQL the
+pg_trgm extension and a GIN index do the work in the database; both are
+created after every `manage.py migrate` (see LibraryConfig.ready) when the
+database user may do so. Elsewhere, or while pg_trgm is missing, similar
+keys come from TrigramIndex, an in-process inverted index over the keys,
+and author search falls back to a substring match on the key (so it finds
+"tolkien" in "jrr tolkien" but not the misspelling "tolkein").
+"""
+import logging
+import re
+import unicodedata
+from collections import Counter, defaultdict
+
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connection, connections, transaction
+from django.db.models.expressions import RawSQL
+
+from .models import Author
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_INDEX_NAME = 'library_author_name_key_trgm'
+
+# Whether pg_trgm is installed, per database alias; checked once per process
+_has_pg_trgm = {}
+
+
+def name_key(name):
+    """Normalized comparison key for an author name"""
+    text = unicodedata.normalize('NFKD', name or '')
+    text = ''.join(char for char in text if not unicodedata.combining(char)).lower()
+    if text.count(',') == 1:
+        last, first = text.split(',')
+        text = f'{first} {last}'
+    text = re.sub(r"['’]", '', text)
+    words = re.sub(r'[\W_]+', ' ', text).split()
+    joined = []
+    for word in words:
+        if len(word) == 1 and joined and joined[-1][1]:
+            joined[-1] = (joined[-1][0] + word, True)
+        else:
+            joined.append((word, len(word) == 1))
+    return ' '.join(word for word, _ in joined)[:100]
+
+
+def trigrams(key):
+    """pg_trgm-style trigram set of a name key"""
+    grams = set()
+    for word in key.split():
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def similarity(a, b):
+    """Trigram similarity of two keys, from 0 to 1"""
+    a, b = trigrams(a), trigrams(b)
+    if not a or not b:
+        return 0.0
+    shared = len(a & b)
+    return shared / (len(a) + len(b) - shared)
+
+
+class TrigramIndex:
+    """In-memory inverted index from trigrams to IDs, for databases without pg_trgm"""
+
+    def __init__(self, items=()):
+        self.postings = defaultdict(list)
+        self.sizes = {}
+        for item_id, key in items:
+            self.add(item_id, key)
+
+    def add(self, item_id, key):
+        grams = trigrams(key)
+        self.sizes[item_id] = len(grams)
+        for gram in grams:
+            self.postings[gram].append(item_id)
+
+    def similar(self, key, threshold):
+        """[(id, similarity), ...] of indexed keys at least `threshold` similar to `key`"""
+        grams = trigrams(key)
+        shared = Counter()
+        for gram in grams:
+            shared.update(self.postings.get(gram, ()))
+        matches = []
+        for item_id, count in shared.items():
+            score = count / (len(grams) + self.sizes[item_id] - count)
+            if score >= threshold:
+                matches.append((item_id, score))
+        return matches
+
+
+def uses_pg_trgm():
+    if connection.vendor != 'postgresql':
+        return False
+    if connection.alias not in _has_pg_trgm:
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')")
+            _has_pg_trgm[connection.alias] = cursor.fetchone()[0]
+    return _has_pg_trgm[connection.alias]
+
+
+def ensure_trigram_index(sender=None, using=DEFAULT_DB_ALIAS, **kwargs):
+    """Create pg_trgm and the GIN index on Author.name_key if they are missing (PostgreSQL only)"""
+    database = connections[using]
+    if database.vendor != 'postgresql':
+        return
+    try:
+        with transaction.atomic(using=using), database.cursor() as cursor:
+            cursor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS {TRIGRAM_INDEX_NAME} ON {Author._meta.db_table} '
+                f'USING gin (name_key gin_trgm_ops)'
+            )
+    except DatabaseError as exc:
+        # Creating an extension usually needs a superuser or the database owner
+        logger.warning(
+            'Could not enable pg_trgm (%s). Author search falls back to substring matching until a '
+            'superuser runs CREATE EXTENSION pg_trgm; in this database; then run migrate again.',
+            exc,
+        )
+        _has_pg_trgm.pop(using, None)
+    else:
+        _has_pg_trgm[using] = True
+
+
+def matching(query):
+    """
+    Authors whose name matches a search string, via the indexed key rather than a scan of names.
+
+    With pg_trgm this is a word-similarity match that tolerates typos;
+    otherwise the query's key must appear in the author's key as is.
+    """
+    key = name_key(query)
+    if not key:
+        return Author.objects.none()
+    if uses_pg_trgm():
+        # <% is word similarity: the query against the best-matching stretch of the name
+        return Author.objects.filter(pk__in=RawSQL(
+            f'SELECT id FROM {Author._meta.db_table} WHERE %s <%% name_key', (key,)
+        ))
+    return Author.objects.filter(name_key__contains=key)
+
+
+def similar_pairs(ids, threshold, index=None):
+    """
+    (id, other_id, similarity) for each author in `ids` and every other author at least `threshold` similar.
+
+    `index` is the TrigramIndex of all authors, required off PostgreSQL.
+    """
+    if uses_pg_trgm():
+        table = Author._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT set_limit(%s)', [threshold])
+            cursor.execute(
+                f'SELECT a.id, b.id, similarity(a.name_key, b.name_key) FROM {table} a '
+                f'JOIN {table} b ON a.name_key %% b.name_key AND a.id <> b.id '
+                f'WHERE a.id = ANY(%s)',
+                [list(ids)],
+            )
+            return cursor.fetchall()
+    keys = dict(Author.objects.filter(pk__in=ids).values_list('pk', 'name_key'))
+    return [
+        (author_id, other_id, score)
+        for author_id, key in keys.items()
+        for other_id, score in index.similar(key, threshold)
+        if other_id != author_id
+    ]
@@ -0,0 +1,38 @@
+"""
+Deployment checks for settings that only break once there are several workers.
+
+Run with `python manage.py check --deploy`.
+"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def ratelimit_cache_is_shared(app_configs, **kwargs):
+    backend = settings.CACHES.get(settings.RATELIMIT_CACHE, {}).get('BACKEND')
+    if settings.RATELIMIT_ENABLE and backend in LOCAL_CACHES:
+        return [Warning(
+            f'Rate limit counters are kept in a per-process cache ({backend}).',
+            hint='Each worker counts on its own, so the real limit is the worker count times the configured one. '
+                 'Set REDIS_URL to share the counters.',
+            id='library.W001',
+        )]
+    return []
+
+
+@register(Tags.caches, deploy=True)
+def session_cache_is_shared(app_configs, **kwargs):
+    backend = settings.CACHES.get(settings.SESSION_CACHE_ALIAS, {}).get('BACKEND')
+    if settings.SESSION_ENGINE == 'django.contrib.sessions.backends.cached_db' and backend in LOCAL_CACHES:
+        return [Warning(
+            f'cached_db sessions are cached per process ({backend}).',
+            hint='A logout or session change on one worker is not seen by the others until the entry expires. '
+                 'Set REDIS_URL, or use the db session engine.',
+            id='library.W002',
+        )]
+    return []
@@ -0,0 +1,435 @@
+"""
+Circulation: lending, renewing, returning and losing items.
+
+Every change is processed in a single transaction: borrows are loaded and
+written in bulk, fines are priced by the database (library.fines) and
+created with one bulk insert, each change is appended to the
+CirculationEvent ledger, and the materialized book/member counters are
+adjusted with F() expressions grouped by the size of the adjustment. The
+counters are never read-modified-written in Python, so they stay consistent
+with the ledger; `manage.py reconcile_counters` repairs any historical
+drift.
+
+Side effects (member e-mails, hold notifications) are not performed here:
+they are recorded as outbox events in the same transaction and delivered
+by `manage.py run_worker`.
+
+Titles with BookCopy items are lent copy by copy: only the copy row is
+locked and updated while lending, and the book's counters are refreshed
+from the copies as a cached aggregate after commit.
+"""
+import uuid
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Count, DateField, Exists, ExpressionWrapper, F, OuterRef, Q, QuerySet
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from . import fines, isbn, outbox
+from .models import Book, BookCopy, Member, Borrow, Fine, CirculationEvent, Reservation
+
+LOAN_PERIOD_DAYS = 14
+MAX_RENEWALS = 2
+FINE_DUE_DAYS = 7
+OPEN_BORROW_STATUSES = ['active', 'overdue']
+
+
+def _parse_borrow_id(value):
+    try:
+        return uuid.UUID(str(value))
+    except ValueError:
+        return None
+
+
+def _pks(borrows):
+    """Primary keys of a borrow queryset (as a subquery) or of a list of borrows"""
+    if isinstance(borrows, QuerySet):
+        return borrows.values('pk')
+    return [borrow.pk for borrow in borrows]
+
+
+def _grouped_by_delta(counter):
+    """Invert {pk: delta} into {delta: [pk, ...]} so each delta is one UPDATE"""
+    groups = defaultdict(list)
+    for pk, delta in counter.items():
+        groups[delta].append(pk)
+    return groups
+
+
+def _update_book_status(pks, now):
+    """Flip borrowed/available to match the (already adjusted) available_copies"""
+    Book.objects.filter(pk__in=pks, status='borrowed', available_copies__gt=0).update(
+        status='available', updated_date=now
+    )
+    Book.objects.filter(pk__in=pks, status='available', available_copies=0).update(
+        status='borrowed', updated_date=now
+    )
+
+
+def _adjust_book_counters(book_deltas, now):
+    for delta, pks in _grouped_by_delta(book_deltas).items():
+        Book.objects.filter(pk__in=pks).update(
+            available_copies=F('available_copies') + delta,
+            updated_date=now,
+        )
+    _update_book_status(list(book_deltas), now)
+
+
+def refresh_copy_counts(book_ids):
+    """
+    Recompute the cached total/available counts of copy-tracked books.
+
+    Books with BookCopy rows derive their counters from the copies instead
+    of adjusting them in the lending transaction, so lending two copies of
+    one title never waits on the same Book row lock.
+    """
+    now = timezone.now()
+    counts = BookCopy.objects.filter(book_id__in=book_ids).exclude(status='lost').order_by().values(
+        'book_id'
+    ).annotate(total=Count('pk'), available=Count('pk', filter=Q(status='available')))
+    refreshed = set()
+    for row in counts:
+        Book.objects.filter(pk=row['book_id']).update(
+            total_copies=row['total'], available_copies=row['available'], updated_date=now
+        )
+        refreshed.add(row['book_id'])
+    # Every copy of these is lost
+    Book.objects.filter(pk__in=set(book_ids) - refreshed, copies__isnull=False).update(
+        total_copies=0, available_copies=0, updated_date=now
+    )
+    _update_book_status(list(book_ids), now)
+
+
+def _refresh_copy_counts_on_commit(book_ids):
+    if book_ids:
+        book_ids = set(book_ids)
+        transaction.on_commit(lambda: refresh_copy_counts(book_ids))
+
+
+def _record_events(event_type, borrows):
+    CirculationEvent.objects.bulk_create([
+        CirculationEvent(
+            event_type=event_type,
+            borrow_ref=borrow.borrow_id,
+            book_id=borrow.book_id,
+            member_id=borrow.member_id,
+        )
+        for borrow in borrows
+    ])
+
+
+def _adjust_member_counters(member_deltas):
+    for delta, pks in _grouped_by_delta(member_deltas).items():
+        Member.objects.filter(pk__in=pks).update(
+            current_books_borrowed=F('current_books_borrowed') + delta
+        )
+
+
+def _release(borrows, copy_status, now):
+    """Free the copies or counters held by borrows that are being closed"""
+    copy_ids = [borrow.copy_id for borrow in borrows if borrow.copy_id]
+    BookCopy.objects.filter(pk__in=copy_ids).update(status=copy_status)
+    _refresh_copy_counts_on_commit(borrow.book_id for borrow in borrows if borrow.copy_id)
+    return Counter(borrow.book_id for borrow in borrows if not borrow.copy_id)
+
+
+def _claim_copy(book, claimed):
+    """Lock an available copy of `book` not already claimed, skipping copies locked by others"""
+    copy = BookCopy.objects.select_for_update(skip_locked=True).filter(
+        book=book, status='available'
+    ).exclude(pk__in=claimed).first()
+    if copy is not None:
+        claimed.add(copy.pk)
+    return copy
+
+
+def check_in(items):
+    """
+    Return a batch of borrowed items.
+
+    Each item is a borrow ID, a copy barcode or an ISBN (ISBN-10 or -13,
+    with or without hyphens, or the book's EAN); an ISBN resolves to the
+    oldest open borrow of that book not already claimed by the batch.
+    Returns one result dict per item, in input order.
+    """
+    items = [str(item).strip() for item in items if str(item).strip()]
+    borrow_ids = {item: _parse_borrow_id(item) for item in items}
+    codes = [item for item, pk in borrow_ids.items() if pk is None]
+    now = timezone.now()
+    results = []
+
+    with transaction.atomic():
+        # Fines are priced by the database as part of the same lookups
+        borrows = fines.with_fines(
+            Borrow.objects.select_related('book', 'copy').select_for_update(of=('self',)), now.date()
+        )
+        by_id = borrows.in_bulk([pk for pk in borrow_ids.values() if pk is not None])
+        by_barcode = {
+            borrow.copy.barcode: borrow
+            for borrow in borrows.filter(copy__barcode__in=codes, status__in=OPEN_BORROW_STATUSES)
+        }
+        canonical = {code: isbn.normalize(code) for code in codes}
+        by_isbn = defaultdict(list)
+        open_by_isbn = borrows.filter(
+            book__isbn_normalized__in=[value for value in canonical.values() if value],
+            status__in=OPEN_BORROW_STATUSES,
+        ).order_by('borrow_date')
+        for borrow in open_by_isbn:
+            by_isbn[borrow.book.isbn_normalized].append(borrow)
+
+        returned, new_fines = [], []
+        seen = set()
+        member_deltas = Counter()
+
+        for item in items:
+            pk = borrow_ids[item]
+            if pk is not None:
+                borrow = by_id.get(pk)
+            elif item in by_barcode:
+                borrow = by_barcode[item]
+            else:
+                queue = [borrow for borrow in by_isbn.get(canonical[item], []) if borrow.pk not in seen]
+                borrow = queue[0] if queue else None
+
+            if borrow is None:
+                results.append({'item': item, 'success': False, 'error': 'No open borrow found.'})
+                continue
+            if borrow.status == 'returned' or borrow.pk in seen:
+                results.append({'item': item, 'success': False, 'error': 'Already returned.'})
+                continue
+            if borrow.status not in OPEN_BORROW_STATUSES:
+                results.append({'item': item, 'success': False, 'error': 'Borrow is not open.'})
+                continue
+            seen.add(borrow.pk)
+
+            borrow.return_date = now
+            if borrow.is_overdue:
+                fine_amount = borrow.fine_due.quantize(fines.CENTS)
+                if fine_amount > 0:
+                    borrow.fine_amount = fine_amount
+                    new_fines.append(Fine(
+                        borrow=borrow,
+                        amount=fine_amount,
+                        reason='Late return',
+                        due_date=now.date() + timedelta(days=FINE_DUE_DAYS)
+                    ))
+            borrow.status = 'returned'
+            returned.append(borrow)
+            member_deltas[borrow.member_id] -= 1
+            results.append({
+                'item': item,
+                'success': True,
+                'borrow_id': str(borrow.borrow_id),
+                'book_id': borrow.book_id,
+                'fine_amount': str(borrow.fine_amount),
+            })
+
+        Borrow.objects.bulk_update(returned, ['return_date', 'status', 'fine_amount'])
+        Fine.objects.bulk_create(new_fines)
+        _record_events('return', returned)
+        outbox.enqueue_many('fine.created', [{'borrow_id': str(fine.borrow.borrow_id)} for fine in new_fines])
+        outbox.enqueue_many('borrow.returned', [
+            {'borrow_id': str(borrow.borrow_id), 'book_id': borrow.book_id} for borrow in returned
+        ])
+        _adjust_book_counters(_release(returned, 'available', now), now)
+        _adjust_member_counters(member_deltas)
+
+    return results
+
+
+def check_out(member, items):
+    """
+    Lend a batch of books to one member.
+
+    Each item is a copy barcode, an ISBN in any spelling, or a Book. A
+    barcode lends that exact copy; an ISBN or a Book lends any available
+    copy of a copy-tracked title, or draws on the bare counters of a title
+    without copies. A Book is found by primary key, so titles whose ISBN
+    has no canonical form can still be lent. Items beyond the member's
+    remaining allowance or a title's availability are reported as
+    failures; the rest are lent in one transaction.
+    """
+    items = [item if isinstance(item, Book) else str(item).strip() for item in items]
+    items = [item for item in items if item != '']
+    codes = [item for item in items if not isinstance(item, Book)]
+    now = timezone.now()
+    due_date = now.date() + timedelta(days=LOAN_PERIOD_DAYS)
+    results = []
+
+    with transaction.atomic():
+        member = Member.objects.select_for_update().get(pk=member.pk)
+        copies = {
+            copy.barcode: copy
+            for copy in BookCopy.objects.select_for_update(of=('self',)).select_related('book').filter(
+                barcode__in=codes
+            )
+        }
+        canonical = {item: isbn.normalize(item) for item in codes if item not in copies}
+        by_isbn = {
+            book.isbn_normalized: book
+            for book in Book.objects.filter(isbn_normalized__in=[value for value in canonical.values() if value])
+        }
+        books = {item: by_isbn[value] for item, value in canonical.items() if value in by_isbn}
+        by_pk = Book.objects.in_bulk([item.pk for item in items if isinstance(item, Book)])
+        books.update({item: by_pk[item.pk] for item in items if isinstance(item, Book) and item.pk in by_pk})
+        tracked = set(
+            BookCopy.objects.filter(book__in=books.values()).values_list('book_id', flat=True).distinct()
+        )
+        # Titles without copies still lend from the bare counters, under a row lock
+        locked = Book.objects.select_for_update().in_bulk(
+            [book.pk for book in books.values() if book.pk not in tracked]
+        )
+        books = {item: locked.get(book.pk, book) for item, book in books.items()}
+        remaining = member.max_books_allowed - member.current_books_borrowed
+        claimed = {copy.pk for copy in copies.values()}
+        lent_copies = set()
+        taken = Counter()
+        borrows = []
+
+        for item in items:
+            copy = None if isinstance(item, Book) else copies.get(item)
+            book = copy.book if copy else books.get(item)
+            if isinstance(item, Book):
+                item = item.isbn
+            if book is None:
+                results.append({'item': item, 'success': False, 'error': 'Unknown barcode or ISBN.'})
+                continue
+            if not member.is_active or remaining <= 0:
+                results.append({'item': item, 'success': False, 'error': 'Borrowing limit reached.'})
+                continue
+
+            if copy is not None:
+                if copy.status != 'available' or copy.pk in lent_copies:
+                    results.append({'item': item, 'success': False, 'error': 'Copy is not available.'})
+                    continue
+            elif book.pk in tracked:
+                copy = _claim_copy(book, claimed) if book.status == 'available' else None
+                if copy is None:
+                    results.append({'item': item, 'success': False, 'error': 'No copies available.'})
+                    continue
+            elif book.status != 'available' or book.available_copies - taken[book.pk] <= 0:
+                results.append({'item': item, 'success': False, 'error': 'No copies available.'})
+                continue
+
+            borrow = Borrow(book=book, copy=copy, member=member, due_date=due_date)
+            borrows.append(borrow)
+            if copy is None:
+                taken[book.pk] += 1
+            else:
+                lent_copies.add(copy.pk)
+            remaining -= 1
+            results.append({
+                'item': item,
+                'success': True,
+                'borrow_id': str(borrow.borrow_id),
+                'book_id': book.pk,
+                'barcode': copy.barcode if copy else None,
+                'due_date': due_date.isoformat(),
+            })
+
+        Borrow.objects.bulk_create(borrows)
+        _record_events('borrow', borrows)
+
+        # Copy-tracked titles: only the copy rows change in this transaction
+        BookCopy.objects.filter(pk__in=[b.copy_id for b in borrows if b.copy_id]).update(status='borrowed')
+        _refresh_copy_counts_on_commit(b.book_id for b in borrows if b.copy_id)
+        _adjust_book_counters(Counter({pk: -n for pk, n in taken.items()}), now)
+        if borrows:
+            _adjust_member_counters(Counter({member.pk: len(borrows)}))
+
+    return results
+
+
+def mark_lost(borrows):
+    """
+    Write off open borrows as lost.
+
+    The member's loan slot is freed and the lost copy is removed from the
+    book's total; available copies are unchanged since it was already out.
+    Returns the number of borrows marked.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        lost = list(
+            Borrow.objects.select_for_update().filter(
+                pk__in=_pks(borrows), status__in=OPEN_BORROW_STATUSES
+            )
+        )
+        if not lost:
+            return 0
+        Borrow.objects.filter(pk__in=[borrow.pk for borrow in lost]).update(status='lost')
+        _record_events('lost', lost)
+
+        book_deltas = _release(lost, 'lost', now)
+        for delta, pks in _grouped_by_delta(book_deltas).items():
+            Book.objects.filter(pk__in=pks).update(
+                total_copies=Greatest(F('total_copies') - delta, 0),
+                updated_date=now,
+            )
+        _adjust_member_counters(Counter({
+            member_id: -n for member_id, n in Counter(borrow.member_id for borrow in lost).items()
+        }))
+    return len(lost)
+
+
+def _shift_due_date(days):
+    return ExpressionWrapper(F('due_date') + timedelta(days=days), output_field=DateField())
+
+
+def _has_active_reservation():
+    return Exists(Reservation.objects.filter(book=OuterRef('book'), status='active'))
+
+
+def renewal_block_reason(borrow):
+    """Why a borrow cannot be renewed, or None if it can"""
+    if borrow.status != 'active':
+        return 'Only active borrows can be renewed.'
+    if borrow.is_overdue:
+        return 'Overdue borrows cannot be renewed. Please return the book.'
+    if borrow.renewal_count >= MAX_RENEWALS:
+        return f'This borrow has already been renewed {MAX_RENEWALS} times.'
+    if Reservation.objects.filter(book_id=borrow.book_id, status='active').exists():
+        return 'Another member has reserved this book.'
+    return None
+
+
+def renew(borrows):
+    """
+    Renew every eligible borrow in `borrows` by one loan period.
+
+    Eligibility (active, not overdue, under MAX_RENEWALS, no active
+    reservation on the book) is checked in the database with an EXISTS
+    subquery, and the due dates are pushed out with a single UPDATE.
+    Returns the primary keys of the renewed borrows.
+    """
+    today = timezone.now().date()
+    with transaction.atomic():
+        renewable = list(
+            Borrow.objects.select_for_update().filter(
+                pk__in=_pks(borrows),
+                status='active',
+                due_date__gte=today,
+                renewal_count__lt=MAX_RENEWALS,
+            ).exclude(_has_active_reservation())
+        )
+        if not renewable:
+            return []
+        pks = [borrow.pk for borrow in renewable]
+        Borrow.objects.filter(pk__in=pks).update(
+            due_date=_shift_due_date(LOAN_PERIOD_DAYS),
+            renewal_count=F('renewal_count') + 1,
+        )
+        _record_events('renew', renewable)
+    return pks
+
+
+def extend_due_dates(borrows, days):
+    """
+    Push the due date of every open borrow in `borrows` out by `days`.
+
+    Meant for closures: it ignores renewal limits and reservations, does not
+    count as a renewal, and runs as one UPDATE. Returns the rows changed.
+    """
+    return borrows.filter(status__in=OPEN_BORROW_STATUSES).update(due_date=_shift_due_date(days))
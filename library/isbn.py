@@ -0,0 +1,97 @@
+"""
+ISBN parsing and normalization.
+
+Every valid ISBN has one canonical form: the 13-digit ISBN without
+separators. ISBN-10s convert to it by prefixing 978 and recomputing the
+check digit, and scanned EAN-13 barcodes of books are already in it (a
+5-digit price add-on after the EAN is dropped). Book.isbn_normalized stores
+the canonical form, so any spelling of an ISBN is found with one exact,
+indexed lookup.
+"""
+import re
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+SEPARATORS = re.compile(r'[\s\-‐‑–]')
+ISBN_SHAPE = re.compile(r'^(?:\d{9}[\dX]|97[89]\d{10}|97[89]\d{15})$')
+
+
+def compact(value):
+    """Strip an 'ISBN' prefix, spaces and hyphens; upper-case the X check digit"""
+    value = SEPARATORS.sub('', str(value)).upper()
+    if value.startswith('ISBN'):
+        value = value[4:].lstrip(':')
+    return value
+
+
+def _isbn10_check(digits):
+    check = (11 - sum((10 - i) * int(d) for i, d in enumerate(digits[:9])) % 11) % 11
+    return 'X' if check == 10 else str(check)
+
+
+def _isbn13_check(digits):
+    return str((10 - sum(int(d) * (3 if i % 2 else 1) for i, d in enumerate(digits[:12])) % 10) % 10)
+
+
+def is_valid(value):
+    """Whether `value` is a valid ISBN-10 or ISBN-13 (separators allowed)"""
+    value = compact(value)
+    if re.fullmatch(r'\d{9}[\dX]', value):
+        return value[9] == _isbn10_check(value)
+    if re.fullmatch(r'97[89]\d{10}', value):
+        return value[12] == _isbn13_check(value)
+    return False
+
+
+def to_isbn13(value):
+    """ISBN-13 for a valid ISBN-10 (returned unchanged if already 13 digits)"""
+    value = compact(value)
+    if len(value) == 13:
+        return value
+    body = '978' + value[:9]
+    return body + _isbn13_check(body)
+
+
+def to_isbn10(value):
+    """ISBN-10 for a 978-prefixed ISBN-13, or None if it has none"""
+    value = compact(value)
+    if len(value) == 10:
+        return value
+    if not value.startswith('978'):
+        return None
+    body = value[3:12]
+    return body + _isbn10_check(body)
+
+
+def normalize(value):
+    """Canonical ISBN-13 for any spelling of a valid ISBN or book EAN, else None"""
+    value = compact(value)
+    if len(value) == 18 and value[:3] in ('978', '979'):
+        value = value[:13]
+    return to_isbn13(value) if is_valid(value) else None
+
+
+def looks_like_isbn(value):
+    """Whether a search string is shaped like an ISBN or book EAN (checksum not checked)"""
+    return bool(ISBN_SHAPE.match(compact(value)))
+
+
+def lookup(value, prefix=''):
+    """
+    Exact-match Q for an ISBN-shaped search string, or None for other text.
+
+    Valid ISBNs match the canonical column; ISBN-shaped strings with a bad
+    check digit still match a book stored with exactly that ISBN.
+    """
+    if not looks_like_isbn(value):
+        return None
+    canonical = normalize(value)
+    if canonical:
+        return Q(**{f'{prefix}isbn_normalized': canonical})
+    return Q(**{f'{prefix}isbn': compact(value)})
+
+
+def validate_isbn(value):
+    if not is_valid(value):
+        raise ValidationError('Enter a valid ISBN-10 or ISBN-13.', code='invalid_isbn')
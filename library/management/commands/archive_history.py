@@ -0,0 +1,34 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from library import archive
+
+
+class Command(BaseCommand):
+    help = 'Move closed borrows, fines, payments and reservations into the archive tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.ARCHIVE_RETENTION_DAYS,
+            help='Keep closed records younger than this many days in the live tables'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='Only count what would move')
+
+    def handle(self, *args, **options):
+        if options['dry_run']:
+            cutoff = timezone.now() - timedelta(days=options['days'])
+            counts = {
+                table: queryset.values('pk').distinct().count()
+                for table, queryset in archive.closed_querysets(cutoff).items()
+            }
+            verb = 'Would archive'
+        else:
+            counts = archive.archive_closed(options['days'], options['batch_size'])
+            verb = 'Archived'
+
+        summary = ', '.join(f'{count} {table}' for table, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'{verb} {summary}.'))
@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from library import recommendations
+
+
+class Command(BaseCommand):
+    help = "Recompute 'readers also borrowed' neighbours from borrow and review history"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help='Recompute every book instead of only those with activity since the last run'
+        )
+        parser.add_argument('--top-k', type=int, default=recommendations.DEFAULT_TOP_K)
+        parser.add_argument(
+            '--chunk-size', type=int, default=recommendations.DEFAULT_CHUNK_SIZE,
+            help='Books per similarity block; bounds peak memory'
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        updated = recommendations.build(
+            full=options['full'], top_k=options['top_k'], chunk_size=options['chunk_size']
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f'Updated recommendations for {updated} book(s) in {time.monotonic() - started:.1f}s.'
+        ))
@@ -0,0 +1,56 @@
+import json
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library import circulation
+from library.models import Member
+
+
+class Command(BaseCommand):
+    help = 'Check a batch of items in or out in a single transaction'
+
+    def add_arguments(self, parser):
+        parser.add_argument('action', choices=['checkin', 'checkout'])
+        parser.add_argument(
+            'items', nargs='*',
+            help='Borrow IDs, copy barcodes or ISBNs to check in; barcodes or ISBNs to check out'
+        )
+        parser.add_argument(
+            '--file', dest='path',
+            help="Read items from a file, one per line ('-' for stdin)"
+        )
+        parser.add_argument('--member', help='Member ID to lend to (checkout only)')
+        parser.add_argument('--json', action='store_true', help='Print results as JSON')
+
+    def handle(self, *args, **options):
+        items = list(options['items'])
+        if options['path']:
+            stream = sys.stdin if options['path'] == '-' else open(options['path'])
+            with stream:
+                items.extend(line.strip() for line in stream if line.strip())
+        if not items:
+            raise CommandError('No items given.')
+
+        if options['action'] == 'checkin':
+            results = circulation.check_in(items)
+        else:
+            if not options['member']:
+                raise CommandError('--member is required for checkout.')
+            try:
+                member = Member.objects.get(member_id=options['member'])
+            except Member.DoesNotExist:
+                raise CommandError(f"Unknown member '{options['member']}'.")
+            results = circulation.check_out(member, items)
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for result in results:
+            if result['success']:
+                self.stdout.write(f"ok    {result['item']}  borrow {result['borrow_id']}")
+            else:
+                self.stdout.write(self.style.WARNING(f"fail  {result['item']}  {result['error']}"))
+        processed = sum(1 for result in results if result['success'])
+        self.stdout.write(self.style.SUCCESS(f'{processed}/{len(results)} items processed.'))
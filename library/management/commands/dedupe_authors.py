@@ -0,0 +1,128 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count
+
+from library import authors, signals
+from library.models import Author, Book
+
+
+class UnionFind:
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        self.parent.setdefault(item, item)
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, a, b):
+        self.parent[self.find(a)] = self.find(b)
+
+    def groups(self):
+        groups = {}
+        for item in self.parent:
+            groups.setdefault(self.find(item), []).append(item)
+        return [members for members in groups.values() if len(members) > 1]
+
+
+class Command(BaseCommand):
+    help = 'Cluster near-duplicate authors by trigram similarity of their names and merge each cluster'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--threshold', type=float, default=0.7,
+            help='Minimum trigram similarity of normalized names (identical keys always match)'
+        )
+        parser.add_argument('--batch-size', type=int, default=500)
+        parser.add_argument('--dry-run', action='store_true', help='List the clusters without merging')
+
+    def handle(self, *args, **options):
+        # Keys of authors saved before name_key existed, or bulk-loaded
+        stale = [
+            author for author in Author.objects.only('id', 'name', 'name_key').iterator()
+            if author.name_key != authors.name_key(author.name)
+        ]
+        for author in stale:
+            author.name_key = authors.name_key(author.name)
+        Author.objects.bulk_update(stale, ['name_key'], batch_size=options['batch_size'])
+
+        info = {
+            row['pk']: row for row in Author.objects.annotate(book_count=Count('books')).values(
+                'pk', 'name', 'email', 'book_count'
+            )
+        }
+        index = None
+        if not authors.uses_pg_trgm():
+            index = authors.TrigramIndex(Author.objects.values_list('pk', 'name_key').iterator())
+
+        clusters = UnionFind()
+        ids = sorted(info)
+        for start in range(0, len(ids), options['batch_size']):
+            batch = ids[start:start + options['batch_size']]
+            for author_id, other_id, _ in authors.similar_pairs(batch, options['threshold'], index):
+                a, b = info[author_id]['email'], info[other_id]['email']
+                # Two different e-mail addresses mean two different people
+                if a and b and a.lower() != b.lower():
+                    continue
+                clusters.union(author_id, other_id)
+
+        merged = 0
+        groups = clusters.groups()
+        for start in range(0, len(groups), options['batch_size']):
+            batch = []
+            for group in groups[start:start + options['batch_size']]:
+                # Keep the author with the most books, then the oldest
+                group.sort(key=lambda pk: (-info[pk]['book_count'], pk))
+                batch.append((group[0], group[1:]))
+                self.stdout.write(
+                    f"{info[group[0]]['name']!r} <- " + ', '.join(repr(info[pk]['name']) for pk in group[1:])
+                )
+            if not options['dry_run']:
+                self.merge(batch)
+            merged += sum(len(duplicates) for _, duplicates in batch)
+
+        verb = 'Would merge' if options['dry_run'] else 'Merged'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {merged} duplicate(s) into {len(groups)} author(s).'))
+
+    @transaction.atomic
+    def merge(self, batch):
+        """Repoint book links of each cluster's duplicates to its survivor, then delete the duplicates"""
+        through = Book.authors.through
+        survivor_of = {duplicate: survivor for survivor, duplicates in batch for duplicate in duplicates}
+        survivors = [survivor for survivor, _ in batch]
+        links = through.objects.filter(author_id__in=[*survivor_of, *survivors]).order_by('author_id')
+        kept = {(link.book_id, link.author_id) for link in links if link.author_id in survivors}
+
+        moved, dropped = [], []
+        for link in links:
+            if link.author_id not in survivor_of:
+                continue
+            target = (link.book_id, survivor_of[link.author_id])
+            if target in kept:
+                dropped.append(link.pk)
+            else:
+                kept.add(target)
+                link.author_id = target[1]
+                moved.append(link)
+        through.objects.filter(pk__in=dropped).delete()
+        through.objects.bulk_update(moved, ['author_id'])
+        # Bulk writes send no signals; the pages of these books show the survivor now
+        signals.touch(Book.objects.filter(pk__in={link.book_id for link in links}))
+
+        # Fill gaps on the survivor from its duplicates before they go
+        duplicates = {author.pk: author for author in Author.objects.filter(pk__in=survivor_of)}
+        updated = []
+        for survivor in Author.objects.filter(pk__in=survivors):
+            changed = False
+            for duplicate_id in (pk for pk, target in survivor_of.items() if target == survivor.pk):
+                duplicate = duplicates[duplicate_id]
+                for field in ('email', 'bio', 'birth_date'):
+                    if not getattr(survivor, field) and getattr(duplicate, field):
+                        setattr(survivor, field, getattr(duplicate, field))
+                        changed = True
+            if changed:
+                updated.append(survivor)
+        Author.objects.filter(pk__in=survivor_of).delete()
+        Author.objects.bulk_update(updated, ['email', 'bio', 'birth_date'])
@@ -0,0 +1,36 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from library import circulation
+from library.models import Borrow
+
+
+class Command(BaseCommand):
+    help = 'Push out the due date of open borrows, e.g. to cover a library closure'
+
+    def add_arguments(self, parser):
+        parser.add_argument('days', type=int, help='Number of days to add')
+        parser.add_argument(
+            '--due-from', type=date.fromisoformat,
+            help='Only borrows due on or after this date (YYYY-MM-DD)'
+        )
+        parser.add_argument(
+            '--due-to', type=date.fromisoformat,
+            help='Only borrows due on or before this date (YYYY-MM-DD)'
+        )
+
+    def handle(self, *args, **options):
+        if options['days'] <= 0:
+            raise CommandError('days must be positive.')
+
+        borrows = Borrow.objects.all()
+        if options['due_from']:
+            borrows = borrows.filter(due_date__gte=options['due_from'])
+        if options['due_to']:
+            borrows = borrows.filter(due_date__lte=options['due_to'])
+
+        count = circulation.extend_due_dates(borrows, options['days'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Extended {count} due date(s) by {options['days']} day(s)."
+        ))
@@ -0,0 +1,170 @@
+import csv
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from library import member_ids
+from library.models import Member
+
+TIERS = {choice for choice, _ in Member.TIER_CHOICES}
+
+
+def _init_worker(settings_module):
+    # Spawned workers start without Django configured; forked ones already have it
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', settings_module)
+    import django
+    django.setup()
+
+
+def _hash_passwords(passwords):
+    # make_password(None) is an unusable password and costs nothing
+    return [make_password(password) for password in passwords]
+
+
+class Command(BaseCommand):
+    help = 'Create users and member profiles in bulk from a CSV roster, hashing passwords in a process pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'roster',
+            help='CSV file ("-" for stdin) with a username column and optionally email, first_name, last_name, '
+                 'password, phone, address, birth_date, tier, membership_expiry, max_books_allowed'
+        )
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Rows per bulk insert')
+        parser.add_argument('--workers', type=int, help='Hashing processes (default: CPU count)')
+        parser.add_argument(
+            '--unusable-passwords', action='store_true',
+            help='Ignore the password column; members set a password through a reset link'
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Validate the roster without writing')
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.expiry = timezone.now().date() + timedelta(days=settings.MEMBERSHIP_DAYS)
+        self.seen = set()
+        self.created = self.skipped = 0
+        workers = options['workers'] or os.cpu_count() or 1
+
+        roster = sys.stdin if options['roster'] == '-' else open(options['roster'], newline='', encoding='utf-8-sig')
+        with roster:
+            reader = csv.DictReader(roster)
+            if 'username' not in (reader.fieldnames or ()):
+                raise CommandError('The roster needs a "username" column.')
+            chunks = self.chunks(reader)
+            if options['dry_run']:
+                valid = sum(len(rows) for rows in chunks)
+                self.stdout.write(self.style.SUCCESS(f'{valid} row(s) valid, {self.skipped} skipped.'))
+                return
+
+            with ProcessPoolExecutor(
+                workers, initializer=_init_worker, initargs=(os.environ['DJANGO_SETTINGS_MODULE'],)
+            ) as pool:
+                # Hash the next chunk while the current one is written
+                pending = None
+                for rows in chunks:
+                    hashing = self.hash(pool, rows, workers)
+                    if pending:
+                        self.write(*pending)
+                    pending = rows, hashing
+                if pending:
+                    self.write(*pending)
+
+        self.stdout.write(self.style.SUCCESS(f'Created {self.created} member(s); skipped {self.skipped} row(s).'))
+
+    def chunks(self, reader):
+        """Lists of cleaned rows, skipping invalid rows and usernames that are taken"""
+        size = self.options['chunk_size']
+        numbered = enumerate(reader, start=2)
+        while True:
+            batch = list(islice(numbered, size))
+            if not batch:
+                return
+            usernames = [row.get('username', '').strip() for _, row in batch]
+            taken = set(User.objects.filter(username__in=usernames).values_list('username', flat=True))
+            rows = []
+            for line, row in batch:
+                try:
+                    cleaned = self.clean(row)
+                except ValueError as exc:
+                    self.skip(line, exc)
+                    continue
+                if cleaned['username'] in taken or cleaned['username'] in self.seen:
+                    self.skip(line, f'username {cleaned["username"]!r} already exists')
+                    continue
+                self.seen.add(cleaned['username'])
+                rows.append(cleaned)
+            if rows:
+                yield rows
+
+    def clean(self, row):
+        row = {key: (value or '').strip() for key, value in row.items() if key}
+        if not row.get('username'):
+            raise ValueError('missing username')
+        tier = row.get('tier') or 'standard'
+        if tier not in TIERS:
+            raise ValueError(f'unknown tier {tier!r}')
+        return {
+            'username': row['username'][:150],
+            'email': row.get('email', ''),
+            'first_name': row.get('first_name', '')[:150],
+            'last_name': row.get('last_name', '')[:150],
+            'password': None if self.options['unusable_passwords'] else row.get('password') or None,
+            'phone': row.get('phone', '')[:20],
+            'address': row.get('address', ''),
+            'birth_date': date.fromisoformat(row['birth_date']) if row.get('birth_date') else None,
+            'tier': tier,
+            'membership_expiry': (
+                date.fromisoformat(row['membership_expiry']) if row.get('membership_expiry') else self.expiry
+            ),
+            'max_books_allowed': int(row.get('max_books_allowed') or 5),
+        }
+
+    def skip(self, line, reason):
+        self.skipped += 1
+        self.stderr.write(f'line {line}: {reason}')
+
+    def hash(self, pool, rows, workers):
+        """Futures hashing the chunk's passwords, one contiguous slice per worker"""
+        passwords = [row['password'] for row in rows]
+        step = -(-len(passwords) // workers)
+        return [pool.submit(_hash_passwords, passwords[i:i + step]) for i in range(0, len(passwords), step)]
+
+    def write(self, rows, hashing):
+        hashed = [password for future in hashing for password in future.result()]
+        # Reserved before the insert so the sequence row is not locked for the whole chunk
+        ids = member_ids.allocate(len(rows))
+        try:
+            with transaction.atomic():
+                users = User.objects.bulk_create([
+                    User(username=row['username'], email=row['email'], first_name=row['first_name'],
+                         last_name=row['last_name'], password=password)
+                    for row, password in zip(rows, hashed)
+                ])
+                if users[0].pk is None:
+                    # Backends that cannot return IDs from a bulk insert
+                    pks = dict(User.objects.filter(username__in=[user.username for user in users])
+                               .values_list('username', 'pk'))
+                    for user in users:
+                        user.pk = pks[user.username]
+                Member.objects.bulk_create([
+                    Member(user=user, member_id=member_id, phone=row['phone'], address=row['address'],
+                           birth_date=row['birth_date'], tier=row['tier'],
+                           membership_expiry=row['membership_expiry'], max_books_allowed=row['max_books_allowed'])
+                    for user, member_id, row in zip(users, ids, rows)
+                ])
+        except IntegrityError as exc:
+            raise CommandError(
+                f'Chunk starting at {rows[0]["username"]!r} failed ({exc}); {self.created} member(s) were created '
+                f'before it. Fix the roster and re-run: existing usernames are skipped.'
+            )
+        self.created += len(rows)
+        self.stdout.write(f'{self.created} member(s) created')
@@ -0,0 +1,42 @@
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from library.isbn import normalize
+from library.models import Book
+
+
+class Command(BaseCommand):
+    help = 'Fill in the canonical ISBN-13 column for books saved before it existed or bulk-loaded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Report without writing')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        claimed = dict(Book.objects.exclude(isbn_normalized='').values_list('isbn_normalized', 'pk'))
+        changed, invalid, duplicates = [], [], []
+        for book in Book.objects.only('id', 'isbn', 'isbn_normalized', 'updated_date').order_by('pk').iterator():
+            canonical = normalize(book.isbn) or ''
+            if not canonical:
+                invalid.append(book.isbn)
+            elif claimed.setdefault(canonical, book.pk) != book.pk:
+                # Another book already holds this ISBN in a different spelling
+                duplicates.append((book.isbn, canonical))
+                canonical = ''
+            if canonical != book.isbn_normalized:
+                book.isbn_normalized = canonical
+                # Picked up by the availability feed's next delta
+                book.updated_date = now
+                changed.append(book)
+
+        if not options['dry_run']:
+            Book.objects.bulk_update(changed, ['isbn_normalized', 'updated_date'], batch_size=options['batch_size'])
+        for value in invalid:
+            self.stdout.write(self.style.WARNING(f'invalid    {value}'))
+        for value, canonical in duplicates:
+            self.stdout.write(self.style.WARNING(f'duplicate  {value} (= {canonical})'))
+        verb = 'Would update' if options['dry_run'] else 'Updated'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {len(changed)} book(s); {len(invalid)} invalid, {len(duplicates)} duplicate ISBN(s).'
+        ))
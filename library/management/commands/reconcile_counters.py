@@ -0,0 +1,76 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from library.circulation import OPEN_BORROW_STATUSES
+from library.models import Book, BookCopy, Borrow, Member
+
+
+class Command(BaseCommand):
+    help = 'Recompute member and book circulation counters from open borrows and copies, and fix drift'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Report drift without fixing it')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        open_borrows = Borrow.objects.filter(status__in=OPEN_BORROW_STATUSES).order_by()
+
+        with transaction.atomic():
+            # One grouped query per table gives the true counts
+            by_member = dict(
+                open_borrows.values_list('member_id').annotate(n=Count('pk'))
+            )
+            by_book = dict(
+                open_borrows.values_list('book_id').annotate(n=Count('pk'))
+            )
+            # Copy-tracked titles take their counts from the copies instead
+            by_copies = {
+                book_id: (total, available)
+                for book_id, total, available in BookCopy.objects.exclude(status='lost').order_by().values_list(
+                    'book_id'
+                ).annotate(total=Count('pk'), available=Count('pk', filter=Q(status='available')))
+            }
+
+            members = []
+            for member in Member.objects.only('id', 'current_books_borrowed').iterator():
+                expected = by_member.get(member.id, 0)
+                if member.current_books_borrowed != expected:
+                    member.current_books_borrowed = expected
+                    members.append(member)
+
+            books = []
+            now = timezone.now()
+            fields = ['id', 'total_copies', 'available_copies', 'status']
+            for book in Book.objects.only(*fields).iterator():
+                total = book.total_copies
+                if book.id in by_copies:
+                    total, available = by_copies[book.id]
+                else:
+                    available = max(total - by_book.get(book.id, 0), 0)
+                status = book.status
+                if status == 'borrowed' and available > 0:
+                    status = 'available'
+                elif status == 'available' and available == 0:
+                    status = 'borrowed'
+                if (book.total_copies, book.available_copies, book.status) != (total, available, status):
+                    book.total_copies = total
+                    book.available_copies = available
+                    book.status = status
+                    book.updated_date = now
+                    books.append(book)
+
+            if not options['dry_run']:
+                Member.objects.bulk_update(
+                    members, ['current_books_borrowed'], batch_size=options['batch_size']
+                )
+                Book.objects.bulk_update(
+                    books, ['total_copies', 'available_copies', 'status', 'updated_date'],
+                    batch_size=options['batch_size']
+                )
+
+        verb = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} drift on {len(members)} member(s) and {len(books)} book(s).'
+        ))
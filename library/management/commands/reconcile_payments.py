@@ -0,0 +1,67 @@
+from datetime import date, datetime, time, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from library import reconciliation
+
+
+def _start_of(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
+
+
+class Command(BaseCommand):
+    help = 'Check Stripe payments against the gateway and flag or fix amounts, missing charges and orphaned fines'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ledger',
+            help='JSON Lines file of PaymentIntent objects to reconcile against instead of the Stripe API'
+        )
+        parser.add_argument('--since', type=date.fromisoformat, help='First day to check (default: 31 days ago)')
+        parser.add_argument('--until', type=date.fromisoformat, help='Day after the last to check (default: tomorrow)')
+        parser.add_argument(
+            '--fix', action='store_true',
+            help='Take amounts from the gateway, fail payments without a successful charge and relink orphaned fines'
+        )
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        since = _start_of(options['since'] or today - timedelta(days=31))
+        until = _start_of(options['until'] or today + timedelta(days=1))
+        if since >= until:
+            raise CommandError('--since must be before --until.')
+
+        fetch_from = since - reconciliation.SLACK
+        if options['ledger']:
+            charges = reconciliation.ledger_charges(options['ledger'], fetch_from, until)
+        else:
+            charges = reconciliation.stripe_charges(fetch_from, until)
+        report = reconciliation.reconcile(
+            charges, since, until, fix=options['fix'], batch_size=options['batch_size']
+        )
+
+        for payment_id, recorded, charged in report['amount_mismatch']:
+            self.stdout.write(self.style.WARNING(f'amount     {payment_id}: recorded ${recorded}, charged ${charged}'))
+        for payment_id in report['missing']:
+            self.stdout.write(self.style.WARNING(f'missing    {payment_id}: no successful charge at the gateway'))
+        for payment_id in report['duplicate']:
+            self.stdout.write(self.style.WARNING(f'duplicate  {payment_id}: charge already recorded'))
+        for charge in report['unrecorded']:
+            self.stdout.write(self.style.WARNING(
+                f"unrecorded {charge['id']}: ${reconciliation.charged_amount(charge)} charged, no payment "
+                f"(member {charge.get('metadata', {}).get('member_id', '?')})"
+            ))
+        for fine_id in report['orphaned_fines']:
+            self.stdout.write(self.style.WARNING(f'orphaned   fine {fine_id}: paid, no payment found'))
+
+        if options['fix']:
+            fines = f"relinked {report['relinked_fines']} fine(s), reopened {report['reopened_fines']}"
+        else:
+            fines = f"{report['relinked_fines']} orphaned fine(s) can be relinked with --fix"
+        self.stdout.write(self.style.SUCCESS(
+            f"{since:%Y-%m-%d}..{until:%Y-%m-%d}: {len(report['amount_mismatch'])} amount mismatch(es), "
+            f"{len(report['missing'])} missing, {len(report['duplicate'])} duplicate, "
+            f"{len(report['unrecorded'])} unrecorded charge(s); {fines}."
+        ))
@@ -0,0 +1,46 @@
+import signal
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from library import outbox
+
+
+class Command(BaseCommand):
+    help = 'Deliver outbox events (e-mails, hold notifications) until stopped'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--interval', type=float, default=2.0, help='Seconds to sleep when the outbox is empty')
+        parser.add_argument('--once', action='store_true', help='Drain what is pending, then exit')
+        parser.add_argument(
+            '--keep-days', type=int, default=7,
+            help='Delete events processed more than this many days ago (checked hourly)'
+        )
+
+    def handle(self, *args, **options):
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        delivered = 0
+        next_purge = 0
+        while self.running:
+            if time.monotonic() >= next_purge:
+                outbox.purge_processed(options['keep_days'])
+                next_purge = time.monotonic() + 3600
+            # A long-lived process must not hold on to a connection the server dropped
+            close_old_connections()
+            taken = outbox.drain(options['batch_size'])
+            delivered += taken
+            if taken < options['batch_size']:
+                if options['once']:
+                    break
+                time.sleep(options['interval'])
+
+        self.stdout.write(self.style.SUCCESS(f'Processed {delivered} event(s).'))
+
+    def stop(self, signum, frame):
+        # Finish the current batch, then exit
+        self.running = False
@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+from django.db.models.functions import TruncDate
+from django.template.loader import get_template
+from django.utils import timezone
+
+from library.circulation import OPEN_BORROW_STATUSES
+from library.models import Borrow, Notice, Reservation
+
+SUBJECTS = {
+    'due_soon': 'Reminder: "{title}" is due soon',
+    'overdue': 'Overdue: "{title}"',
+    'hold_expiring': 'Your reservation for "{title}" is about to expire',
+}
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+class Command(BaseCommand):
+    help = 'E-mail due-soon, overdue and expiring-hold reminders that have not been sent yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--due-soon-days', type=int, default=settings.REMINDER_DUE_SOON_DAYS,
+            help='Remind about borrows due within this many days'
+        )
+        parser.add_argument('--batch-size', type=int, default=settings.REMINDER_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Count reminders without sending')
+
+    def handle(self, *args, **options):
+        now = timezone.now()
+        today = now.date()
+        batch_size = options['batch_size']
+        # Compile each template once for the whole run
+        self.templates = {kind: get_template(f'library/email/{kind}.txt') for kind in SUBJECTS}
+
+        open_borrows = Borrow.objects.filter(status__in=OPEN_BORROW_STATUSES)
+        borrow_sent = Notice.objects.filter(borrow=OuterRef('pk'), reference_date=OuterRef('due_date'))
+        querysets = {
+            'due_soon': open_borrows.filter(
+                due_date__range=(today, today + timedelta(days=options['due_soon_days']))
+            ),
+            'overdue': open_borrows.filter(due_date__lt=today),
+            'hold_expiring': Reservation.objects.filter(
+                status='active', expiry_date__range=(now, now + timedelta(days=1))
+            ).annotate(expiry_day=TruncDate('expiry_date')),
+        }
+
+        # One connection for every chunk instead of a new SMTP session per send_messages()
+        self.connection = None if options['dry_run'] else get_connection()
+        if self.connection is not None:
+            self.connection.open()
+        total = 0
+        for kind, queryset in querysets.items():
+            if kind == 'hold_expiring':
+                sent = Notice.objects.filter(
+                    reservation=OuterRef('pk'), kind=kind,
+                    reference_date=OuterRef('expiry_day'),
+                )
+            else:
+                sent = borrow_sent.filter(kind=kind)
+            # Collect keys first so writes to Notice never race an open cursor
+            pks = list(queryset.exclude(Exists(sent)).values_list('pk', flat=True))
+            for chunk in _chunks(pks, batch_size):
+                records = queryset.model.objects.filter(pk__in=chunk).select_related(
+                    'book', 'member__user'
+                )
+                total += self.send(kind, records, today, options['dry_run'])
+
+        if self.connection is not None:
+            self.connection.close()
+        verb = 'Would send' if options['dry_run'] else 'Sent'
+        self.stdout.write(self.style.SUCCESS(f'{verb} {total} reminder(s).'))
+
+    def send(self, kind, records, today, dry_run):
+        """Render and send one chunk of reminders over the shared connection"""
+        emails, notices = [], []
+        for record in records:
+            member = record.member
+            if not member.user.email:
+                continue
+            context = {'name': member.user.get_full_name() or member.user.username,
+                       'book_title': record.book.title}
+            if kind == 'hold_expiring':
+                context['expiry_date'] = record.expiry_date
+                reference_date = timezone.localdate(record.expiry_date)
+                notice = Notice(kind=kind, member=member, reservation=record,
+                                reference_date=reference_date)
+            else:
+                context['due_date'] = record.due_date
+                context['days_overdue'] = (today - record.due_date).days
+                notice = Notice(kind=kind, member=member, borrow=record,
+                                reference_date=record.due_date)
+            emails.append(EmailMessage(
+                subject=SUBJECTS[kind].format(title=record.book.title),
+                body=self.templates[kind].render(context),
+                to=[member.user.email],
+                connection=self.connection,
+            ))
+            notices.append(notice)
+
+        if dry_run:
+            return len(emails)
+        self.connection.send_messages(emails)
+        Notice.objects.bulk_create(notices, ignore_conflicts=True)
+        return len(emails)
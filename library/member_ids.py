@@ -0,0 +1,45 @@
+"""
+Collision-free member ID allocation.
+
+Member IDs are 'M' followed by nine digits, taken from a counter row in
+MemberIdSequence. `allocate(n)` reserves a block of n consecutive numbers
+with a single locked increment, so concurrent registrations and bulk
+imports never hand out the same ID and never retry on a unique violation.
+Numbers are not reused: a block reserved by a transaction that later fails
+leaves a gap.
+
+The counter row is created on first use, starting past the highest ID of
+this shape already in the table. IDs of this shape are reserved for the
+sequence; IDs typed in by hand should use another format.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from .models import Member, MemberIdSequence
+
+SEQUENCE = 'member'
+PREFIX = 'M'
+DIGITS = 9
+
+
+def format_member_id(number):
+    return f'{PREFIX}{number:0{DIGITS}d}'
+
+
+def _first_free():
+    """Number after the highest sequence-shaped member ID already stored"""
+    highest = Member.objects.filter(
+        member_id__regex=rf'^{PREFIX}[0-9]{{{DIGITS}}}$'
+    ).order_by('-member_id').values_list('member_id', flat=True).first()
+    return int(highest[len(PREFIX):]) + 1 if highest else 1
+
+
+@transaction.atomic
+def allocate(count):
+    """Reserve `count` consecutive member IDs and return them in order"""
+    sequence, _ = MemberIdSequence.objects.select_for_update().get_or_create(
+        name=SEQUENCE, defaults={'next_value': _first_free}
+    )
+    start = sequence.next_value
+    MemberIdSequence.objects.filter(pk=sequence.pk).update(next_value=F('next_value') + count)
+    return [format_member_id(number) for number in range(start, start + count)]
@@ -1,9 +1,12 @@
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
+from django.core.exceptions import ValidationError
 from django.core.validators import MinValueValidator, MaxValueValidator
 import uuid
 
+from .isbn import compact as compact_isbn, normalize as normalize_isbn, validate_isbn
+
 
 class Category(models.Model):
     name = models.CharField(max_length=100, unique=True)
@@ -18,12 +21,22 @@ class Category(models.Model):
 
 class Author(models.Model):
     name = models.CharField(max_length=100)
+    # library.authors.name_key(name): folds case, accents, punctuation and initials
+    name_key = models.CharField(max_length=100, blank=True, editable=False, db_index=True)
     email = models.EmailField(unique=True, blank=True, null=True)
     bio = models.TextField(blank=True)
     birth_date = models.DateField(null=True, blank=True)
     
     def __str__(self):
         return self.name
+    
+    def save(self, *args, **kwargs):
+        from .authors import name_key
+        self.name_key = name_key(self.name)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'name' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'name_key'}
+        super().save(*args, **kwargs)
 
 
 class Book(models.Model):
@@ -36,7 +49,12 @@ class Book(models.Model):
     
     title = models.CharField(max_length=200)
     authors = models.ManyToManyField(Author, related_name='books')
-    isbn = models.CharField(max_length=13, unique=True, help_text="13-character ISBN")
+    isbn = models.CharField(
+        max_length=17, unique=True, validators=[validate_isbn],
+        help_text="ISBN-10 or ISBN-13; hyphens and spaces are removed on save"
+    )
+    # Canonical ISBN-13 (library.isbn.normalize) for exact lookups from any spelling
+    isbn_normalized = models.CharField(max_length=13, blank=True, editable=False, db_index=True)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, related_name='books')
     publisher = models.CharField(max_length=100, blank=True)
     publication_date = models.DateField(null=True, blank=True)
@@ -51,21 +69,92 @@ class Book(models.Model):
     added_date = models.DateTimeField(auto_now_add=True)
     updated_date = models.DateTimeField(auto_now=True)
     
+    class Meta:
+        indexes = [
+            # Availability feed cursor (library.feed); also serves Max('updated_date')
+            models.Index(fields=['updated_date', 'id']),
+        ]
+        constraints = [
+            # Books stored with legacy ISBNs that fail validation normalize to ''
+            models.UniqueConstraint(
+                fields=['isbn_normalized'], condition=~models.Q(isbn_normalized=''),
+                name='unique_isbn_normalized'
+            ),
+        ]
+    
     def __str__(self):
         return f"{self.title} ({self.isbn})"
     
+    def _normalize_isbn(self):
+        self.isbn = compact_isbn(self.isbn)
+        self.isbn_normalized = normalize_isbn(self.isbn) or ''
+    
+    def clean(self):
+        super().clean()
+        # isbn_normalized is not editable, so forms skip unique_isbn_normalized
+        self._normalize_isbn()
+        if self.isbn_normalized and Book.objects.exclude(pk=self.pk).filter(
+            isbn_normalized=self.isbn_normalized
+        ).exists():
+            raise ValidationError(
+                {'isbn': 'A book with this ISBN (in another form) already exists.'}, code='duplicate_isbn'
+            )
+    
+    def save(self, *args, **kwargs):
+        self._normalize_isbn()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'isbn' in update_fields:
+            kwargs['update_fields'] = {*update_fields, 'isbn_normalized'}
+        super().save(*args, **kwargs)
+    
     @property
     def is_available(self):
         return self.available_copies > 0 and self.status == 'available'
     
     @property
     def primary_author(self):
-        return self.authors.first()
+        # all() rather than first() so authors prefetched by the catalog are reused
+        authors = sorted(self.authors.all(), key=lambda author: author.pk)
+        return authors[0] if authors else None
+
+
+class BookCopy(models.Model):
+    """A physical item of a book, identified by its barcode"""
+    STATUS_CHOICES = [
+        ('available', 'Available'),
+        ('borrowed', 'Borrowed'),
+        ('maintenance', 'Under Maintenance'),
+        ('lost', 'Lost'),
+    ]
+    
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='copies')
+    barcode = models.CharField(max_length=32, unique=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
+    location = models.CharField(max_length=50, help_text="Shelf/Rack location", blank=True)
+    added_date = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        verbose_name_plural = "Book copies"
+        indexes = [
+            models.Index(fields=['book', 'status']),
+        ]
+    
+    def __str__(self):
+        return f"{self.barcode} - {self.book.title}"
 
 
 class Member(models.Model):
+    TIER_CHOICES = [
+        ('standard', 'Standard'),
+        ('student', 'Student'),
+        ('senior', 'Senior'),
+        ('staff', 'Staff'),
+    ]
+    
     user = models.OneToOneField(User, on_delete=models.CASCADE)
-    member_id = models.CharField(max_length=10, unique=True)
+    member_id = models.CharField(
+        max_length=10, unique=True, blank=True, help_text="Assigned from the member ID sequence when left empty"
+    )
     phone = models.CharField(max_length=20)
     address = models.TextField()
     birth_date = models.DateField(null=True, blank=True)
@@ -74,11 +163,18 @@ class Member(models.Model):
     is_active = models.BooleanField(default=True)
     max_books_allowed = models.PositiveIntegerField(default=5)
     current_books_borrowed = models.PositiveIntegerField(default=0)
+    tier = models.CharField(max_length=20, choices=TIER_CHOICES, default='standard')
     profile_picture = models.ImageField(upload_to='member_profiles/', blank=True, null=True)
     
     def __str__(self):
         return f"{self.user.get_full_name()} ({self.member_id})"
     
+    def save(self, *args, **kwargs):
+        if not self.member_id:
+            from .member_ids import allocate
+            self.member_id = allocate(1)[0]
+        super().save(*args, **kwargs)
+    
     @property
     def can_borrow(self):
         return self.current_books_borrowed < self.max_books_allowed and self.is_active
@@ -93,6 +189,15 @@ class Member(models.Model):
             return "Active"
 
 
+class MemberIdSequence(models.Model):
+    """Next unissued number of a member ID series; see library.member_ids"""
+    name = models.CharField(max_length=20, unique=True)
+    next_value = models.PositiveBigIntegerField()
+    
+    def __str__(self):
+        return f"{self.name}: {self.next_value}"
+
+
 class Borrow(models.Model):
     STATUS_CHOICES = [
         ('active', 'Active'),
@@ -103,17 +208,28 @@ class Borrow(models.Model):
     
     borrow_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='borrows')
+    copy = models.ForeignKey(
+        BookCopy, on_delete=models.SET_NULL, null=True, blank=True, related_name='borrows'
+    )
     member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='borrows')
-    borrow_date = models.DateTimeField(auto_now_add=True)
+    borrow_date = models.DateTimeField(auto_now_add=True, db_index=True)
     due_date = models.DateField()
     return_date = models.DateTimeField(null=True, blank=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     fine_amount = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
+    renewal_count = models.PositiveIntegerField(default=0)
     notes = models.TextField(blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'due_date']),
+        ]
+    
     def __str__(self):
         return f"{self.book.title} - {self.member.user.get_full_name()}"
     
+    is_archived = False
+    
     @property
     def is_overdue(self):
         if self.status == 'returned':
@@ -128,8 +244,79 @@ class Borrow(models.Model):
     
     @property
     def calculated_fine(self):
-        fine_per_day = 2.00  # $2 per day fine
-        return self.days_overdue * fine_per_day
+        # Per-object evaluation of the fine policies; see library.fines for bulk use
+        from .fines import evaluate
+        return evaluate(self)
+
+
+class FinePolicy(models.Model):
+    """Late-fine rule; the highest-priority active policy matching a borrow applies"""
+    name = models.CharField(max_length=100)
+    category = models.ForeignKey(
+        Category, on_delete=models.CASCADE, null=True, blank=True, related_name='fine_policies',
+        help_text="Leave empty to match every category"
+    )
+    member_tier = models.CharField(
+        max_length=20, choices=Member.TIER_CHOICES, blank=True, help_text="Leave empty to match every tier"
+    )
+    daily_rate = models.DecimalField(max_digits=6, decimal_places=2, validators=[MinValueValidator(0)])
+    grace_days = models.PositiveIntegerField(default=0, help_text="Chargeable days forgiven before fines start")
+    max_fine = models.DecimalField(
+        max_digits=6, decimal_places=2, null=True, blank=True, validators=[MinValueValidator(0)],
+        help_text="Cap per borrow; leave empty for no cap"
+    )
+    priority = models.IntegerField(default=0)
+    is_active = models.BooleanField(default=True)
+    
+    class Meta:
+        ordering = ['-priority', 'id']
+        verbose_name_plural = "Fine policies"
+    
+    def __str__(self):
+        return self.name
+
+
+class ClosedDay(models.Model):
+    """Day the library is closed; no fines accrue on it"""
+    date = models.DateField(unique=True)
+    reason = models.CharField(max_length=100, blank=True)
+    
+    class Meta:
+        ordering = ['date']
+    
+    def __str__(self):
+        return f"{self.date} {self.reason}".strip()
+
+
+class CirculationEvent(models.Model):
+    """Append-only ledger of circulation activity"""
+    EVENT_CHOICES = [
+        ('borrow', 'Borrow'),
+        ('return', 'Return'),
+        ('lost', 'Lost'),
+        ('renew', 'Renew'),
+    ]
+    
+    event_type = models.CharField(max_length=10, choices=EVENT_CHOICES)
+    # Plain UUID rather than a foreign key so the ledger outlives the borrow row
+    borrow_ref = models.UUIDField(db_index=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='circulation_events')
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='circulation_events')
+    created_date = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['member', 'created_date']),
+            models.Index(fields=['book', 'created_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_event_type_display()}: {self.book_id} - {self.member_id}"
+    
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError("Circulation events are append-only.")
+        super().save(*args, **kwargs)
 
 
 class Fine(models.Model):
@@ -168,15 +355,31 @@ class Payment(models.Model):
         ('refunded', 'Refunded'),
     ]
     
+    RECONCILIATION_CHOICES = [
+        ('unreconciled', 'Not reconciled'),
+        ('matched', 'Matched'),
+        ('corrected', 'Amount corrected from gateway'),
+        ('amount_mismatch', 'Amount differs from gateway'),
+        ('missing', 'No successful charge at gateway'),
+        ('duplicate', 'Duplicate record of a charge'),
+    ]
+    
     payment_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='payments')
     amount = models.DecimalField(max_digits=8, decimal_places=2)
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHODS)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     payment_date = models.DateTimeField(auto_now_add=True)
-    stripe_payment_intent_id = models.CharField(max_length=100, blank=True)
+    stripe_payment_intent_id = models.CharField(max_length=100, blank=True, db_index=True)
     description = models.TextField()
     fines = models.ManyToManyField(Fine, related_name='payments', blank=True)
+    # Outcome of the last `manage.py reconcile_payments` run that covered this payment
+    reconciliation_status = models.CharField(
+        max_length=20, choices=RECONCILIATION_CHOICES, default='unreconciled', db_index=True
+    )
+    reconciled_date = models.DateTimeField(null=True, blank=True)
+    
+    is_archived = False
     
     def __str__(self):
         return f"Payment: {self.member.user.get_full_name()} - ${self.amount}"
@@ -197,6 +400,12 @@ class Reservation(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='active')
     notes = models.TextField(blank=True)
     
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'expiry_date']),
+            models.Index(fields=['book', 'status']),
+        ]
+    
     def __str__(self):
         return f"Reservation: {self.book.title} - {self.member.user.get_full_name()}"
     
@@ -213,10 +422,182 @@ class Review(models.Model):
         help_text="Rating from 1 to 5"
     )
     comment = models.TextField()
-    review_date = models.DateTimeField(auto_now_add=True)
+    review_date = models.DateTimeField(auto_now_add=True, db_index=True)
     
     class Meta:
         unique_together = ['book', 'member']
     
     def __str__(self):
         return f"Review: {self.book.title} - {self.rating}/5"
+
+
+class Notice(models.Model):
+    """Reminder e-mails already sent, so reminder runs can be repeated safely"""
+    KIND_CHOICES = [
+        ('due_soon', 'Due Soon'),
+        ('overdue', 'Overdue'),
+        ('hold_expiring', 'Hold Expiring'),
+        ('hold_available', 'Hold Available'),
+    ]
+    
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='notices')
+    borrow = models.ForeignKey(Borrow, on_delete=models.CASCADE, null=True, blank=True, related_name='notices')
+    reservation = models.ForeignKey(
+        Reservation, on_delete=models.CASCADE, null=True, blank=True, related_name='notices'
+    )
+    reference_date = models.DateField(help_text="Due or expiry date the notice was about")
+    sent_date = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['kind', 'borrow', 'reference_date'], name='unique_borrow_notice'
+            ),
+            models.UniqueConstraint(
+                fields=['kind', 'reservation', 'reference_date'], name='unique_reservation_notice'
+            ),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} notice: {self.member_id} ({self.reference_date})"
+
+
+class OutboxEvent(models.Model):
+    """Side effect recorded in the same transaction as the change that caused it"""
+    topic = models.CharField(max_length=50)
+    payload = models.JSONField(default=dict)
+    created_date = models.DateTimeField(auto_now_add=True)
+    available_date = models.DateTimeField(default=timezone.now, help_text="Not retried before this time")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    processed_date = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['processed_date', 'available_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.topic} #{self.pk}"
+
+
+# Archive tables: closed circulation history moved out of the hot tables by
+# `manage.py archive_history`. Rows keep their original primary keys.
+
+class ArchivedBorrow(models.Model):
+    borrow_id = models.UUIDField(primary_key=True, editable=False)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='archived_borrows')
+    copy = models.ForeignKey(
+        BookCopy, on_delete=models.SET_NULL, null=True, blank=True, related_name='archived_borrows'
+    )
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='archived_borrows')
+    borrow_date = models.DateTimeField()
+    due_date = models.DateField()
+    return_date = models.DateTimeField(null=True, blank=True)
+    status = models.CharField(max_length=20, choices=Borrow.STATUS_CHOICES)
+    fine_amount = models.DecimalField(max_digits=6, decimal_places=2, default=0.00)
+    renewal_count = models.PositiveIntegerField(default=0)
+    notes = models.TextField(blank=True)
+    archived_date = models.DateTimeField(auto_now_add=True)
+    
+    is_archived = True
+    is_overdue = False
+    days_overdue = 0
+    calculated_fine = 0
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['member', 'borrow_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.book.title} - {self.member.user.get_full_name()} (archived)"
+
+
+class ArchivedFine(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    borrow = models.ForeignKey(ArchivedBorrow, on_delete=models.CASCADE, related_name='fines')
+    amount = models.DecimalField(max_digits=6, decimal_places=2)
+    reason = models.CharField(max_length=100)
+    issue_date = models.DateTimeField()
+    due_date = models.DateField()
+    status = models.CharField(max_length=20, choices=Fine.STATUS_CHOICES)
+    payment_date = models.DateTimeField(null=True, blank=True)
+    payment_method = models.CharField(max_length=50, blank=True)
+    transaction_id = models.CharField(max_length=100, blank=True)
+    archived_date = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Fine: {self.borrow.member.user.get_full_name()} - ${self.amount} (archived)"
+
+
+class ArchivedPayment(models.Model):
+    payment_id = models.UUIDField(primary_key=True, editable=False)
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='archived_payments')
+    amount = models.DecimalField(max_digits=8, decimal_places=2)
+    payment_method = models.CharField(max_length=20, choices=Payment.PAYMENT_METHODS)
+    status = models.CharField(max_length=20, choices=Payment.STATUS_CHOICES)
+    payment_date = models.DateTimeField()
+    stripe_payment_intent_id = models.CharField(max_length=100, blank=True)
+    description = models.TextField()
+    reconciliation_status = models.CharField(
+        max_length=20, choices=Payment.RECONCILIATION_CHOICES, default='unreconciled'
+    )
+    reconciled_date = models.DateTimeField(null=True, blank=True)
+    # IDs of the fines the payment settled; they may be live or archived
+    fine_ids = models.JSONField(default=list, blank=True)
+    archived_date = models.DateTimeField(auto_now_add=True)
+    
+    is_archived = True
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['member', 'payment_date']),
+        ]
+    
+    def __str__(self):
+        return f"Payment: {self.member.user.get_full_name()} - ${self.amount} (archived)"
+
+
+class ArchivedReservation(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='archived_reservations')
+    member = models.ForeignKey(Member, on_delete=models.CASCADE, related_name='archived_reservations')
+    reservation_date = models.DateTimeField()
+    expiry_date = models.DateTimeField()
+    status = models.CharField(max_length=20, choices=Reservation.STATUS_CHOICES)
+    notes = models.TextField(blank=True)
+    archived_date = models.DateTimeField(auto_now_add=True)
+    
+    def __str__(self):
+        return f"Reservation: {self.book.title} - {self.member.user.get_full_name()} (archived)"
+
+
+class BookRecommendation(models.Model):
+    """Precomputed "readers also borrowed" neighbours of a book"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommendations')
+    recommended = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='recommended_for')
+    score = models.FloatField()
+    rank = models.PositiveSmallIntegerField()
+    computed_date = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['book', 'rank']
+        constraints = [
+            models.UniqueConstraint(fields=['book', 'rank'], name='unique_recommendation_rank'),
+        ]
+    
+    def __str__(self):
+        return f"{self.book_id} -> {self.recommended_id} ({self.score:.3f})"
+
+
+class RecommendationRun(models.Model):
+    """Watermark of the last recommendation build, for incremental runs"""
+    started_date = models.DateTimeField()
+    completed_date = models.DateTimeField(auto_now_add=True)
+    books_updated = models.PositiveIntegerField(default=0)
+    full = models.BooleanField(default=False)
+    
+    def __str__(self):
+        return f"Recommendation run {self.started_date:%Y-%m-%d %H:%M}"
@@ -0,0 +1,136 @@
+"""
+Transactional outbox for side effects of circulation and payments.
+
+Code that changes Borrow/Fine/Payment rows calls `enqueue()` inside the
+same transaction, so an event exists exactly when its change committed.
+`manage.py run_worker` drains pending events in batches, locking them with
+SELECT ... FOR UPDATE SKIP LOCKED so several workers can run side by side,
+and calls the handler registered for each topic. Delivery is at least
+once: a handler may see an event again if a worker dies after the side
+effect but before marking it processed, so handlers must be idempotent or
+tolerate repeats. Failed events are retried with exponential backoff up to
+MAX_ATTEMPTS, then left for an operator (see the admin).
+"""
+import logging
+from datetime import timedelta
+
+from django.core.mail import send_mail
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.utils import timezone
+
+from .models import Borrow, Fine, Notice, OutboxEvent, Payment, Reservation
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 8
+RETRY_BASE_SECONDS = 30
+
+HANDLERS = {}
+
+
+def handler(topic):
+    """Register the function that processes events of `topic`"""
+    def register(func):
+        HANDLERS[topic] = func
+        return func
+    return register
+
+
+def enqueue(topic, **payload):
+    """Record an event in the caller's transaction"""
+    return OutboxEvent.objects.create(topic=topic, payload=payload)
+
+
+def enqueue_many(topic, payloads):
+    """Record one event per payload with a single insert"""
+    return OutboxEvent.objects.bulk_create([OutboxEvent(topic=topic, payload=payload) for payload in payloads])
+
+
+def pending(now=None):
+    """Events due for (re)delivery, oldest first"""
+    return OutboxEvent.objects.filter(
+        processed_date__isnull=True, attempts__lt=MAX_ATTEMPTS, available_date__lte=now or timezone.now()
+    ).order_by('id')
+
+
+def drain(batch_size=100):
+    """
+    Process one batch of pending events and return how many were taken.
+
+    Each event runs in its own savepoint, so a failing handler rolls back
+    only its own writes and is scheduled for a retry.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        events = list(pending(now).select_for_update(skip_locked=True)[:batch_size])
+        for event in events:
+            event.attempts += 1
+            try:
+                with transaction.atomic():
+                    HANDLERS[event.topic](event.payload)
+            except Exception as exc:
+                logger.exception('Outbox event %s (%s) failed', event.pk, event.topic)
+                event.last_error = f'{type(exc).__name__}: {exc}'
+                event.available_date = now + timedelta(seconds=RETRY_BASE_SECONDS * 2 ** (event.attempts - 1))
+            else:
+                event.processed_date = now
+                event.last_error = ''
+        OutboxEvent.objects.bulk_update(events, ['attempts', 'last_error', 'available_date', 'processed_date'])
+    return len(events)
+
+
+def purge_processed(days):
+    """Delete events processed more than `days` ago"""
+    cutoff = timezone.now() - timedelta(days=days)
+    return OutboxEvent.objects.filter(processed_date__lt=cutoff).delete()[0]
+
+
+def _email(member, template, subject, context):
+    if not member.user.email:
+        return
+    context = {'name': member.user.get_full_name() or member.user.username, **context}
+    send_mail(subject, render_to_string(f'library/email/{template}.txt', context), None, [member.user.email])
+
+
+@handler('fine.created')
+def fine_created(payload):
+    """Tell the member about fines issued on a returned borrow"""
+    borrow = Borrow.objects.select_related('book', 'member__user').filter(borrow_id=payload['borrow_id']).first()
+    if borrow is None:
+        return
+    fines = list(Fine.objects.filter(borrow=borrow, status='pending'))
+    if fines:
+        _email(borrow.member, 'fine_created', f'Fine issued for "{borrow.book.title}"', {
+            'book_title': borrow.book.title,
+            'amount': sum(fine.amount for fine in fines),
+            'due_date': min(fine.due_date for fine in fines),
+        })
+
+
+@handler('payment.completed')
+def payment_completed(payload):
+    """E-mail a receipt for a completed payment"""
+    payment = Payment.objects.select_related('member__user').filter(payment_id=payload['payment_id']).first()
+    if payment is not None and payment.status == 'completed':
+        _email(payment.member, 'payment_receipt', 'Payment receipt', {'payment': payment})
+
+
+@handler('borrow.returned')
+def borrow_returned(payload):
+    """Tell the member holding the oldest active reservation that the book is back"""
+    reservation = Reservation.objects.select_related('book', 'member__user').filter(
+        book_id=payload['book_id'], status='active', expiry_date__gt=timezone.now()
+    ).order_by('reservation_date').first()
+    if reservation is None:
+        return
+    # The notice row makes a redelivered event a no-op
+    notice, created = Notice.objects.get_or_create(
+        kind='hold_available', reservation=reservation, reference_date=timezone.localdate(),
+        defaults={'member': reservation.member},
+    )
+    if created:
+        _email(reservation.member, 'hold_available', f'"{reservation.book.title}" is available', {
+            'book_title': reservation.book.title,
+            'expiry_date': reservation.expiry_date,
+        })
@@ -0,0 +1,115 @@
+"""
+Opt-in statistical profiling of production requests.
+
+SamplingProfilerMiddleware profiles a random PROFILER_SAMPLE_RATE fraction
+of requests, plus any request from a staff user carrying the PROFILER_HEADER
+header. While a profiled request runs, a background thread samples the
+request thread's stack every PROFILER_INTERVAL seconds; the samples are
+written as collapsed stacks (one "frame;frame;frame count" line per distinct
+stack, the input format of flamegraph.pl and speedscope) under
+PROFILER_DIR/<url name>/, keeping only the newest PROFILER_KEEP files per
+URL name. Unprofiled requests cost one random() call and a dict lookup.
+"""
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+
+from django.conf import settings
+
+SUFFIX = '.folded'
+
+
+class StackSampler:
+    """Samples one thread's Python stack on a timer until stopped"""
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='request-profiler', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+
+def _directory(url_name):
+    return Path(settings.PROFILER_DIR) / re.sub(r'[^\w.-]', '_', url_name or 'unresolved')
+
+
+def save(url_name, stacks, elapsed):
+    """Write collapsed stacks for one request and drop the oldest beyond PROFILER_KEEP"""
+    directory = _directory(url_name)
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f'{time.time_ns()}-{elapsed * 1000:.0f}ms{SUFFIX}'
+    path.write_text(''.join(f'{stack} {count}\n' for stack, count in stacks.most_common()))
+    for old in sorted(directory.glob(f'*{SUFFIX}'))[:-settings.PROFILER_KEEP]:
+        old.unlink(missing_ok=True)
+    return path
+
+
+def stored_profiles():
+    """{url name: [file name, ...] newest first} for everything on disk"""
+    root = Path(settings.PROFILER_DIR)
+    if not root.is_dir():
+        return {}
+    return {
+        directory.name: sorted((path.name for path in directory.glob(f'*{SUFFIX}')), reverse=True)
+        for directory in sorted(root.iterdir()) if directory.is_dir()
+    }
+
+
+def read_profile(url_name, filename):
+    """Collapsed stacks of one stored profile, or None if it does not exist"""
+    # Only serve names that came from the listing, never a caller-built path
+    if filename not in stored_profiles().get(url_name, []):
+        return None
+    return (Path(settings.PROFILER_DIR) / url_name / filename).read_text()
+
+
+class SamplingProfilerMiddleware:
+    """Profile sampled or staff-requested requests; pass everything else straight through"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.rate = settings.PROFILER_SAMPLE_RATE
+        self.header = 'HTTP_' + settings.PROFILER_HEADER.upper().replace('-', '_')
+
+    def __call__(self, request):
+        sampled = self.rate and random.random() < self.rate
+        # Resolving the user costs a session lookup, so only do it when asked
+        requested = self.header in request.META and request.user.is_staff
+        if not (sampled or requested):
+            return self.get_response(request)
+
+        started = time.perf_counter()
+        with StackSampler(threading.get_ident(), settings.PROFILER_INTERVAL) as sampler:
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+        match = request.resolver_match
+        if sampler.stacks:
+            path = save(match.view_name if match else None, sampler.stacks, elapsed)
+            if requested:
+                response['X-Profile'] = f'{path.parent.name}/{path.name}'
+        return response
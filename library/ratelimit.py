@@ -0,0 +1,103 @@
+"""
+Cache-backed rate limiting for write endpoints.
+
+Limits are declared where the URL is, in library/urls.py:
+
+    path('books/<int:book_id>/borrow/', ratelimit('10/m')(views.borrow_book), ...)
+
+Each limit uses a sliding-window counter: hits are counted with an atomic
+cache.incr() in the current fixed window, and the previous window's count is
+weighted by how much of it still overlaps the sliding window. Clients are
+keyed by the signed-in user ID taken straight from the session (no user
+query), falling back to the client IP, and scoped per URL name. Blocked
+requests get a 429 with Retry-After before the view, and so before any ORM
+work, runs.
+
+Use a shared cache (Redis or Memcached) in production; the default
+local-memory cache counts per worker process.
+"""
+import math
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from django.http import HttpResponse, JsonResponse
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+
+def parse_rate(rate):
+    """'10/m' -> (10, 60); the period may carry a multiplier, as in '100/15m'"""
+    limit, period = rate.split('/')
+    multiplier = int(period[:-1] or 1)
+    return int(limit), multiplier * PERIODS[period[-1]]
+
+
+def client_key(request):
+    """'user:<id>' for signed-in clients, 'ip:<address>' otherwise"""
+    user_id = request.session.get(SESSION_KEY) if hasattr(request, 'session') else None
+    if user_id is not None:
+        return f'user:{user_id}'
+    address = request.META.get(settings.RATELIMIT_IP_HEADER) or request.META.get('REMOTE_ADDR', '')
+    # X-Forwarded-For lists the original client first
+    return 'ip:' + address.split(',')[0].strip()
+
+
+def hit(scope, key, limit, period):
+    """
+    Count one request and return seconds to wait, or 0 if it is allowed.
+
+    The estimate is previous_window * (1 - elapsed / period) + current_window.
+    """
+    cache = caches[settings.RATELIMIT_CACHE]
+    now = time.time()
+    window, offset = divmod(now, period)
+    current = f'rl:{scope}:{key}:{int(window)}'
+    previous = f'rl:{scope}:{key}:{int(window) - 1}'
+    # add() is a no-op when the key exists, so concurrent first hits cannot reset it
+    cache.add(current, 0, timeout=2 * period)
+    count = cache.incr(current)
+    weight = 1 - offset / period
+    earlier = cache.get(previous, 0)
+    if earlier * weight + count <= limit:
+        return 0
+    if count > limit:
+        # Over the limit even once the previous window has slid out entirely
+        return math.ceil(period - offset)
+    # Wait until enough of the previous window has slid out
+    return max(1, math.ceil(period * (weight - (limit - count) / earlier)))
+
+
+def too_many_requests(request, retry_after):
+    """429 response in the format the client asked for"""
+    message = f'Too many requests. Try again in {retry_after} seconds.'
+    if request.content_type == 'application/json' or 'application/json' in request.headers.get('Accept', ''):
+        response = JsonResponse({'success': False, 'error': message}, status=429)
+    else:
+        response = HttpResponse(message, status=429, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(retry_after)
+    return response
+
+
+def ratelimit(rate, methods=('POST',), group=None):
+    """
+    Limit a view to `rate` requests per client, counting only `methods`.
+
+    Views sharing a `group` share one budget; by default each URL name has
+    its own.
+    """
+    limit, period = parse_rate(rate)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if settings.RATELIMIT_ENABLE and request.method in methods:
+                scope = group or request.resolver_match.view_name
+                retry_after = hit(scope, client_key(request), limit, period)
+                if retry_after:
+                    return too_many_requests(request, retry_after)
+            return view(request, *args, **kwargs)
+        return wrapper
+    return decorator
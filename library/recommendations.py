@@ -0,0 +1,181 @@
+"""
+Item-to-item "readers also borrowed" recommendations.
+
+A sparse member x book matrix is built from borrow history (live and
+archived) plus review ratings, its columns are L2-normalized, and the cosine
+similarity of every target book against all books is computed in column
+blocks of `chunk_size`, so peak memory is bounded by the interaction matrix
+plus one block of similarities. The top-K neighbours of each book are stored
+in BookRecommendation and served with one indexed lookup.
+
+NumPy/SciPy are imported lazily so web workers and other management
+commands never pay for them.
+"""
+from array import array
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ArchivedBorrow, BookRecommendation, Borrow, RecommendationRun, Review
+
+DEFAULT_TOP_K = 10
+DEFAULT_CHUNK_SIZE = 1000
+# Review ratings nudge the borrow signal: 5 stars adds 1.0, 1 star removes it
+RATING_WEIGHT = 0.5
+
+
+def _interactions(batch_size=20000):
+    """
+    Stream borrow pairs and weighted review triples into compact typed arrays.
+
+    Returns ((members, books), (members, books, weights)).
+    """
+    borrows = array('q'), array('q')
+    for queryset in (Borrow.objects.all(), ArchivedBorrow.objects.all()):
+        for member_id, book_id in queryset.order_by().values_list('member_id', 'book_id').iterator(
+            chunk_size=batch_size
+        ):
+            borrows[0].append(member_id)
+            borrows[1].append(book_id)
+    reviews = array('q'), array('q'), array('f')
+    for member_id, book_id, rating in Review.objects.order_by().values_list(
+        'member_id', 'book_id', 'rating'
+    ).iterator(chunk_size=batch_size):
+        reviews[0].append(member_id)
+        reviews[1].append(book_id)
+        reviews[2].append((rating - 3) * RATING_WEIGHT)
+    return borrows, reviews
+
+
+def _normalized_matrix(borrows, reviews):
+    """Column-normalized CSC member x book matrix and the book ID of each column"""
+    import numpy as np
+    from scipy import sparse
+
+    member_ids = np.concatenate([np.frombuffer(borrows[0], dtype=np.int64),
+                                 np.frombuffer(reviews[0], dtype=np.int64)])
+    book_ids = np.concatenate([np.frombuffer(borrows[1], dtype=np.int64),
+                               np.frombuffer(reviews[1], dtype=np.int64)])
+    _, rows = np.unique(member_ids, return_inverse=True)
+    columns, cols = np.unique(book_ids, return_inverse=True)
+    shape = (rows.max() + 1, len(columns))
+    split = len(borrows[0])
+
+    # Repeat borrows of a book count once; ratings then shift that signal
+    matrix = sparse.coo_matrix(
+        (np.ones(split, dtype=np.float32), (rows[:split], cols[:split])), shape=shape
+    ).tocsc()
+    matrix.data[:] = 1.0
+    matrix = matrix + sparse.coo_matrix(
+        (np.frombuffer(reviews[2], dtype=np.float32), (rows[split:], cols[split:])), shape=shape
+    ).tocsc()
+    matrix.data = np.clip(matrix.data, 0, None)
+    matrix.eliminate_zeros()
+
+    norms = np.sqrt(np.asarray(matrix.multiply(matrix).sum(axis=0))).ravel()
+    norms[norms == 0] = 1.0
+    return (matrix @ sparse.diags(1.0 / norms)).tocsc(), columns
+
+
+def _top_k(similarities, column_ids, targets, top_k):
+    """Yield (book_id, [(neighbour_id, score), ...]) for each target column"""
+    import numpy as np
+
+    similarities = similarities.tocsc()
+    for position, book_id in enumerate(targets):
+        start, end = similarities.indptr[position], similarities.indptr[position + 1]
+        rows = similarities.indices[start:end]
+        scores = similarities.data[start:end]
+        keep = column_ids[rows] != book_id
+        rows, scores = rows[keep], scores[keep]
+        if len(scores) > top_k:
+            best = np.argpartition(-scores, top_k)[:top_k]
+            rows, scores = rows[best], scores[best]
+        order = np.argsort(-scores, kind='stable')
+        yield book_id, [(int(column_ids[rows[i]]), float(scores[i])) for i in order]
+
+
+def dirty_books(since):
+    """
+    Books whose neighbours can differ from a full rebuild after activity since `since`.
+
+    The similarity of two books depends only on their two columns, and a
+    column changes only when its book gains or loses a borrow or review. So
+    every book sharing a reader with a book that has new activity is
+    recomputed, as are books that list one of those as a neighbour (their
+    shared reader may be gone).
+    """
+    active = set(Borrow.objects.filter(borrow_date__gte=since).values_list('book_id', flat=True).distinct())
+    active.update(Review.objects.filter(review_date__gte=since).values_list('book_id', flat=True).distinct())
+    histories = (Borrow.objects, ArchivedBorrow.objects, Review.objects)
+    readers = Q()
+    for history in histories:
+        readers |= Q(member_id__in=history.filter(book_id__in=active).values('member_id'))
+    dirty = set(active)
+    for history in histories:
+        dirty.update(history.filter(readers).order_by().values_list('book_id', flat=True).distinct())
+    dirty.update(BookRecommendation.objects.filter(recommended_id__in=active).values_list('book_id', flat=True))
+    return dirty
+
+
+def build(full=False, top_k=DEFAULT_TOP_K, chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    Recompute stored neighbours and return the number of books updated.
+
+    Incremental runs only recompute the books dirty_books() finds for the
+    time since the previous run; `full` recomputes every book with any
+    history.
+    """
+    import numpy as np
+
+    started = timezone.now()
+    last_run = RecommendationRun.objects.order_by('-started_date').first()
+    borrows, reviews = _interactions()
+    if not borrows[0] and not reviews[0]:
+        return 0
+    matrix, column_ids = _normalized_matrix(borrows, reviews)
+
+    if full or last_run is None:
+        targets = column_ids
+    else:
+        targets = np.intersect1d(column_ids, np.fromiter(dirty_books(last_run.started_date), dtype=np.int64))
+    positions = np.searchsorted(column_ids, targets)
+
+    updated = 0
+    transposed = matrix.T.tocsr()
+    for start in range(0, len(targets), chunk_size):
+        block = positions[start:start + chunk_size]
+        similarities = transposed @ matrix[:, block]
+        rows = []
+        for book_id, neighbours in _top_k(similarities, column_ids, targets[start:start + chunk_size], top_k):
+            rows.extend(
+                BookRecommendation(book_id=int(book_id), recommended_id=neighbour, score=score, rank=rank)
+                for rank, (neighbour, score) in enumerate(neighbours, start=1)
+            )
+        block_ids = [int(book_id) for book_id in targets[start:start + chunk_size]]
+        with transaction.atomic():
+            BookRecommendation.objects.filter(book_id__in=block_ids).delete()
+            BookRecommendation.objects.bulk_create(rows, batch_size=2000)
+        updated += len(block_ids)
+
+    RecommendationRun.objects.create(started_date=started, books_updated=updated, full=full or last_run is None)
+    return updated
+
+
+def for_book(book, limit=6):
+    """Stored neighbours of a book, best first"""
+    return [
+        recommendation.recommended
+        for recommendation in BookRecommendation.objects.filter(book=book).select_related('recommended')[:limit]
+    ]
+
+
+def for_member(member, limit=6):
+    """Neighbours of the member's most recently borrowed book, best first"""
+    latest = Borrow.objects.filter(member=member).order_by('-borrow_date').values('book_id')[:1]
+    return [
+        recommendation.recommended
+        for recommendation in BookRecommendation.objects.filter(book_id=latest).select_related('recommended')[:limit]
+    ]
+
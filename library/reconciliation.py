@@ -0,0 +1,192 @@
+"""
+Payment reconciliation against the gateway.
+
+Charges are PaymentIntent-shaped dicts: `id`, `amount` or `amount_received`
+in cents, `status`, `created` as a Unix time, and `metadata`.
+`stripe_charges()` pages through the Stripe API. `ledger_charges()` reads the
+same objects from a JSON Lines file, for offline runs and for the tests,
+which stub the gateway with a ledger.
+
+`reconcile()` streams the charges in batches. For each batch it builds a hash
+table keyed by intent ID and looks up the matching Payment rows through the
+indexed stripe_payment_intent_id column. Each local payment then gets a
+reconciliation_status. A month of charges costs one query per batch rather
+than one per charge.
+"""
+import bisect
+import json
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from itertools import islice
+
+from django.conf import settings
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from .fines import CENTS
+from .models import Fine, Payment
+
+# Intents are created shortly before their payment row; charges this much
+# older than the window are still fetched so edge payments find theirs
+SLACK = timedelta(hours=1)
+# A fine marked paid is relinked to the member's payment made at most this long before
+RELINK_WINDOW = timedelta(minutes=5)
+
+
+def stripe_charges(since, until, page_size=100):
+    """PaymentIntents created in [since, until), paged from the Stripe API"""
+    # Imported here like in the payment views: the SDK is slow to import
+    import stripe
+    pages = stripe.PaymentIntent.list(
+        created={'gte': int(since.timestamp()), 'lt': int(until.timestamp())},
+        limit=page_size, api_key=settings.STRIPE_SECRET_KEY,
+    )
+    for intent in pages.auto_paging_iter():
+        yield {
+            'id': intent.id, 'amount': intent.amount, 'amount_received': intent.amount_received,
+            'status': intent.status, 'created': intent.created, 'metadata': dict(intent.metadata or {}),
+        }
+
+
+def ledger_charges(path, since, until):
+    """Charges created in [since, until) from a JSON Lines file"""
+    since, until = since.timestamp(), until.timestamp()
+    with open(path) as ledger:
+        for line in ledger:
+            if line.strip():
+                charge = json.loads(line)
+                if since <= charge['created'] < until:
+                    yield charge
+
+
+def charged_amount(charge):
+    return (Decimal(charge.get('amount_received') or charge['amount']) / 100).quantize(CENTS)
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def reconcile(charges, since, until, fix=False, batch_size=1000):
+    """
+    Match gateway charges to payments made in [since, until) and record the outcome on each payment.
+
+    `charges` must cover [since - SLACK, until). With `fix`, amounts are taken
+    from the gateway, payments without a successful charge (and duplicate
+    records of one) are failed and the fines they alone settled reopened,
+    and paid fines that lost their payment link are relinked.
+
+    Returns a dict of outcome lists for reporting.
+    """
+    now = timezone.now()
+    report = defaultdict(list)
+    seen = set()
+    failed = []
+
+    def record(outcomes, corrected=(), failing=()):
+        # One UPDATE per outcome; only corrected amounts differ row by row
+        for outcome, payment_ids in outcomes.items():
+            Payment.objects.filter(pk__in=payment_ids).update(reconciliation_status=outcome, reconciled_date=now)
+        Payment.objects.bulk_update(corrected, ['amount'])
+        if fix and failing:
+            Payment.objects.filter(pk__in=failing, status='completed').update(status='failed')
+            failed.extend(failing)
+
+    for batch in _batches(charges, batch_size):
+        by_intent = {charge['id']: charge for charge in batch}
+        seen.update(by_intent)
+        recorded, outcomes, corrected = set(), defaultdict(list), []
+        payments = Payment.objects.filter(stripe_payment_intent_id__in=by_intent).order_by('payment_date').only(
+            'payment_id', 'amount', 'stripe_payment_intent_id'
+        )
+        for payment in payments:
+            charge = by_intent[payment.stripe_payment_intent_id]
+            amount = charged_amount(charge)
+            if charge['id'] in recorded:
+                # A replayed success callback recorded the same charge twice
+                outcome = 'duplicate'
+            elif charge['status'] != 'succeeded':
+                outcome = 'missing'
+            elif payment.amount != amount:
+                report['amount_mismatch'].append((payment.payment_id, payment.amount, amount))
+                outcome = 'amount_mismatch'
+                if fix:
+                    payment.amount, outcome = amount, 'corrected'
+                    corrected.append(payment)
+            else:
+                outcome = 'matched'
+            recorded.add(charge['id'])
+            outcomes[outcome].append(payment.payment_id)
+        report['missing'] += outcomes['missing']
+        report['duplicate'] += outcomes['duplicate']
+        record(outcomes, corrected, outcomes['missing'] + outcomes['duplicate'])
+
+        report['unrecorded'].extend(
+            charge for charge in batch
+            if charge['id'] not in recorded and charge['status'] == 'succeeded'
+            and charge['created'] >= since.timestamp()
+        )
+
+    # Completed Stripe payments in the window that the gateway never mentioned
+    unseen = [
+        payment_id for payment_id, intent_id in Payment.objects.filter(
+            payment_method='stripe', status='completed', payment_date__gte=since, payment_date__lt=until
+        ).values_list('payment_id', 'stripe_payment_intent_id').iterator(chunk_size=batch_size)
+        if intent_id not in seen
+    ]
+    report['missing'] += unseen
+    for batch in _batches(unseen, batch_size):
+        record({'missing': batch}, failing=batch)
+
+    report['reopened_fines'] = _reopen_fines(failed, batch_size) if failed else 0
+    report['relinked_fines'], report['orphaned_fines'] = _relink_orphaned_fines(since, until, fix)
+    return report
+
+
+def _reopen_fines(payment_ids, batch_size):
+    """Put fines back to pending when no completed payment other than `payment_ids` covers them"""
+    through = Payment.fines.through
+    reopened = 0
+    for batch in _batches(payment_ids, batch_size):
+        covered = through.objects.filter(fine_id=OuterRef('pk'), payment__status='completed')
+        reopened += Fine.objects.filter(status='paid', payments__in=batch).exclude(Exists(covered)).update(
+            status='pending', payment_date=None
+        )
+    return reopened
+
+
+def _relink_orphaned_fines(since, until, fix):
+    """
+    Paid fines with no linked payment, matched to the member's Stripe payment made just before.
+
+    Returns (number relinked, IDs of fines left without a payment).
+    """
+    orphans = list(Fine.objects.filter(
+        status='paid', payments__isnull=True, payment_date__gte=since, payment_date__lt=until
+    ).values_list('pk', 'borrow__member_id', 'payment_date'))
+    if not orphans:
+        return 0, []
+
+    # Per member, payment dates in order and the payment IDs alongside
+    dates, payment_ids = defaultdict(list), defaultdict(list)
+    for pk, member_id, payment_date in Payment.objects.filter(
+        member_id__in={member_id for _, member_id, _ in orphans}, status='completed', payment_method='stripe',
+        payment_date__gte=since - RELINK_WINDOW, payment_date__lt=until,
+    ).order_by('payment_date').values_list('pk', 'member_id', 'payment_date'):
+        dates[member_id].append(payment_date)
+        payment_ids[member_id].append(pk)
+
+    links, unmatched = [], []
+    for fine_id, member_id, paid_date in orphans:
+        # Latest payment at or before the moment the fine was marked paid
+        index = bisect.bisect_right(dates[member_id], paid_date)
+        if index and paid_date - dates[member_id][index - 1] <= RELINK_WINDOW:
+            links.append(Payment.fines.through(payment_id=payment_ids[member_id][index - 1], fine_id=fine_id))
+        else:
+            unmatched.append(fine_id)
+    if fix:
+        Payment.fines.through.objects.bulk_create(links)
+    return len(links), unmatched
@@ -0,0 +1,39 @@
+"""
+Keep Book.updated_date moving when what a book page shows changes elsewhere.
+
+Conditional GETs on the catalog and book detail pages are validated against
+Book.updated_date. Author links, author names and category names live
+outside the Book row, so changing them bumps the books they appear on.
+The admin edits author links through an inline on the through model, which
+sends no signals, but it saves the book itself first. Queryset update() and
+bulk operations send no signals either; code using them must bump
+updated_date itself.
+"""
+from django.db.models.signals import m2m_changed, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .models import Author, Book, Category
+
+
+def touch(books):
+    books.update(updated_date=timezone.now())
+
+
+@receiver(m2m_changed, sender=Book.authors.through)
+def book_authors_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action in ('post_add', 'post_remove'):
+        # `instance` is an Author when the change came through author.books
+        touch(Book.objects.filter(pk__in=pk_set) if reverse else Book.objects.filter(pk=instance.pk))
+    elif action == 'pre_clear' and reverse:
+        touch(instance.books.all())
+    elif action == 'post_clear' and not reverse:
+        touch(Book.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Author)
+@receiver(post_save, sender=Category)
+@receiver(pre_delete, sender=Author)
+@receiver(pre_delete, sender=Category)
+def book_labels_changed(sender, instance, **kwargs):
+    touch(instance.books.all())
@@ -0,0 +1,774 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import caches
+from django.core.management import call_command
+from django.db import ProgrammingError
+from django.db.models import Q
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.utils import timezone
+
+from . import archive, authors, circulation, feed, fines, isbn, outbox, ratelimit, recommendations
+from .forms import BookForm
+from .models import (
+    ArchivedFine, ArchivedPayment, ArchivedReservation, Author, Book, BookRecommendation, Borrow, Category, ClosedDay,
+    Fine, FinePolicy, Member, Notice, OutboxEvent, Payment, Reservation,
+)
+
+
+def make_member(username, email=None, **kwargs):
+    user = User.objects.create_user(username, f'{username}@example.com' if email is None else email, 'password')
+    return Member.objects.create(
+        user=user, phone='555-0100', address='1 Main St',
+        membership_expiry=date.today() + timedelta(days=365), **kwargs
+    )
+
+
+def make_book(title='Book', isbn='9780306406157', copies=2, **kwargs):
+    return Book.objects.create(title=title, isbn=isbn, total_copies=copies, available_copies=copies, **kwargs)
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class SendRemindersTests(TestCase):
+    def setUp(self):
+        today = timezone.localdate()
+        member = make_member('alice')
+        # Members without an address are skipped
+        bob = make_member('bob', email='')
+        book = make_book()
+        Borrow.objects.create(book=book, member=member, due_date=today + timedelta(days=1))
+        Borrow.objects.create(book=book, member=member, due_date=today - timedelta(days=2), status='overdue')
+        Borrow.objects.create(book=book, member=member, due_date=today + timedelta(days=30))
+        Borrow.objects.create(book=book, member=bob, due_date=today - timedelta(days=2), status='overdue')
+        Reservation.objects.create(book=book, member=member, expiry_date=timezone.now() + timedelta(hours=12))
+
+    def send(self):
+        call_command('send_reminders', stdout=StringIO())
+
+    def test_sends_each_reminder_once(self):
+        self.send()
+        self.assertEqual(sorted(message.subject for message in mail.outbox), [
+            'Overdue: "Book"', 'Reminder: "Book" is due soon', 'Your reservation for "Book" is about to expire',
+        ])
+        self.assertEqual({tuple(message.to) for message in mail.outbox}, {('alice@example.com',)})
+        self.assertEqual(Notice.objects.count(), 3)
+
+        self.send()
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(Notice.objects.count(), 3)
+
+    def test_dry_run_sends_nothing(self):
+        call_command('send_reminders', '--dry-run', stdout=StringIO())
+        self.assertEqual(mail.outbox, [])
+        self.assertFalse(Notice.objects.exists())
+
+
+class FinePricingTests(TestCase):
+    """fine_expression() must price every borrow exactly as evaluate() does"""
+    trials = 40
+
+    def setUp(self):
+        self.categories = [Category.objects.create(name=f'Category {i}') for i in range(3)]
+        tiers = [tier for tier, _ in Member.TIER_CHOICES]
+        self.members = [make_member(f'member{i}', tier=tier) for i, tier in enumerate(tiers)]
+        self.books = [
+            make_book(title=f'Book {i}', isbn=f'{i:013d}', category=category)
+            for i, category in enumerate(self.categories + [None])
+        ]
+        self.statuses = [status for status, _ in Borrow.STATUS_CHOICES]
+        self.tiers = tiers
+
+    def random_policies(self, rng):
+        FinePolicy.objects.all().delete()
+        for i in range(rng.randrange(7)):
+            FinePolicy.objects.create(
+                name=f'Policy {i}',
+                category=rng.choice(self.categories + [None]),
+                member_tier=rng.choice(self.tiers + ['']),
+                daily_rate=Decimal(rng.randrange(0, 500)) / 100,
+                grace_days=rng.randrange(5),
+                max_fine=rng.choice([None, Decimal(rng.randrange(0, 3000)) / 100]),
+                # Few distinct priorities so ties fall back to the ID order
+                priority=rng.randrange(3),
+                is_active=rng.random() < 0.8,
+            )
+
+    def random_borrows(self, rng, start):
+        Borrow.objects.all().delete()
+        Borrow.objects.bulk_create([
+            Borrow(
+                book=rng.choice(self.books), member=rng.choice(self.members),
+                due_date=start + timedelta(days=rng.randrange(60)), status=rng.choice(self.statuses),
+            )
+            for _ in range(40)
+        ])
+
+    def test_database_matches_evaluator(self):
+        rng = random.Random(40)
+        start = date(2024, 1, 1)
+        for trial in range(self.trials):
+            self.random_policies(rng)
+            ClosedDay.objects.all().delete()
+            ClosedDay.objects.bulk_create([
+                ClosedDay(date=start + timedelta(days=offset)) for offset in rng.sample(range(90), rng.randrange(15))
+            ])
+            self.random_borrows(rng, start)
+            policies = fines.active_policies()
+            closed_days = list(ClosedDay.objects.values_list('date', flat=True))
+            for as_of in [start + timedelta(days=rng.randrange(90)) for _ in range(3)]:
+                priced = fines.with_fines(Borrow.objects.select_related('book', 'member'), as_of, policies)
+                for borrow in priced:
+                    with self.subTest(trial=trial, as_of=as_of, status=borrow.status, due=borrow.due_date):
+                        self.assertEqual(fines.evaluate(borrow, as_of, policies, closed_days), borrow.fine_due)
+
+
+class ReconcilePaymentsTests(TestCase):
+    """reconcile_payments against a JSON Lines ledger standing in for Stripe"""
+
+    def setUp(self):
+        self.member = make_member('alice')
+        self.borrow = Borrow.objects.create(
+            book=make_book(), member=self.member, due_date=date.today() - timedelta(days=10), status='returned'
+        )
+        self.charges = []
+        self.now = timezone.now()
+
+    def payment(self, intent, amount, fines=(), minutes_ago=60):
+        payment = Payment.objects.create(
+            member=self.member, amount=Decimal(amount), payment_method='stripe', status='completed',
+            stripe_payment_intent_id=intent, description='Online payment for library fines',
+        )
+        # payment_date is auto_now_add; move it to where the scenario needs it
+        Payment.objects.filter(pk=payment.pk).update(payment_date=self.now - timedelta(minutes=minutes_ago))
+        payment.fines.set(fines)
+        payment.refresh_from_db()
+        return payment
+
+    def fine(self, amount='4.00', paid_minutes_ago=60):
+        return Fine.objects.create(
+            borrow=self.borrow, amount=Decimal(amount), reason='Late return', due_date=date.today(),
+            status='paid', payment_date=self.now - timedelta(minutes=paid_minutes_ago),
+        )
+
+    def charge(self, intent, cents, status='succeeded'):
+        self.charges.append({
+            'id': intent, 'amount': cents, 'amount_received': cents if status == 'succeeded' else 0,
+            'status': status, 'created': int((self.now - timedelta(hours=1)).timestamp()),
+            'metadata': {'member_id': self.member.pk},
+        })
+
+    def reconcile(self, *args):
+        with tempfile.NamedTemporaryFile('w', suffix='.jsonl', delete=False) as ledger:
+            ledger.write(''.join(json.dumps(charge) + '\n' for charge in self.charges))
+        self.addCleanup(os.remove, ledger.name)
+        out = StringIO()
+        call_command('reconcile_payments', '--ledger', ledger.name, *args, stdout=out)
+        return out.getvalue()
+
+    def assertReconciled(self, payment, reconciliation_status, status='completed', amount=None):
+        payment.refresh_from_db()
+        self.assertEqual(payment.reconciliation_status, reconciliation_status)
+        self.assertEqual(payment.status, status)
+        if amount is not None:
+            self.assertEqual(payment.amount, Decimal(amount))
+
+    def test_matched(self):
+        payment = self.payment('pi_match', '5.00')
+        self.charge('pi_match', 500)
+        output = self.reconcile()
+        self.assertReconciled(payment, 'matched', amount='5.00')
+        self.assertIsNotNone(payment.reconciled_date)
+        self.assertIn('0 amount mismatch(es), 0 missing, 0 duplicate, 0 unrecorded', output)
+
+    def test_amount_mismatch_is_reported(self):
+        payment = self.payment('pi_amount', '5.00')
+        self.charge('pi_amount', 700)
+        output = self.reconcile()
+        self.assertReconciled(payment, 'amount_mismatch', amount='5.00')
+        self.assertIn('recorded $5.00, charged $7.00', output)
+
+    def test_amount_mismatch_is_corrected_with_fix(self):
+        payment = self.payment('pi_amount', '5.00')
+        self.charge('pi_amount', 700)
+        self.reconcile('--fix')
+        self.assertReconciled(payment, 'corrected', amount='7.00')
+
+    def test_missing_charge(self):
+        fine = self.fine()
+        never_charged = self.payment('pi_gone', '4.00', fines=[fine])
+        declined = self.payment('pi_declined', '3.00')
+        self.charge('pi_declined', 300, status='requires_payment_method')
+
+        self.reconcile()
+        self.assertReconciled(never_charged, 'missing')
+        self.assertReconciled(declined, 'missing')
+        fine.refresh_from_db()
+        self.assertEqual(fine.status, 'paid')
+
+        self.reconcile('--fix')
+        self.assertReconciled(never_charged, 'missing', status='failed')
+        self.assertReconciled(declined, 'missing', status='failed')
+        fine.refresh_from_db()
+        self.assertEqual((fine.status, fine.payment_date), ('pending', None))
+
+    def test_duplicate_record_of_one_charge(self):
+        fine = self.fine()
+        first = self.payment('pi_twice', '4.00', fines=[fine], minutes_ago=61)
+        replayed = self.payment('pi_twice', '4.00', fines=[fine], minutes_ago=60)
+        self.charge('pi_twice', 400)
+
+        self.reconcile('--fix')
+        self.assertReconciled(first, 'matched')
+        self.assertReconciled(replayed, 'duplicate', status='failed')
+        # Still covered by the first payment
+        fine.refresh_from_db()
+        self.assertEqual(fine.status, 'paid')
+
+    def test_unrecorded_charge(self):
+        self.charge('pi_unrecorded', 250)
+        output = self.reconcile()
+        self.assertIn('unrecorded pi_unrecorded: $2.50 charged, no payment', output)
+        self.assertIn('1 unrecorded charge(s)', output)
+
+    def test_orphaned_fines_are_relinked(self):
+        payment = self.payment('pi_paid', '4.00', minutes_ago=60)
+        self.charge('pi_paid', 400)
+        orphan = self.fine(paid_minutes_ago=59)
+        stray = self.fine(paid_minutes_ago=30)
+
+        output = self.reconcile()
+        self.assertIn(f'orphaned   fine {stray.pk}', output)
+        self.assertIn('1 orphaned fine(s) can be relinked with --fix', output)
+        self.assertFalse(payment.fines.exists())
+
+        self.reconcile('--fix')
+        self.assertEqual(list(payment.fines.all()), [orphan])
+        self.assertFalse(stray.payments.exists())
+
+
+class PaymentSuccessTests(TestCase):
+    def test_links_the_fines_it_pays(self):
+        member = make_member('alice')
+        borrow = Borrow.objects.create(
+            book=make_book(), member=member, due_date=date.today() - timedelta(days=10), status='returned'
+        )
+        owed = [
+            Fine.objects.create(borrow=borrow, amount=Decimal(amount), reason='Late return', due_date=date.today())
+            for amount in ['1.50', '2.50']
+        ]
+        self.client.force_login(member.user)
+        response = self.client.post(
+            '/payments/success/', json.dumps({'payment_intent_id': 'pi_ok', 'amount': '4.00'}),
+            content_type='application/json',
+        )
+
+        self.assertEqual(response.status_code, 200)
+        payment = Payment.objects.get(stripe_payment_intent_id='pi_ok')
+        self.assertEqual(payment.amount, Decimal('4.00'))
+        self.assertEqual(set(payment.fines.all()), set(owed))
+        self.assertEqual(set(Fine.objects.values_list('status', flat=True)), {'paid'})
+
+
+class StartupBudgetTests(SimpleTestCase):
+    """What every management command and gunicorn worker pays before doing any work"""
+    # Wall-clock time depends on the machine; set STARTUP_BUDGET_SECONDS to enforce it
+    budget = float(os.environ.get('STARTUP_BUDGET_SECONDS') or 0)
+    # Imported inside the functions that need them; never at startup
+    lazy_modules = ['stripe', 'numpy', 'scipy']
+
+    def manage_check(self, *flags):
+        return subprocess.run(
+            [sys.executable, *flags, 'manage.py', 'check'],
+            cwd=settings.BASE_DIR, capture_output=True, text=True, check=True,
+        )
+
+    def test_lazy_modules_stay_out_of_startup(self):
+        imported = {
+            line.rpartition('|')[2].strip().split('.')[0]
+            for line in self.manage_check('-X', 'importtime').stderr.splitlines()
+            if line.startswith('import time:')
+        }
+        self.assertEqual(sorted(imported.intersection(self.lazy_modules)), [], 'imported at startup')
+
+    @unittest.skipUnless(budget, 'STARTUP_BUDGET_SECONDS is not set')
+    def test_check_within_budget(self):
+        timings = []
+        for _ in range(3):
+            start = time.perf_counter()
+            self.manage_check()
+            timings.append(time.perf_counter() - start)
+        self.assertLessEqual(min(timings), self.budget, 'manage.py check is over the startup budget')
+
+
+class RenewalTests(TestCase):
+    def setUp(self):
+        self.member = make_member('alice')
+        self.book = make_book()
+        self.today = timezone.localdate()
+        self.borrow = Borrow.objects.create(book=self.book, member=self.member, due_date=self.today + timedelta(days=3))
+
+    def test_renewal_limit(self):
+        for renewal in range(1, circulation.MAX_RENEWALS + 1):
+            self.assertEqual(circulation.renew([self.borrow]), [self.borrow.pk])
+            self.borrow.refresh_from_db()
+            self.assertEqual(self.borrow.renewal_count, renewal)
+            self.assertEqual(
+                self.borrow.due_date, self.today + timedelta(days=3 + renewal * circulation.LOAN_PERIOD_DAYS)
+            )
+
+        self.assertEqual(circulation.renew([self.borrow]), [])
+        self.assertIn('already been renewed', circulation.renewal_block_reason(self.borrow))
+        self.borrow.refresh_from_db()
+        self.assertEqual(self.borrow.renewal_count, circulation.MAX_RENEWALS)
+
+    def test_hold_blocks_renewal(self):
+        self.assertIsNone(circulation.renewal_block_reason(self.borrow))
+        Reservation.objects.create(
+            book=self.book, member=make_member('bob'), expiry_date=timezone.now() + timedelta(days=7)
+        )
+        self.assertEqual(circulation.renewal_block_reason(self.borrow), 'Another member has reserved this book.')
+        self.assertEqual(circulation.renew([self.borrow]), [])
+        self.borrow.refresh_from_db()
+        self.assertEqual((self.borrow.renewal_count, self.borrow.due_date), (0, self.today + timedelta(days=3)))
+
+    def test_overdue_borrow_is_not_renewed(self):
+        Borrow.objects.filter(pk=self.borrow.pk).update(due_date=self.today - timedelta(days=1), status='overdue')
+        self.borrow.refresh_from_db()
+        self.assertEqual(circulation.renewal_block_reason(self.borrow), 'Only active borrows can be renewed.')
+        self.assertEqual(circulation.renew([self.borrow]), [])
+
+    def test_extend_due_dates_moves_open_borrows_only(self):
+        overdue = Borrow.objects.create(
+            book=self.book, member=self.member, due_date=self.today - timedelta(days=2), status='overdue'
+        )
+        returned = Borrow.objects.create(
+            book=self.book, member=self.member, due_date=self.today - timedelta(days=2), status='returned'
+        )
+        call_command('extend_due_dates', '5', stdout=StringIO())
+
+        due = dict(Borrow.objects.values_list('pk', 'due_date'))
+        self.assertEqual(due[self.borrow.pk], self.today + timedelta(days=8))
+        self.assertEqual(due[overdue.pk], self.today + timedelta(days=3))
+        self.assertEqual(due[returned.pk], self.today - timedelta(days=2))
+        # A closure extension is not a renewal
+        self.assertEqual(set(Borrow.objects.values_list('renewal_count', flat=True)), {0})
+
+
+class CatalogConditionalGetTests(TestCase):
+    """Changes that a catalog card shows must change the catalog ETag"""
+
+    def setUp(self):
+        self.category = Category.objects.create(name='Fiction')
+        self.author = Author.objects.create(name='Ann Author')
+        self.category = Category.objects.create(name='Science')
+        self.book = make_book(category=self.category)
+        self.book.authors.add(self.author)
+
+    def assertStale(self, change):
+        etag = self.client.get('/books/')['ETag']
+        self.assertEqual(self.client.get('/books/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        change()
+        self.assertEqual(self.client.get('/books/', HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_author_rename(self):
+        def rename():
+            self.author.name = 'Ann Writer'
+            self.author.save()
+        self.assertStale(rename)
+
+    def test_category_rename(self):
+        def rename():
+            self.category.name = 'Literature'
+            self.category.save()
+        self.assertStale(rename)
+
+    def test_author_links(self):
+        other = Author.objects.create(name='Bea Author')
+        self.assertStale(lambda: self.book.authors.add(other))
+        self.assertStale(lambda: self.book.authors.remove(other))
+        self.assertStale(lambda: other.books.add(self.book))
+        self.assertStale(lambda: other.books.clear())
+
+
+@override_settings(ARCHIVE_RETENTION_DAYS=30)
+class ArchiveHistoryTests(TestCase):
+    def setUp(self):
+        self.member = make_member('alice')
+        self.book = make_book()
+        self.now = timezone.now()
+
+    def borrow(self, days_ago, status='returned'):
+        borrow = Borrow.objects.create(
+            book=self.book, member=self.member, due_date=date.today(), status=status,
+            return_date=self.now - timedelta(days=days_ago) if status == 'returned' else None,
+        )
+        Borrow.objects.filter(pk=borrow.pk).update(borrow_date=self.now - timedelta(days=days_ago + 14))
+        return borrow
+
+    def payment(self, days_ago, fines=()):
+        payment = Payment.objects.create(
+            member=self.member, amount=Decimal('2.00'), payment_method='cash', status='completed',
+            description='Fine payment',
+        )
+        Payment.objects.filter(pk=payment.pk).update(payment_date=self.now - timedelta(days=days_ago))
+        payment.fines.set(fines)
+        return payment
+
+    def fine(self, borrow, status='paid'):
+        return Fine.objects.create(
+            borrow=borrow, amount=Decimal('2.00'), reason='Late return', due_date=date.today(), status=status
+        )
+
+    def history(self):
+        return (
+            [(borrow.pk, borrow.borrow_date) for borrow in archive.borrow_history(self.member, True)],
+            [(payment.pk, payment.payment_date) for payment in archive.payment_history(self.member, True)],
+        )
+
+    def test_moves_closed_history_and_keeps_it_visible(self):
+        old_returned = [self.borrow(days_ago) for days_ago in (400, 200, 90)]
+        settled = self.fine(old_returned[0])
+        old_payment = self.payment(300, fines=[settled])
+        recent_payment = self.payment(5)
+        recent_returned = self.borrow(5)
+        still_open = self.borrow(100, status='active')
+        unpaid = self.borrow(120)
+        self.fine(unpaid, status='pending')
+        old_hold = Reservation.objects.create(
+            book=self.book, member=self.member, expiry_date=self.now - timedelta(days=60), status='expired'
+        )
+        recent_hold = Reservation.objects.create(
+            book=self.book, member=self.member, expiry_date=self.now - timedelta(days=2), status='cancelled'
+        )
+        before = self.history()
+
+        output = StringIO()
+        call_command('archive_history', stdout=output)
+        self.assertIn('Archived 1 payments, 3 borrows, 1 reservations.', output.getvalue())
+
+        self.assertEqual(self.history(), before)
+        self.assertEqual([borrow_id for borrow_id, _ in before[0]], [
+            recent_returned.pk, old_returned[2].pk, still_open.pk, unpaid.pk, old_returned[1].pk,
+            old_returned[0].pk,
+        ])
+        self.assertEqual(
+            set(Borrow.objects.values_list('pk', flat=True)), {recent_returned.pk, still_open.pk, unpaid.pk}
+        )
+        self.assertEqual(list(Payment.objects.values_list('pk', flat=True)), [recent_payment.pk])
+        self.assertEqual(list(Reservation.objects.values_list('pk', flat=True)), [recent_hold.pk])
+        self.assertEqual(ArchivedPayment.objects.get().fine_ids, [settled.pk])
+        self.assertEqual(ArchivedFine.objects.get().borrow_id, old_returned[0].pk)
+        self.assertEqual(ArchivedReservation.objects.get().pk, old_hold.pk)
+        self.assertEqual(Fine.objects.get().status, 'pending')
+
+        self.assertEqual(archive.archive_closed(), {'payments': 0, 'borrows': 0, 'reservations': 0})
+
+    def test_history_without_archive_is_live_only(self):
+        self.borrow(400)
+        recent = self.borrow(5)
+        archive.archive_closed()
+        self.assertEqual(list(archive.borrow_history(self.member)), [recent])
+
+
+class RecommendationTests(TestCase):
+    def setUp(self):
+        self.members = [make_member(f'reader{i}') for i in range(6)]
+        self.books = [make_book(title=f'Book {i}', isbn=f'{i:013d}') for i in range(6)]
+
+    def lend(self, member, *books):
+        for book in books:
+            Borrow.objects.create(
+                book=self.books[book], member=self.members[member], due_date=date.today(), status='returned'
+            )
+
+    def stored(self):
+        return {
+            (book_id, recommended_id): round(score, 5)
+            for book_id, recommended_id, score in BookRecommendation.objects.values_list(
+                'book_id', 'recommended_id', 'score'
+            )
+        }
+
+    def test_incremental_build_matches_full_build(self):
+        self.lend(0, 0, 1)
+        self.lend(1, 1, 2)
+        self.lend(2, 3, 4)
+        self.lend(3, 4, 5)
+        self.lend(4, 0)
+        recommendations.build(full=True)
+        self.assertNotIn((self.books[1].pk, self.books[3].pk), self.stored())
+
+        # Book 1 has no new activity, but its earlier reader now also read book 3
+        self.lend(0, 3)
+        recommendations.build()
+        incremental = self.stored()
+        self.assertIn((self.books[1].pk, self.books[3].pk), incremental)
+
+        recommendations.build(full=True)
+        self.assertEqual(incremental, self.stored())
+
+
+@override_settings(RATELIMIT_ENABLE=True, RATELIMIT_IP_HEADER='REMOTE_ADDR')
+class RateLimitTests(SimpleTestCase):
+    def setUp(self):
+        caches[settings.RATELIMIT_CACHE].clear()
+
+    def hit_at(self, seconds, limit=3, period=60):
+        with mock.patch('library.ratelimit.time.time', return_value=seconds):
+            return ratelimit.hit('scope', 'ip:10.0.0.1', limit, period)
+
+    def test_sliding_window(self):
+        self.assertEqual([self.hit_at(120), self.hit_at(121), self.hit_at(122)], [0, 0, 0])
+        # Over the limit within its own window: wait for the window to end
+        self.assertEqual(self.hit_at(123), 57)
+        # 15s into the next window, 3/4 of the previous window's 4 hits still count
+        self.assertEqual(self.hit_at(195), 15)
+        # 45s in, only a quarter of them do
+        self.assertEqual(self.hit_at(225), 0)
+        # Once a whole window has passed, the old hits are forgotten
+        self.assertEqual([self.hit_at(300), self.hit_at(301), self.hit_at(302)], [0, 0, 0])
+
+    def test_clients_and_scopes_are_counted_apart(self):
+        self.assertEqual([self.hit_at(120, limit=1), self.hit_at(121, limit=1)], [0, 59])
+        with mock.patch('library.ratelimit.time.time', return_value=122):
+            self.assertEqual(ratelimit.hit('scope', 'ip:10.0.0.2', 1, 60), 0)
+            self.assertEqual(ratelimit.hit('other', 'ip:10.0.0.1', 1, 60), 0)
+
+    def test_blocked_request_gets_429_before_the_view(self):
+        calls = []
+
+        @ratelimit.ratelimit('2/m', group='test')
+        def view(request):
+            calls.append(request)
+            return HttpResponse('ok')
+
+        factory = RequestFactory()
+        with mock.patch('library.ratelimit.time.time', return_value=1000):
+            statuses = [view(factory.post('/')).status_code for _ in range(2)]
+            self.assertEqual(view(factory.get('/')).status_code, 200)
+            blocked = view(factory.post('/', HTTP_ACCEPT='application/json'))
+            plain = view(factory.post('/'))
+
+        self.assertEqual(statuses, [200, 200])
+        self.assertEqual(len(calls), 3)
+        self.assertEqual((blocked.status_code, blocked['Retry-After']), (429, '20'))
+        self.assertFalse(json.loads(blocked.content)['success'])
+        self.assertEqual((plain.status_code, plain['Content-Type']), (429, 'text/plain; charset=utf-8'))
+
+    @override_settings(RATELIMIT_ENABLE=False)
+    def test_disabled(self):
+        view = ratelimit.ratelimit('1/m', group='test')(lambda request: HttpResponse('ok'))
+        self.assertEqual([view(RequestFactory().post('/')).status_code for _ in range(3)], [200, 200, 200])
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboxTests(TestCase):
+    def setUp(self):
+        # Events below are created after this, so drain on a clock slightly ahead
+        self.now = timezone.now() + timedelta(minutes=1)
+        self.handlers = mock.patch.dict(outbox.HANDLERS, {
+            'test.ok': lambda payload: Category.objects.create(name=payload['name']),
+            'test.fail': self.failing,
+        })
+        self.handlers.start()
+        self.addCleanup(self.handlers.stop)
+
+    def failing(self, payload):
+        Category.objects.create(name=payload['name'])
+        raise RuntimeError('boom')
+
+    def drain_at(self, seconds_later=0):
+        with mock.patch('library.outbox.timezone.now', return_value=self.now + timedelta(seconds=seconds_later)):
+            return outbox.drain()
+
+    def test_failing_handler_rolls_back_only_its_own_writes(self):
+        failed = outbox.enqueue('test.fail', name='lost')
+        delivered = outbox.enqueue('test.ok', name='kept')
+        self.assertEqual(self.drain_at(), 2)
+
+        self.assertEqual(list(Category.objects.values_list('name', flat=True)), ['kept'])
+        failed.refresh_from_db()
+        delivered.refresh_from_db()
+        self.assertEqual((delivered.attempts, delivered.processed_date), (1, self.now))
+        self.assertIsNone(failed.processed_date)
+        self.assertEqual(failed.last_error, 'RuntimeError: boom')
+
+    def test_retries_back_off_and_stop_after_max_attempts(self):
+        event = outbox.enqueue('test.fail', name='lost')
+        elapsed = 0
+        for attempt in range(1, outbox.MAX_ATTEMPTS + 1):
+            self.assertEqual(self.drain_at(elapsed), 1)
+            event.refresh_from_db()
+            delay = outbox.RETRY_BASE_SECONDS * 2 ** (attempt - 1)
+            self.assertEqual(event.attempts, attempt)
+            self.assertEqual(event.available_date, self.now + timedelta(seconds=elapsed + delay))
+            # Not due again before its backoff has passed
+            self.assertEqual(self.drain_at(elapsed + delay - 1), 0)
+            elapsed += delay
+        self.assertEqual(self.drain_at(elapsed), 0)
+        self.assertFalse(outbox.pending(self.now + timedelta(seconds=elapsed)).exists())
+
+    def test_retry_that_succeeds_clears_the_error(self):
+        event = outbox.enqueue('test.fail', name='first')
+        self.drain_at()
+        outbox.HANDLERS['test.fail'] = outbox.HANDLERS['test.ok']
+        self.assertEqual(self.drain_at(outbox.RETRY_BASE_SECONDS), 1)
+        event.refresh_from_db()
+        self.assertEqual((event.attempts, event.last_error), (2, ''))
+        self.assertIsNotNone(event.processed_date)
+
+    def test_redelivered_return_notifies_the_hold_once(self):
+        book = make_book()
+        holder = make_member('alice')
+        Reservation.objects.create(book=book, member=holder, expiry_date=timezone.now() + timedelta(days=3))
+        event = outbox.enqueue('borrow.returned', borrow_id='x', book_id=book.pk)
+        call_command('run_worker', '--once', stdout=StringIO())
+        # A worker that died after the side effect delivers the event again
+        OutboxEvent.objects.filter(pk=event.pk).update(processed_date=None)
+        call_command('run_worker', '--once', stdout=StringIO())
+
+        self.assertEqual([message.to for message in mail.outbox], [['alice@example.com']])
+        self.assertEqual(Notice.objects.filter(kind='hold_available').count(), 1)
+        event.refresh_from_db()
+        self.assertEqual(event.attempts, 2)
+
+
+class IsbnTests(SimpleTestCase):
+    def test_every_spelling_normalizes_to_the_isbn13(self):
+        for value in [
+            '9780306406157', '978-0-306-40615-7', 'ISBN: 978 0 306 40615 7', '0-306-40615-2', '0306406152',
+            '978030640615751499',  # EAN with a price add-on
+        ]:
+            with self.subTest(value=value):
+                self.assertEqual(isbn.normalize(value), '9780306406157')
+
+    def test_isbn10_with_x_check_digit(self):
+        self.assertEqual(isbn.normalize('0-8044-2957-x'), '9780804429573')
+        self.assertEqual(isbn.to_isbn10('9780804429573'), '080442957X')
+
+    def test_invalid_isbns_do_not_normalize(self):
+        for value in ['9780306406158', '0306406153', '12345', 'not an isbn', '']:
+            with self.subTest(value=value):
+                self.assertIsNone(isbn.normalize(value))
+
+    def test_lookup(self):
+        self.assertEqual(isbn.lookup('0-306-40615-2'), Q(isbn_normalized='9780306406157'))
+        self.assertEqual(isbn.lookup('978-0306406158', prefix='book__'), Q(book__isbn='9780306406158'))
+        self.assertIsNone(isbn.lookup('dune'))
+
+
+class BookIsbnTests(TestCase):
+    def setUp(self):
+        self.book = make_book(isbn='978-0-306-40615-7')
+        self.author = Author.objects.create(name='Ann Author')
+        self.category = Category.objects.create(name='Science')
+
+    def form(self, value, instance=None):
+        return BookForm({
+            'title': 'Copy', 'authors': [self.author.pk], 'category': self.category.pk, 'isbn': value,
+            'language': 'English', 'total_copies': 1,
+        }, instance=instance)
+
+    def test_save_stores_compact_and_canonical_isbn(self):
+        self.assertEqual((self.book.isbn, self.book.isbn_normalized), ('9780306406157', '9780306406157'))
+
+    def test_form_rejects_another_spelling_of_an_existing_isbn(self):
+        for value in ['0-306-40615-2', '978 0306406157']:
+            with self.subTest(value=value):
+                form = self.form(value)
+                self.assertFalse(form.is_valid())
+                self.assertEqual(list(form.errors), ['isbn'])
+
+    def test_form_accepts_the_books_own_isbn(self):
+        self.assertTrue(self.form('0306406152', instance=self.book).is_valid())
+        self.assertTrue(self.form('0-8044-2957-X').is_valid())
+
+    def test_book_with_legacy_isbn_can_be_borrowed(self):
+        # Stored before validation existed; no canonical form to look it up by
+        legacy = make_book(title='Old', isbn='0000000001')
+        member = make_member('alice')
+        self.assertEqual(legacy.isbn_normalized, '')
+
+        self.assertEqual(circulation.check_out(member, ['0000000001'])[0]['success'], False)
+        result = circulation.check_out(member, [legacy])[0]
+        self.assertEqual((result['item'], result['success']), ('0000000001', True))
+
+        self.client.force_login(member.user)
+        response = self.client.post(f'/books/{legacy.pk}/borrow/', HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Borrow.objects.filter(book=legacy, member=member).count(), 2)
+
+
+class AuthorSearchTests(TestCase):
+    def test_search_without_pg_trgm_matches_the_key(self):
+        tolkien = Author.objects.create(name='J. R. R. Tolkien')
+        self.assertEqual(list(authors.matching('Tolkien, J.R.R.')), [tolkien])
+        self.assertEqual(list(authors.matching('tolkien')), [tolkien])
+        self.assertEqual(list(authors.matching('Tolkein')), [])
+
+    def test_missing_privilege_for_pg_trgm_is_logged(self):
+        database = mock.MagicMock(vendor='postgresql')
+        database.cursor.return_value.__enter__.return_value.execute.side_effect = ProgrammingError(
+            'permission denied to create extension "pg_trgm"'
+        )
+        with mock.patch('library.authors.connections', {'default': database}), \
+                self.assertLogs('library.authors', 'WARNING') as logs:
+            authors.ensure_trigram_index()
+        self.assertIn('CREATE EXTENSION pg_trgm', logs.output[0])
+
+
+class AvailabilityFeedTests(TestCase):
+    url = '/feed/availability.jsonl'
+
+    def setUp(self):
+        start = timezone.now() - timedelta(hours=1)
+        self.books = [make_book(title=f'Book {i}', isbn=isbn) for i, isbn in enumerate(
+            ['9780306406157', '9780804429573', '9781861972712', '9780131103627']
+        )]
+        # The last two changed in the same microsecond, so only the id orders them
+        for book, minutes in zip(self.books, [0, 1, 2, 2]):
+            Book.objects.filter(pk=book.pk).update(updated_date=start + timedelta(minutes=minutes))
+
+    def fetch(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+    def test_pages_resume_from_the_last_cursor(self):
+        seen, cursor = [], ''
+        for _ in range(4):
+            rows = self.fetch(limit=1, cursor=cursor)
+            if not rows:
+                break
+            seen.append(rows[0]['id'])
+            cursor = rows[0]['cursor']
+        self.assertEqual(seen, [book.pk for book in self.books])
+        self.assertEqual(self.fetch(cursor=cursor), [])
+
+    def test_fresh_changes_wait_until_settled(self):
+        self.books[0].save()
+        self.assertEqual([row['id'] for row in self.fetch()], [book.pk for book in self.books[1:]])
+        with override_settings(FEED_SETTLE_SECONDS=-60):
+            self.assertEqual([row['id'] for row in self.fetch()][-1], self.books[0].pk)
+
+    def test_bad_cursor_or_limit_is_a_400(self):
+        for params in [
+            {'cursor': 'abc'}, {'cursor': '99999999999999999999-1'}, {'cursor': '-1'},
+            {'cursor': f'1-{2 ** 63}'}, {'limit': '0'}, {'limit': str(feed.MAX_PAGE_SIZE + 1)}, {'limit': 'all'},
+        ]:
+            with self.subTest(**params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
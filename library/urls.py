@@ -1,31 +1,44 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
 from . import views
+from .ratelimit import ratelimit
 
+# Rate limits are per client (user, else IP) and per URL name; see library/ratelimit.py
 urlpatterns = [
     # Home and catalog
     path('', views.home, name='home'),
     path('books/', views.book_catalog, name='book_catalog'),
     path('books/<int:book_id>/', views.book_detail, name='book_detail'),
+    path('feed/availability.jsonl', views.availability_feed, name='availability_feed'),
     
     # Book actions
-    path('books/<int:book_id>/borrow/', views.borrow_book, name='borrow_book'),
-    path('books/<int:book_id>/reserve/', views.reserve_book, name='reserve_book'),
-    path('books/<int:book_id>/review/', views.add_review, name='add_review'),
+    path('books/<int:book_id>/borrow/', ratelimit('10/m')(views.borrow_book), name='borrow_book'),
+    path('books/<int:book_id>/reserve/', ratelimit('10/m')(views.reserve_book), name='reserve_book'),
+    path('books/<int:book_id>/review/', ratelimit('5/m')(views.add_review), name='add_review'),
     
     # Member borrows
     path('my-borrows/', views.my_borrows, name='my_borrows'),
-    path('return-book/<int:borrow_id>/', views.return_book, name='return_book'),
+    path('return-book/<uuid:borrow_id>/', views.return_book, name='return_book'),
+    path('borrows/<uuid:borrow_id>/renew/', views.renew_borrow, name='renew_borrow'),
+    
+    # Circulation desk (staff)
+    path('desk/check-in/', views.desk_check_in, name='desk_check_in'),
+    path('desk/check-out/', views.desk_check_out, name='desk_check_out'),
+    path('desk/items/<str:barcode>/', views.desk_item, name='desk_item'),
+    
+    # Request profiles (staff)
+    path('staff/profiles/', views.profile_list, name='profile_list'),
+    path('staff/profiles/<str:url_name>/<str:filename>/', views.profile_detail, name='profile_detail'),
     
     # Payments
     path('payments/', views.payment_dashboard, name='payment_dashboard'),
     path('payments/history/', views.payment_history, name='payment_history'),
-    path('payments/create-intent/', views.create_payment_intent, name='create_payment_intent'),
+    path('payments/create-intent/', ratelimit('5/m')(views.create_payment_intent), name='create_payment_intent'),
     path('payments/success/', views.payment_success, name='payment_success'),
     
     # Authentication
     path('register/', views.register, name='register'),
-    path('login/', auth_views.LoginView.as_view(template_name='library/login.html'), name='login'),
+    path('login/', ratelimit('5/m')(auth_views.LoginView.as_view(template_name='library/login.html')), name='login'),
     path('logout/', auth_views.LogoutView.as_view(next_page='home'), name='logout'),
     
     # Profile
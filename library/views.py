@@ -3,26 +3,85 @@ from django.contrib.auth import login, authenticate
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.forms import UserCreationForm
 from django.contrib import messages
-from django.db.models import Q, Count, Sum, Avg
+from django.contrib.admin.views.decorators import staff_member_required
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Count, Sum, Avg, Max, OuterRef, Prefetch, Subquery
 from django.utils import timezone
-from django.http import JsonResponse, HttpResponse
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.http import JsonResponse, HttpResponse, Http404, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
-from django.views.decorators.http import require_POST
+from django.views.decorators.http import require_POST, condition
 from django.core.paginator import Paginator
 from datetime import timedelta
-import stripe
+from decimal import Decimal
+from functools import wraps
+import hashlib
 import json
 
 from .models import (
-    Book, Author, Category, Member, Borrow, 
-    Fine, Payment, Reservation, Review
+    Book, BookCopy, Author, Category, Member, Borrow, 
+    Fine, Payment, Reservation, Review, BookRecommendation
 )
+from . import archive, authors, circulation, feed, isbn, outbox, profiling, recommendations
 from .forms import (
     BookForm, AuthorForm, CategoryForm, MemberForm,
     BorrowForm, ReviewForm, UserUpdateForm, MemberUpdateForm
 )
 
 
+def _wants_json(request):
+    """Whether the client asked for a JSON response instead of a redirect"""
+    return (
+        request.content_type == 'application/json'
+        or 'application/json' in request.headers.get('Accept', '')
+    )
+
+
+def _json_body(request):
+    """Decoded JSON request body, or an empty dict if it is missing or malformed"""
+    try:
+        data = json.loads(request.body or '{}')
+    except ValueError:
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def _action_error(request, message, redirect_to, status=400, **kwargs):
+    """Report a failed book action as JSON or as a flash message and redirect"""
+    if _wants_json(request):
+        return JsonResponse({'success': False, 'error': message}, status=status)
+    messages.error(request, message)
+    return redirect(redirect_to, **kwargs)
+
+
+def _action_success(request, message, payload, redirect_to, **kwargs):
+    """Report a successful book action as JSON or as a flash message and redirect"""
+    if _wants_json(request):
+        return JsonResponse({'success': True, 'message': message, **payload})
+    messages.success(request, message)
+    return redirect(redirect_to, **kwargs)
+
+
+def _book_counters(book):
+    """Compact availability counters for patching the UI in place"""
+    return {
+        'book_id': book.id,
+        'status': book.status,
+        'available_copies': book.available_copies,
+        'total_copies': book.total_copies,
+    }
+
+
+def _member_counters(member):
+    """Compact borrowing counters for patching the UI in place"""
+    return {
+        'current_books_borrowed': member.current_books_borrowed,
+        'max_books_allowed': member.max_books_allowed,
+        'can_borrow': member.can_borrow,
+    }
+
+
 def home(request):
     """Home page with library statistics and featured books"""
     if request.user.is_authenticated:
@@ -46,9 +105,7 @@ def home(request):
     active_borrows_count = Borrow.objects.filter(status='active').count()
     
     # Featured books (highly rated)
-    featured_books = Book.objects.annotate(
-        avg_rating=Avg('reviews__rating')
-    ).filter(avg_rating__gte=4).order_by('-avg_rating')[:6]
+    featured_books = _book_cards(Book.objects.all()).filter(avg_rating__gte=4).order_by('-avg_rating')[:6]
     
     context = {
         'member': member,
@@ -59,20 +116,64 @@ def home(request):
         'total_members': total_members,
         'active_borrows_count': active_borrows_count,
         'featured_books': featured_books,
+        'recommended_books': recommendations.for_member(member) if member else [],
     }
     return render(request, 'library/home.html', context)
 
 
-def book_catalog(request):
-    """Book catalog with search and filtering"""
+def _cache_headers(view):
+    """Cache-Control/Vary for pages whose markup depends on who is signed in"""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if request.user.is_authenticated:
+            # Per-user copies may be kept by the browser but must be revalidated
+            patch_cache_control(response, private=True, no_cache=True)
+        else:
+            patch_cache_control(response, public=True, max_age=settings.PUBLIC_PAGE_MAX_AGE)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+    return wrapped
+
+
+def _page_version(request, timestamps, *parts):
+    """
+    ETag/Last-Modified validators for a page built from `parts`.
+
+    Both are None when the page must be rendered regardless: pending flash
+    messages are consumed by rendering, so they must never be skipped.
+    """
+    if len(messages.get_messages(request)):
+        return {'etag': None, 'last_modified': None}
+    if request.user.is_authenticated:
+        parts += (request.user.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME, ''))
+    return {
+        'etag': 'W/"%s"' % hashlib.md5(repr(parts).encode()).hexdigest(),
+        'last_modified': max((ts for ts in timestamps if ts is not None), default=None),
+    }
+
+
+def _book_cards(books):
+    """Books with everything a book card shows fetched up front, not queried per card while rendering"""
+    return books.select_related('category').prefetch_related(
+        Prefetch('authors', queryset=Author.objects.order_by('pk'))
+    ).annotate(avg_rating=Avg('reviews__rating'), review_count=Count('reviews', distinct=True))
+
+
+def _filtered_books(request):
+    """Catalog queryset narrowed by the search/category/status parameters"""
     books = Book.objects.all()
     
     # Search functionality
     search_query = request.GET.get('search', '')
-    if search_query:
+    isbn_match = isbn.lookup(search_query)
+    if isbn_match is not None:
+        # Scanned or typed ISBNs go straight to the indexed canonical column
+        books = books.filter(isbn_match)
+    elif search_query:
         books = books.filter(
             Q(title__icontains=search_query) |
-            Q(authors__name__icontains=search_query) |
+            Q(authors__in=authors.matching(search_query)) |
             Q(isbn__icontains=search_query)
         ).distinct()
     
@@ -86,6 +187,55 @@ def book_catalog(request):
     if status_filter:
         books = books.filter(status=status_filter)
     
+    return books
+
+
+def _catalog_version(request):
+    """Cheap version lookup for the catalog page, computed once per request"""
+    if not hasattr(request, '_catalog_version'):
+        books = _filtered_books(request).aggregate(
+            last_modified=Max('updated_date'), count=Count('id')
+        )
+        reviews = Review.objects.aggregate(last_modified=Max('review_date'), count=Count('id'))
+        request._catalog_version = _page_version(
+            request, [books['last_modified'], reviews['last_modified']],
+            sorted(request.GET.lists()),
+            books['last_modified'], books['count'],
+            reviews['last_modified'], reviews['count'],
+        )
+    return request._catalog_version
+
+
+def _book_version(request, book_id):
+    """Cheap version lookup for a book detail page, computed once per request"""
+    if not hasattr(request, '_book_version'):
+        last_recommended = BookRecommendation.objects.filter(
+            book=OuterRef('pk')
+        ).order_by('-computed_date').values('computed_date')[:1]
+        version = Book.objects.filter(id=book_id).annotate(
+            last_review=Max('reviews__review_date'), review_count=Count('reviews'),
+            last_recommended=Subquery(last_recommended)
+        ).values_list('updated_date', 'last_review', 'last_recommended', 'review_count').first()
+        if version is None:
+            # Let the view raise the 404
+            request._book_version = {'last_modified': None, 'etag': None}
+        else:
+            request._book_version = _page_version(request, version[:3], book_id, *version)
+    return request._book_version
+
+
+@_cache_headers
+@condition(
+    etag_func=lambda request: _catalog_version(request)['etag'],
+    last_modified_func=lambda request: _catalog_version(request)['last_modified'],
+)
+def book_catalog(request):
+    """Book catalog with search and filtering"""
+    books = _book_cards(_filtered_books(request))
+    search_query = request.GET.get('search', '')
+    category_filter = request.GET.get('category', '')
+    status_filter = request.GET.get('status', '')
+    
     # Sorting
     sort_by = request.GET.get('sort', 'title')
     if sort_by == 'title':
@@ -93,7 +243,7 @@ def book_catalog(request):
     elif sort_by == 'author':
         books = books.order_by('authors__name')
     elif sort_by == 'rating':
-        books = books.annotate(avg_rating=Avg('reviews__rating')).order_by('-avg_rating')
+        books = books.order_by('-avg_rating')
     elif sort_by == 'newest':
         books = books.order_by('-added_date')
     
@@ -115,6 +265,22 @@ def book_catalog(request):
     return render(request, 'library/book_catalog.html', context)
 
 
+def availability_feed(request):
+    """Book availability as JSON Lines, oldest change first, resuming after ?cursor="""
+    try:
+        rows = feed.changes(request.GET.get('cursor'), int(request.GET.get('limit', feed.PAGE_SIZE)))
+    except ValueError:
+        return JsonResponse({'error': f'Invalid cursor, or limit not between 1 and {feed.MAX_PAGE_SIZE}.'}, status=400)
+    response = StreamingHttpResponse(feed.lines(rows), content_type='application/x-ndjson')
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+@_cache_headers
+@condition(
+    etag_func=lambda request, book_id: _book_version(request, book_id)['etag'],
+    last_modified_func=lambda request, book_id: _book_version(request, book_id)['last_modified'],
+)
 def book_detail(request, book_id):
     """Detailed view of a single book"""
     book = get_object_or_404(Book, id=book_id)
@@ -137,6 +303,7 @@ def book_detail(request, book_id):
         'reviews': reviews,
         'user_review': user_review,
         'avg_rating': avg_rating,
+        'recommended_books': recommendations.for_book(book),
     }
     return render(request, 'library/book_detail.html', context)
 
@@ -150,36 +317,36 @@ def borrow_book(request, book_id):
     try:
         member = Member.objects.get(user=request.user)
     except Member.DoesNotExist:
-        messages.error(request, 'You are not registered as a library member.')
-        return redirect('book_detail', book_id=book_id)
+        return _action_error(request, 'You are not registered as a library member.',
+                             'book_detail', status=403, book_id=book_id)
     
     if not member.can_borrow:
-        messages.error(request, 'You cannot borrow more books. Return some books first.')
-        return redirect('book_detail', book_id=book_id)
+        return _action_error(request, 'You cannot borrow more books. Return some books first.',
+                             'book_detail', status=409, book_id=book_id)
     
     if not book.is_available:
-        messages.error(request, 'This book is not available for borrowing.')
-        return redirect('book_detail', book_id=book_id)
-    
-    # Create borrow record
-    borrow = Borrow.objects.create(
-        book=book,
-        member=member,
-        due_date=timezone.now().date() + timedelta(days=14)
+        return _action_error(request, 'This book is not available for borrowing.',
+                             'book_detail', status=409, book_id=book_id)
+    
+    # Lend through the ledger so the counters are updated atomically
+    result = circulation.check_out(member, [book])[0]
+    if not result['success']:
+        return _action_error(request, result['error'], 'book_detail', status=409, book_id=book_id)
+    
+    borrow = Borrow.objects.get(borrow_id=result['borrow_id'])
+    book.refresh_from_db()
+    member.refresh_from_db()
+    
+    payload = {
+        'borrow_id': str(borrow.borrow_id),
+        'due_date': borrow.due_date.isoformat(),
+        'book': _book_counters(book),
+        'member': _member_counters(member),
+    }
+    return _action_success(
+        request, f'You have successfully borrowed "{book.title}". Due date: {borrow.due_date}',
+        payload, 'my_borrows'
     )
-    
-    # Update book availability
-    book.available_copies -= 1
-    if book.available_copies == 0:
-        book.status = 'borrowed'
-    book.save()
-    
-    # Update member's borrowed books count
-    member.current_books_borrowed += 1
-    member.save()
-    
-    messages.success(request, f'You have successfully borrowed "{book.title}". Due date: {borrow.due_date}')
-    return redirect('my_borrows')
 
 
 @login_required
@@ -191,17 +358,17 @@ def reserve_book(request, book_id):
     try:
         member = Member.objects.get(user=request.user)
     except Member.DoesNotExist:
-        messages.error(request, 'You are not registered as a library member.')
-        return redirect('book_detail', book_id=book_id)
+        return _action_error(request, 'You are not registered as a library member.',
+                             'book_detail', status=403, book_id=book_id)
     
     # Check if already reserved
-    existing_reservation = Reservation.objects.filter(
+    already_reserved = Reservation.objects.filter(
         book=book, member=member, status='active'
-    ).first()
+    ).exists()
     
-    if existing_reservation:
-        messages.error(request, 'You have already reserved this book.')
-        return redirect('book_detail', book_id=book_id)
+    if already_reserved:
+        return _action_error(request, 'You have already reserved this book.',
+                             'book_detail', status=409, book_id=book_id)
     
     # Create reservation
     reservation = Reservation.objects.create(
@@ -210,16 +377,25 @@ def reserve_book(request, book_id):
         expiry_date=timezone.now() + timedelta(days=7)
     )
     
-    messages.success(request, f'You have successfully reserved "{book.title}".')
-    return redirect('book_detail', book_id=book_id)
+    payload = {
+        'reservation_id': reservation.id,
+        'expiry_date': reservation.expiry_date.isoformat(),
+        'active_reservations': book.reservations.filter(status='active').count(),
+        'book': _book_counters(book),
+    }
+    return _action_success(
+        request, f'You have successfully reserved "{book.title}".',
+        payload, 'book_detail', book_id=book_id
+    )
 
 
 @login_required
 def my_borrows(request):
     """View user's borrowed books"""
+    include_archived = request.GET.get('archived') == '1'
     try:
         member = Member.objects.get(user=request.user)
-        borrows = Borrow.objects.filter(member=member).order_by('-borrow_date')
+        borrows = archive.borrow_history(member, include_archived)
     except Member.DoesNotExist:
         messages.error(request, 'You are not registered as a library member.')
         return redirect('home')
@@ -227,6 +403,7 @@ def my_borrows(request):
     context = {
         'borrows': borrows,
         'member': member,
+        'include_archived': include_archived,
     }
     return render(request, 'library/my_borrows.html', context)
 
@@ -235,53 +412,182 @@ def my_borrows(request):
 @require_POST
 def return_book(request, borrow_id):
     """Return a borrowed book"""
-    borrow = get_object_or_404(Borrow, id=borrow_id)
+    borrow = get_object_or_404(
+        Borrow.objects.select_related('book', 'member'), borrow_id=borrow_id
+    )
     
     # Check if the user owns this borrow
-    if borrow.member.user != request.user:
-        messages.error(request, 'You can only return your own borrowed books.')
-        return redirect('my_borrows')
+    if borrow.member.user_id != request.user.id:
+        return _action_error(request, 'You can only return your own borrowed books.',
+                             'my_borrows', status=403)
     
     if borrow.status == 'returned':
-        messages.error(request, 'This book has already been returned.')
-        return redirect('my_borrows')
-    
-    # Update borrow record
-    borrow.return_date = timezone.now()
-    borrow.status = 'returned'
-    
-    # Calculate fine if overdue
-    if borrow.is_overdue:
-        fine_amount = borrow.calculated_fine
-        if fine_amount > 0:
-            borrow.fine_amount = fine_amount
-            # Create fine record
-            Fine.objects.create(
-                borrow=borrow,
-                amount=fine_amount,
-                reason='Late return',
-                due_date=timezone.now().date() + timedelta(days=7)
-            )
+        return _action_error(request, 'This book has already been returned.',
+                             'my_borrows', status=409)
     
-    borrow.save()
+    # Return through the ledger so the counters are updated atomically
+    result = circulation.check_in([borrow.borrow_id])[0]
+    if not result['success']:
+        return _action_error(request, result['error'], 'my_borrows', status=409)
     
-    # Update book availability
+    borrow.refresh_from_db()
     book = borrow.book
-    book.available_copies += 1
-    if book.status == 'borrowed' and book.available_copies > 0:
-        book.status = 'available'
-    book.save()
-    
-    # Update member's borrowed books count
+    book.refresh_from_db()
     member = borrow.member
-    member.current_books_borrowed -= 1
-    member.save()
+    member.refresh_from_db()
     
-    messages.success(request, f'Book "{book.title}" returned successfully.')
-    if borrow.fine_amount > 0:
+    if borrow.fine_amount > 0 and not _wants_json(request):
         messages.warning(request, f'A fine of ${borrow.fine_amount} has been charged for late return.')
     
-    return redirect('my_borrows')
+    payload = {
+        'borrow_id': str(borrow.borrow_id),
+        'fine_amount': str(borrow.fine_amount),
+        'book': _book_counters(book),
+        'member': _member_counters(member),
+    }
+    return _action_success(
+        request, f'Book "{book.title}" returned successfully.', payload, 'my_borrows'
+    )
+
+
+@login_required
+@require_POST
+def renew_borrow(request, borrow_id):
+    """Renew a borrowed book for another loan period"""
+    borrow = get_object_or_404(
+        Borrow.objects.select_related('book', 'member'), borrow_id=borrow_id
+    )
+    
+    if borrow.member.user_id != request.user.id:
+        return _action_error(request, 'You can only renew your own borrowed books.',
+                             'my_borrows', status=403)
+    
+    reason = circulation.renewal_block_reason(borrow)
+    if reason or not circulation.renew([borrow]):
+        return _action_error(request, reason or 'This borrow cannot be renewed.',
+                             'my_borrows', status=409)
+    
+    borrow.refresh_from_db()
+    payload = {
+        'borrow_id': str(borrow.borrow_id),
+        'due_date': borrow.due_date.isoformat(),
+        'renewal_count': borrow.renewal_count,
+        'renewals_left': circulation.MAX_RENEWALS - borrow.renewal_count,
+    }
+    return _action_success(
+        request, f'"{borrow.book.title}" renewed. New due date: {borrow.due_date}',
+        payload, 'my_borrows'
+    )
+
+
+@staff_member_required
+@require_POST
+def desk_check_in(request):
+    """Return a batch of items (borrow IDs or ISBNs) in one transaction"""
+    items = _json_body(request).get('items') or []
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'success': False, 'error': 'Provide a list of items.'}, status=400)
+    
+    results = circulation.check_in(items)
+    return JsonResponse({
+        'success': True,
+        'processed': sum(1 for result in results if result['success']),
+        'results': results,
+    })
+
+
+@staff_member_required
+@require_POST
+def desk_check_out(request):
+    """Lend a batch of items (barcodes or ISBNs) to one member in one transaction"""
+    data = _json_body(request)
+    items = data.get('items') or data.get('isbns') or []
+    if not isinstance(items, list) or not items:
+        return JsonResponse({'success': False, 'error': 'Provide a list of items.'}, status=400)
+    
+    try:
+        member = Member.objects.get(member_id=data.get('member_id'))
+    except Member.DoesNotExist:
+        return JsonResponse({'success': False, 'error': 'Unknown member.'}, status=404)
+    
+    results = circulation.check_out(member, items)
+    return JsonResponse({
+        'success': True,
+        'processed': sum(1 for result in results if result['success']),
+        'results': results,
+    })
+
+
+@staff_member_required
+def desk_item(request, barcode):
+    """Look up a scanned copy and its open borrow by barcode"""
+    copy = BookCopy.objects.select_related('book').filter(barcode=barcode).first()
+    if copy is None:
+        return JsonResponse({'success': False, 'error': 'Unknown barcode.'}, status=404)
+    
+    borrow = copy.borrows.filter(
+        status__in=circulation.OPEN_BORROW_STATUSES
+    ).select_related('member').first()
+    return JsonResponse({
+        'success': True,
+        'barcode': copy.barcode,
+        'status': copy.status,
+        'location': copy.location or copy.book.location,
+        'book': _book_counters(copy.book),
+        'title': copy.book.title,
+        'isbn': copy.book.isbn,
+        'borrow': borrow and {
+            'borrow_id': str(borrow.borrow_id),
+            'member_id': borrow.member.member_id,
+            'due_date': borrow.due_date.isoformat(),
+        },
+    })
+
+
+@staff_member_required
+def profile_list(request):
+    """Stored request profiles grouped by URL name"""
+    return render(request, 'library/profiles.html', {
+        'title': 'Request profiles',
+        'profiles': profiling.stored_profiles(),
+        'sample_percent': settings.PROFILER_SAMPLE_RATE * 100,
+        'header': settings.PROFILER_HEADER,
+    })
+
+
+@staff_member_required
+def profile_detail(request, url_name, filename):
+    """Hottest frames of one profile, or its collapsed stacks with ?download=1"""
+    collapsed = profiling.read_profile(url_name, filename)
+    if collapsed is None:
+        raise Http404('No such profile')
+    if request.GET.get('download'):
+        response = HttpResponse(collapsed, content_type='text/plain; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{url_name}-{filename}"'
+        return response
+    
+    # Self samples per leaf frame and inclusive samples per frame
+    own, inclusive, total = {}, {}, 0
+    for line in collapsed.splitlines():
+        stack, _, count = line.rpartition(' ')
+        count = int(count)
+        frames = stack.split(';')
+        total += count
+        own[frames[-1]] = own.get(frames[-1], 0) + count
+        for frame in set(frames):
+            inclusive[frame] = inclusive.get(frame, 0) + count
+    hottest = sorted(own.items(), key=lambda item: -item[1])[:30]
+    return render(request, 'library/profile_detail.html', {
+        'title': f'{url_name} / {filename}',
+        'url_name': url_name,
+        'filename': filename,
+        'total': total,
+        'frames': [
+            {'frame': frame, 'own': count, 'inclusive': inclusive[frame],
+             'share': 100 * count / total}
+            for frame, count in hottest
+        ],
+    })
 
 
 @login_required
@@ -308,15 +614,17 @@ def payment_dashboard(request):
 @login_required
 def payment_history(request):
     """View payment history"""
+    include_archived = request.GET.get('archived') == '1'
     try:
         member = Member.objects.get(user=request.user)
-        payments = Payment.objects.filter(member=member).order_by('-payment_date')
+        payments = archive.payment_history(member, include_archived)
     except Member.DoesNotExist:
         messages.error(request, 'You are not registered as a library member.')
         return redirect('home')
     
     context = {
         'payments': payments,
+        'include_archived': include_archived,
     }
     return render(request, 'library/payment_history.html', context)
 
@@ -333,12 +641,14 @@ def create_payment_intent(request):
         if amount <= 0:
             return JsonResponse({'error': 'Invalid amount'}, status=400)
         
-        stripe.api_key = 'sk_test_your_secret_key'  # This should be from settings
+        # Imported here: the SDK costs ~0.5s at startup and only this view needs it
+        import stripe
         
         intent = stripe.PaymentIntent.create(
             amount=amount,
             currency='usd',
-            metadata={'member_id': member.id}
+            metadata={'member_id': member.id},
+            api_key=settings.STRIPE_SECRET_KEY
         )
         
         return JsonResponse({'client_secret': intent.client_secret})
@@ -355,27 +665,35 @@ def payment_success(request):
     try:
         data = json.loads(request.body)
         payment_intent_id = data.get('payment_intent_id')
-        amount = data.get('amount', 0)
+        # Client-reported; manage.py reconcile_payments checks it against the gateway
+        amount = Decimal(str(data.get('amount', 0)))
         
         member = Member.objects.get(user=request.user)
         
-        # Create payment record
-        payment = Payment.objects.create(
-            member=member,
-            amount=amount,
-            payment_method='stripe',
-            status='completed',
-            stripe_payment_intent_id=payment_intent_id,
-            description='Online payment for library fines'
-        )
-        
-        # Update fines status (simplified - in real app, match specific fines)
-        pending_fines = Fine.objects.filter(borrow__member=member, status='pending')
-        total_fine_amount = pending_fines.aggregate(total=Sum('amount'))['total'] or 0
-        
-        if total_fine_amount <= amount:
-            pending_fines.update(status='paid', payment_date=timezone.now())
-            payment.fines.set(pending_fines)
+        with transaction.atomic():
+            # Create payment record
+            payment = Payment.objects.create(
+                member=member,
+                amount=amount,
+                payment_method='stripe',
+                status='completed',
+                stripe_payment_intent_id=payment_intent_id,
+                description='Online payment for library fines'
+            )
+            
+            # Update fines status (simplified - in real app, match specific fines)
+            # Evaluated once: after the update the pending filter would match nothing to link
+            pending_fines = list(Fine.objects.filter(borrow__member=member, status='pending'))
+            total_fine_amount = sum(fine.amount for fine in pending_fines)
+            
+            if total_fine_amount <= amount:
+                Fine.objects.filter(pk__in=[fine.pk for fine in pending_fines]).update(
+                    status='paid', payment_date=timezone.now()
+                )
+                payment.fines.set(pending_fines)
+            
+            # The receipt e-mail goes out from the worker, after commit
+            outbox.enqueue('payment.completed', payment_id=str(payment.payment_id))
         
         messages.success(request, f'Payment of ${amount} processed successfully!')
         return JsonResponse({'success': True})
@@ -414,7 +732,12 @@ def profile(request):
         
         if user_form.is_valid() and member_form.is_valid():
             user_form.save()
-            member_form.save()
+            member = member_form.save(commit=False)
+            if member.pk is None:
+                # First profile after registration; member_id comes from the sequence on save
+                member.user = request.user
+                member.membership_expiry = timezone.now().date() + timedelta(days=settings.MEMBERSHIP_DAYS)
+            member.save()
             messages.success(request, 'Your profile has been updated!')
             return redirect('profile')
     else:
@@ -438,30 +761,50 @@ def add_review(request, book_id):
     try:
         member = Member.objects.get(user=request.user)
     except Member.DoesNotExist:
-        messages.error(request, 'You must be a library member to add reviews.')
-        return redirect('book_detail', book_id=book_id)
+        return _action_error(request, 'You must be a library member to add reviews.',
+                             'book_detail', status=403, book_id=book_id)
     
     # Check if already reviewed
-    existing_review = Review.objects.filter(book=book, member=member).first()
-    if existing_review:
-        messages.error(request, 'You have already reviewed this book.')
-        return redirect('book_detail', book_id=book_id)
-    
-    rating = request.POST.get('rating')
-    comment = request.POST.get('comment')
-    
-    if rating and comment:
-        Review.objects.create(
-            book=book,
-            member=member,
-            rating=int(rating),
-            comment=comment
-        )
-        messages.success(request, 'Your review has been added!')
+    if Review.objects.filter(book=book, member=member).exists():
+        return _action_error(request, 'You have already reviewed this book.',
+                             'book_detail', status=409, book_id=book_id)
+    
+    if request.content_type == 'application/json':
+        data = _json_body(request)
     else:
-        messages.error(request, 'Please provide both rating and comment.')
+        data = request.POST
+    rating = data.get('rating')
+    comment = data.get('comment')
+    
+    try:
+        rating = int(rating)
+    except (TypeError, ValueError):
+        rating = None
+    
+    if not (rating and comment):
+        return _action_error(request, 'Please provide both rating and comment.',
+                             'book_detail', book_id=book_id)
+    
+    if not 1 <= rating <= 5:
+        return _action_error(request, 'Rating must be between 1 and 5.',
+                             'book_detail', book_id=book_id)
     
-    return redirect('book_detail', book_id=book_id)
+    review = Review.objects.create(
+        book=book,
+        member=member,
+        rating=rating,
+        comment=comment
+    )
+    
+    stats = book.reviews.aggregate(avg_rating=Avg('rating'), review_count=Count('id'))
+    payload = {
+        'review_id': review.id,
+        'avg_rating': round(stats['avg_rating'] or 0, 2),
+        'review_count': stats['review_count'],
+    }
+    return _action_success(
+        request, 'Your review has been added!', payload, 'book_detail', book_id=book_id
+    )
 
 
 def contact(request):
@@ -0,0 +1,61 @@
+"""
+Template warm-up at worker boot.
+
+With the cached loader, the first request in each process to render a
+template pays for reading and compiling it, and everything it extends or
+includes. `warm_templates()` does that up front. wsgi.py and asgi.py call it
+after loading the app, so with gunicorn's preload_app it runs once in the
+master and every forked worker starts with the templates compiled.
+"""
+import logging
+
+from django.conf import settings
+from django.contrib.auth.forms import UserCreationForm
+from django.template import TemplateDoesNotExist
+from django.template.loader import get_template
+from django.template.loader_tags import ExtendsNode, IncludeNode
+
+from .forms import MemberUpdateForm, UserUpdateForm
+
+logger = logging.getLogger(__name__)
+
+HOT_TEMPLATES = [
+    'library/home.html',
+    'library/book_catalog.html',
+    'library/book_detail.html',
+    'library/register.html',
+    'library/profile.html',
+    'library/login.html',
+]
+
+
+def _referenced(template):
+    """Names of templates that `template` extends or includes by a constant name"""
+    for node in template.nodelist.get_nodes_by_type((ExtendsNode, IncludeNode)):
+        name = node.parent_name if isinstance(node, ExtendsNode) else node.template
+        if not name.is_var and not name.filters:
+            yield name.var
+
+
+def warm_templates(names=HOT_TEMPLATES):
+    """Compile `names` and their parents and includes into the cached loader; returns what was loaded"""
+    if not settings.TEMPLATE_CACHE:
+        return []
+    loaded, pending = [], list(names)
+    while pending:
+        name = pending.pop()
+        if name in loaded:
+            continue
+        try:
+            template = get_template(name)
+        except TemplateDoesNotExist:
+            logger.debug('Template %s not found; not warmed', name)
+            continue
+        loaded.append(name)
+        pending.extend(_referenced(template.template))
+
+    # Widgets are rendered through the form renderer's own engine and cache
+    for form in (UserCreationForm(), UserUpdateForm(), MemberUpdateForm()):
+        for field in form:
+            str(field)
+    return loaded
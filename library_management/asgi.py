@@ -9,3 +9,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'library_management.settings')
 
 application = get_asgi_application()
+
+# Compile the hot templates now rather than on each worker's first requests
+from library.warmup import warm_templates  # noqa: E402
+
+warm_templates()
@@ -47,15 +47,24 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    # After authentication: staff-requested profiles need request.user
+    'library.profiling.SamplingProfilerMiddleware',
 ]
 
 ROOT_URLCONF = 'library_management.urls'
 
+# Compiled templates are kept per process by the cached loader and warmed at
+# boot by wsgi.py/asgi.py (library.warmup); turn off only to debug template loading
+TEMPLATE_CACHE = config('TEMPLATE_CACHE', default=True, cast=bool)
+TEMPLATE_LOADERS = [
+    'django.template.loaders.filesystem.Loader',
+    'django.template.loaders.app_directories.Loader',
+]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [BASE_DIR / 'templates'],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.debug',
@@ -63,6 +72,9 @@ TEMPLATES = [
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            'loaders': [
+                ('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)
+            ] if TEMPLATE_CACHE else TEMPLATE_LOADERS,
         },
     },
 ]
@@ -117,6 +129,25 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
 
+# Cache: local memory by default; set REDIS_URL to share it (and rate limits) across workers
+REDIS_URL = config('REDIS_URL', default='')
+if REDIS_URL:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': REDIS_URL}}
+else:
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# Sessions: with a shared cache, cached_db serves reads from it and only writes
+# through to the database on change. A per-process cache would let workers keep
+# serving a session another worker has logged out, so without REDIS_URL the
+# default is plain db. signed_cookies needs no server-side storage at all
+# (run `manage.py cleanup_sessions` periodically for the database-backed ones)
+SESSION_ENGINE = config('SESSION_ENGINE', default='') or (
+    'django.contrib.sessions.backends.cached_db' if REDIS_URL else 'django.contrib.sessions.backends.db'
+)
+
+# Flash messages ride in a cookie instead of costing a session write
+MESSAGE_STORAGE = config('MESSAGE_STORAGE', default='django.contrib.messages.storage.cookie.CookieStorage')
+
 # Messages
 from django.contrib.messages import constants as messages
 MESSAGE_TAGS = {
@@ -130,3 +161,47 @@ MESSAGE_TAGS = {
 # Stripe Configuration
 STRIPE_PUBLISHABLE_KEY = config('STRIPE_PUBLISHABLE_KEY', default='pk_test_your_publishable_key')
 STRIPE_SECRET_KEY = config('STRIPE_SECRET_KEY', default='sk_test_your_secret_key')
+
+# Daily late fine when no FinePolicy matches (library.fines)
+FINE_DAILY_RATE = config('FINE_DAILY_RATE', default='2.00')
+
+# Length of a new membership, for profiles created at sign-up and by manage.py import_members
+MEMBERSHIP_DAYS = config('MEMBERSHIP_DAYS', default=365, cast=int)
+
+# Availability feed (library.feed): rows changed this recently are held back
+# until the transactions that wrote them have surely committed
+FEED_SETTLE_SECONDS = config('FEED_SETTLE_SECONDS', default=10, cast=int)
+
+# Seconds shared caches may keep anonymous catalog/detail pages
+PUBLIC_PAGE_MAX_AGE = config('PUBLIC_PAGE_MAX_AGE', default=60, cast=int)
+
+# Email
+EMAIL_BACKEND = config('EMAIL_BACKEND', default='django.core.mail.backends.console.EmailBackend')
+EMAIL_HOST = config('EMAIL_HOST', default='localhost')
+EMAIL_PORT = config('EMAIL_PORT', default=25, cast=int)
+EMAIL_HOST_USER = config('EMAIL_HOST_USER', default='')
+EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD', default='')
+EMAIL_USE_TLS = config('EMAIL_USE_TLS', default=False, cast=bool)
+DEFAULT_FROM_EMAIL = config('DEFAULT_FROM_EMAIL', default='library@localhost')
+
+# Reminders (manage.py send_reminders)
+REMINDER_DUE_SOON_DAYS = config('REMINDER_DUE_SOON_DAYS', default=3, cast=int)
+REMINDER_BATCH_SIZE = config('REMINDER_BATCH_SIZE', default=500, cast=int)
+
+# Archival (manage.py archive_history)
+ARCHIVE_RETENTION_DAYS = config('ARCHIVE_RETENTION_DAYS', default=365, cast=int)
+
+# Request profiling (library.profiling); staff browse results at /staff/profiles/
+PROFILER_SAMPLE_RATE = config('PROFILER_SAMPLE_RATE', default=0.0, cast=float)
+PROFILER_HEADER = config('PROFILER_HEADER', default='X-Profile')
+PROFILER_INTERVAL = config('PROFILER_INTERVAL', default=0.005, cast=float)
+PROFILER_DIR = config('PROFILER_DIR', default=str(BASE_DIR / 'profiles'))
+PROFILER_KEEP = config('PROFILER_KEEP', default=20, cast=int)
+
+# Rate limiting (library.ratelimit); limits themselves are declared in library/urls.py.
+# Counters live in RATELIMIT_CACHE: without REDIS_URL that is per-process, so
+# each gunicorn worker counts separately and the real limit is workers x limit
+RATELIMIT_ENABLE = config('RATELIMIT_ENABLE', default=True, cast=bool)
+RATELIMIT_CACHE = 'default'
+# Request header holding the client IP; HTTP_X_FORWARDED_FOR behind a trusted proxy
+RATELIMIT_IP_HEADER = config('RATELIMIT_IP_HEADER', default='REMOTE_ADDR')
@@ -21,4 +21,4 @@ EOF
 
 # Start Gunicorn
 echo "Starting Gunicorn..."
-gunicorn --config gunicorn.conf.py library_management.wsgi:application
+gunicorn --config gunicorn.conf.py